@@ -0,0 +1,60 @@
+"""Compare the encode and decode throughput of the Herald codecs on realistic event payloads.
+
+Run it with: ::
+
+    python -m benchmarks.herald_codecs
+
+"""
+from typing import *
+import json
+import timeit
+import click
+import royalnet.herald as rh
+from royalnet.herald.codecs import Codec, JSONCodec, available_codecs, orjson
+from .payloads import payloads, package
+
+
+class StdlibJSONCodec(JSONCodec):
+    """The JSON encoding used by :meth:`rh.Package.to_json_bytes` before codecs were introduced."""
+    name = "json (stdlib)"
+
+    def dumps(self, obj: Any) -> bytes:
+        return bytes(json.dumps(obj), encoding="utf8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(str(data, encoding="utf8"))
+
+
+def measure(codec: Codec, pkg: rh.Package, number: int) -> Tuple[float, float, int]:
+    """Return the encodes per second, the decodes per second and the size of the encoded package."""
+    encoded = pkg.to_bytes(codec)
+    assert rh.Package.from_bytes(encoded, codec) == pkg
+    encode_time = timeit.timeit(lambda: pkg.to_bytes(codec), number=number)
+    decode_time = timeit.timeit(lambda: rh.Package.from_bytes(encoded, codec), number=number)
+    return number / encode_time, number / decode_time, len(encoded)
+
+
+@click.command()
+@click.option("-n", "--number", default=2000, help="The number of times each package should be encoded and decoded.")
+@click.option("--compact-ids/--uuid-ids", default=False, help="Use the ids of links with compact_ids enabled.")
+def run(number: int, compact_ids: bool):
+    codecs: List[Codec] = [StdlibJSONCodec(), *available_codecs.values()]
+    print(f"{'payload':<20} {'codec':<16} {'encode/s':>12} {'decode/s':>12} {'bytes':>10}")
+    for name, payload in payloads.items():
+        pkg = package(payload(), compact_ids=compact_ids)
+        for codec in codecs:
+            label = codec.name
+            if isinstance(codec, JSONCodec) and not isinstance(codec, StdlibJSONCodec):
+                label = "json (orjson)" if orjson is not None else "json"
+            encodes, decodes, size = measure(codec, pkg, number)
+            print(f"{name:<20} {label:<16} {encodes:>12.0f} {decodes:>12.0f} {size:>10}")
+    # The smallest packages are the ones most affected by the size of the envelope
+    print()
+    print(f"{'empty package':<20} {'codec':<16} {'encode/s':>12} {'decode/s':>12} {'bytes':>10}")
+    for codec in codecs:
+        encodes, decodes, size = measure(codec, package({}, compact_ids=compact_ids), number)
+        print(f"{'':<20} {codec.name:<16} {encodes:>12.0f} {decodes:>12.0f} {size:>10}")
+
+
+if __name__ == "__main__":
+    run()
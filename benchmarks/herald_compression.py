@@ -0,0 +1,70 @@
+"""Compare the CPU time spent compressing Herald messages with the bandwidth it saves, for messages of different sizes.
+
+For every size, it measures the compression ratio and the compression and decompression throughput of every available
+:class:`Compressor`, and of the DEFLATE settings used by the websocket ``permessage-deflate`` extension, which
+compresses every message regardless of its size.
+
+Run it with: ::
+
+    python -m benchmarks.herald_compression
+
+"""
+from typing import *
+import timeit
+import zlib
+import click
+from royalnet.herald.codecs import available_codecs
+from royalnet.herald.compression import Compressor, available_compressors
+from .payloads import ytdl_info, summon_request, package
+
+
+class PermessageDeflate(Compressor):
+    """The DEFLATE settings that :mod:`websockets` uses by default for ``permessage-deflate``.
+
+    It isn't a real :class:`Compressor`: the extension keeps the compression context between messages, while this
+    starts from scratch every time, so it slightly overestimates the size of repetitive messages."""
+
+    name = "permessage-deflate"
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(wbits=-15, memLevel=8)
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompressobj(wbits=-15).decompress(data)
+
+
+def messages(codec_name: str) -> List[Tuple[str, bytes]]:
+    codec = available_codecs[codec_name]
+    result = [("summon request", package(summon_request(), compact_ids=True).to_bytes(codec))]
+    for size in (10, 100, 1000):
+        result.append((f"{size} songs", package({"songs": [ytdl_info(index) for index in range(size)]},
+                                                compact_ids=True).to_bytes(codec)))
+    return result
+
+
+@click.command()
+@click.option("-c", "--codec", default="json", help="The codec used to encode the messages.")
+@click.option("-t", "--time", "duration", default=0.2, help="The minimum seconds to spend on each measurement.")
+def run(codec: str, duration: float):
+    compressors = [*available_compressors.values(), PermessageDeflate()]
+    print(f"{'message':<16} {'algorithm':<20} {'bytes':>10} {'ratio':>7} {'comp MB/s':>10} {'decomp MB/s':>12}"
+          f" {'comp µs':>10}")
+    for name, message in messages(codec):
+        print(f"{name:<16} {'none':<20} {len(message):>10} {1:>7.2f}")
+        for compressor in compressors:
+            compressed = compressor.compress(message)
+            number, elapsed = timeit.Timer(lambda: compressor.compress(message)).autorange()
+            while elapsed < duration:
+                number *= 2
+                elapsed = timeit.timeit(lambda: compressor.compress(message), number=number)
+            compress_time = elapsed / number
+            number, elapsed = timeit.Timer(lambda: compressor.decompress(compressed)).autorange()
+            decompress_time = elapsed / number
+            print(f"{'':<16} {compressor.name:<20} {len(compressed):>10} {len(message) / len(compressed):>7.2f}"
+                  f" {len(message) / compress_time / 1e6:>10.1f} {len(message) / decompress_time / 1e6:>12.1f}"
+                  f" {compress_time * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    run()
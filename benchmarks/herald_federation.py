@@ -0,0 +1,67 @@
+"""Start a chain of peered Herald servers on localhost, check that every link can reach every other link, and measure
+how the request latency grows with the number of servers a request has to pass through.
+
+Run it with: ::
+
+    python -m benchmarks.herald_federation --servers 4
+
+"""
+from typing import *
+import asyncio as aio
+import statistics
+import time
+import click
+import royalnet.herald as rh
+
+
+async def main(servers: int, requests: int, port: int):
+    loop = aio.get_event_loop()
+    # Every server is peered only with the previous one: A <- B <- C <- ...
+    configs = [rh.Config(name="<server>", address="127.0.0.1", port=port + n, secret="benchmark",
+                         node_name=f"server{n}", peers=[f"ws://127.0.0.1:{port + n - 1}/"] if n else None)
+               for n in range(servers)]
+    for config in configs:
+        await rh.Server(config, loop=loop).run()
+
+    async def handler(message):
+        if isinstance(message, rh.Request):
+            return rh.ResponseSuccess(message.data)
+
+    links = [rh.Link(config.copy(name=f"link{n}"), handler, loop=loop) for n, config in enumerate(configs)]
+    tasks = [loop.create_task(link.run()) for link in links]
+    for link in links:
+        await link.identify_event.wait()
+    # Wait for the joins to be announced along the whole chain
+    await aio.sleep(1)
+
+    print(f"{'hops':>4} {'mean ms':>10} {'p99 ms':>10}")
+    for n in range(servers):
+        latencies = []
+        for i in range(requests):
+            start = time.perf_counter()
+            response = await links[0].request(f"link{n}", rh.Request("benchmark", {"i": i}), timeout=5.0)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert isinstance(response, rh.ResponseSuccess), response
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{n:>4} {statistics.mean(latencies):>10.3f} {p99:>10.3f}")
+
+    # Every link must also be able to reach every other link in the opposite direction
+    for source in links:
+        for n in range(servers):
+            await source.request(f"link{n}", rh.Request("check", {}), timeout=5.0)
+    print("All links can reach each other.")
+    for task in tasks:
+        task.cancel()
+
+
+@click.command()
+@click.option("-s", "--servers", default=4, help="The number of servers in the chain.")
+@click.option("-n", "--requests", default=500, help="The number of requests to send for each number of hops.")
+@click.option("--port", default=44450, help="The port of the first server; the next ones use the following ports.")
+def run(servers: int, requests: int, port: int):
+    aio.get_event_loop().run_until_complete(main(servers, requests, port))
+
+
+if __name__ == "__main__":
+    run()
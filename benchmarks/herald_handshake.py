@@ -0,0 +1,86 @@
+"""Measure the cost of the Herald handshake when many links reconnect at the same time.
+
+Every link repeatedly connects to the server, identifies itself and disconnects, with:
+
+- ``plaintext``: no TLS, the secret is sent as it is;
+- ``hmac``: no TLS, challenge-response identification;
+- ``tls-fresh``: TLS, with a new :class:`ssl.SSLContext` for every connection, as if the certificate authorities were
+  loaded again at every reconnection;
+- ``tls``: TLS, reusing the same :class:`ssl.SSLContext` for every connection.
+
+A self-signed certificate is generated with the ``openssl`` command line tool.
+
+Run it with: ::
+
+    python -m benchmarks.herald_handshake --links 50 --reconnects 10
+
+"""
+from typing import *
+import asyncio as aio
+import os
+import subprocess
+import tempfile
+import time
+import click
+import royalnet.herald as rh
+
+
+def make_certificate(directory: str) -> Tuple[str, str]:
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", keyfile, "-out", certfile, "-subj", "/CN=localhost"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+async def storm(config: rh.Config, links: int, reconnects: int, fresh_context: bool) -> float:
+    """Reconnect many links at the same time, and return the mean seconds taken by a handshake."""
+    async def handler(message):
+        pass
+
+    async def reconnect(link: rh.Link) -> None:
+        for _ in range(reconnects):
+            if fresh_context:
+                link.config._client_ssl_context = None
+            await link.connect()
+            await link.identify()
+            await link.websocket.close()
+            link._connection_lost()
+
+    start = time.perf_counter()
+    await aio.gather(*[reconnect(rh.Link(config.copy(name=f"link{n}"), handler)) for n in range(links)])
+    return (time.perf_counter() - start) / (links * reconnects)
+
+
+async def main(links: int, reconnects: int, port: int):
+    loop = aio.get_event_loop()
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_certificate(directory)
+        plain = rh.Config(name="<server>", address="127.0.0.1", port=port, secret="benchmark", auth="plaintext")
+        secure = rh.Config(name="<server>", address="127.0.0.1", port=port + 1, secret="benchmark", secure=True,
+                           certfile=certfile, keyfile=keyfile, cafile=certfile, tls_hostname="localhost")
+        await rh.Server(plain, loop=loop).run()
+        await rh.Server(secure, loop=loop).run()
+        modes = [
+            ("plaintext", plain, False),
+            ("hmac", plain.copy(auth="hmac"), False),
+            ("tls-fresh", secure, True),
+            ("tls", secure, False),
+        ]
+        print(f"{'mode':<12} {'ms/handshake':>14} {'handshakes/s':>14}")
+        for name, config, fresh_context in modes:
+            elapsed = await storm(config, links, reconnects, fresh_context)
+            print(f"{name:<12} {elapsed * 1000:>14.3f} {1 / elapsed:>14.0f}")
+
+
+@click.command()
+@click.option("-l", "--links", default=50, help="The number of links reconnecting at the same time.")
+@click.option("-r", "--reconnects", default=10, help="The number of times every link reconnects.")
+@click.option("--port", default=44470, help="The port of the first Herald server; the second one uses the next.")
+def run(links: int, reconnects: int, port: int):
+    aio.get_event_loop().run_until_complete(main(links, reconnects, port))
+
+
+if __name__ == "__main__":
+    run()
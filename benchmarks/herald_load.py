@@ -0,0 +1,225 @@
+"""Load test a Herald server with many links sending a configurable mix of traffic.
+
+The server runs in its own process, while the links are split between one or more client processes.
+Every link repeatedly sends one of these, chosen randomly according to the ``--mix`` weights:
+
+- ``request``: a request to a random link, waiting for its response;
+- ``unicast``: a broadcast to a single random link;
+- ``broadcast``: a broadcast to all links.
+
+The random choices are seeded, so that two runs with the same options send the same traffic.
+
+Run it with: ::
+
+    python -m benchmarks.herald_load --links 32 --mix 7:2:1 --duration 10
+
+"""
+from typing import *
+import asyncio as aio
+import multiprocessing
+import resource
+import random
+import json
+import time
+import platform
+import click
+import royalnet.herald as rh
+
+
+operations = ("request", "unicast", "broadcast")
+
+
+def usage() -> Dict[str, float]:
+    """Return the CPU time and the peak RSS of the current process."""
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux
+    return {"cpu": rusage.ru_utime + rusage.ru_stime, "rss": rusage.ru_maxrss / 1024}
+
+
+def run_server(config: rh.Config, measure_start, measure_end, results):
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+    server = rh.Server(config, loop=loop)
+    loop.run_until_complete(server.run())
+    loop.run_until_complete(loop.run_in_executor(None, measure_start.wait))
+    start = usage()
+    loop.run_until_complete(loop.run_in_executor(None, measure_end.wait))
+    end = usage()
+    results.put({"cpu": end["cpu"] - start["cpu"], "rss": end["rss"]})
+
+
+def run_client(config: rh.Config, first: int, count: int, total: int, options: Dict[str, Any],
+               barrier, measure_start, measure_end, results):
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+    request_latencies: List[float] = []
+    delivery_latencies: List[float] = []
+    sent = {operation: 0 for operation in operations}
+    failed = 0
+    measuring = False
+
+    async def handler(message):
+        if isinstance(message, rh.Request):
+            return rh.ResponseSuccess(message.data)
+        # time.monotonic is system-wide on Linux, so it can be compared between processes
+        if measuring:
+            delivery_latencies.append(time.monotonic() - message.data["sent"])
+
+    async def worker(link: rh.Link, rng: random.Random, deadline: float):
+        nonlocal failed
+        while time.monotonic() < deadline:
+            operation = rng.choices(operations, weights=options["mix"])[0]
+            destination = f"load{rng.randrange(total)}"
+            payload = {"sent": time.monotonic(), "padding": "x" * options["payload"]}
+            try:
+                if operation == "request":
+                    start = time.monotonic()
+                    await link.request(destination, rh.Request("load", payload), timeout=options["timeout"])
+                    if measuring:
+                        request_latencies.append(time.monotonic() - start)
+                elif operation == "unicast":
+                    await link.broadcast(destination, rh.Broadcast("load", payload))
+                else:
+                    await link.broadcast("*", rh.Broadcast("load", payload))
+            except rh.RequestTimeoutError:
+                failed += 1
+                continue
+            if measuring:
+                sent[operation] += 1
+
+    async def main():
+        nonlocal measuring
+        links = [rh.Link(config.copy(name=f"load{first + i}"), handler, loop=loop) for i in range(count)]
+        tasks = [loop.create_task(link.run()) for link in links]
+        for link in links:
+            await link.identify_event.wait()
+        await loop.run_in_executor(None, barrier.wait)
+        start = time.monotonic()
+        deadline = start + options["warmup"] + options["duration"]
+        workers = [loop.create_task(worker(link, random.Random(f"{options['seed']}:{first + i}:{n}"), deadline))
+                   for i, link in enumerate(links) for n in range(options["concurrency"])]
+        await aio.sleep(options["warmup"])
+        measuring = True
+        if first == 0:
+            measure_start.set()
+        before = usage()
+        await aio.gather(*workers)
+        measuring = False
+        after = usage()
+        if first == 0:
+            measure_end.set()
+        # Wait for the packages still travelling before disconnecting
+        await aio.sleep(0.5)
+        for task in tasks:
+            task.cancel()
+        results.put({"requests": request_latencies, "deliveries": delivery_latencies, "sent": sent, "failed": failed,
+                     "cpu": after["cpu"] - before["cpu"], "rss": after["rss"]})
+
+    loop.run_until_complete(main())
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def load_test(options: Dict[str, Any]) -> Dict[str, Any]:
+    config = rh.Config(name="<server>", address="127.0.0.1", port=options["port"], secret="benchmark",
+                       codecs=options["codecs"], batch=options["batch"])
+    # The first client process tells the server when the measurement starts and ends
+    measure_start = multiprocessing.Event()
+    measure_end = multiprocessing.Event()
+    server_results = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server, args=(config, measure_start, measure_end, server_results),
+                                     daemon=True)
+    server.start()
+    time.sleep(1)
+    processes = options["processes"]
+    links = options["links"]
+    barrier = multiprocessing.Barrier(processes)
+    client_results = multiprocessing.Queue()
+    clients = []
+    for process in range(processes):
+        first = links * process // processes
+        count = links * (process + 1) // processes - first
+        clients.append(multiprocessing.Process(target=run_client,
+                                               args=(config, first, count, links, options, barrier,
+                                                     measure_start, measure_end, client_results),
+                                               daemon=True))
+    for client in clients:
+        client.start()
+    parts = [client_results.get() for _ in clients]
+    for client in clients:
+        client.join()
+    server_usage = server_results.get()
+    server.join()
+
+    duration = options["duration"]
+    requests = [latency for part in parts for latency in part["requests"]]
+    deliveries = [latency for part in parts for latency in part["deliveries"]]
+    sent = {operation: sum(part["sent"][operation] for part in parts) for operation in operations}
+    return {
+        "options": options,
+        "python": platform.python_version(),
+        "operations_per_second": sum(sent.values()) / duration,
+        "sent": sent,
+        "failed": sum(part["failed"] for part in parts),
+        # Every request is routed twice (request and response), the other operations once per receiving link
+        "packages_per_second": (2 * len(requests) + len(deliveries)) / duration,
+        "request_latency_ms": {"p50": percentile(requests, 0.5) * 1000, "p99": percentile(requests, 0.99) * 1000},
+        "delivery_latency_ms": {"p50": percentile(deliveries, 0.5) * 1000,
+                                "p99": percentile(deliveries, 0.99) * 1000},
+        "server": {"cpu_percent": server_usage["cpu"] / duration * 100, "rss_mb": server_usage["rss"]},
+        "clients": {"cpu_percent": sum(part["cpu"] for part in parts) / duration * 100,
+                    "rss_mb": max(part["rss"] for part in parts)},
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    options = report["options"]
+    print(f"Herald load test: {options['links']} links in {options['processes']} processes, "
+          f"mix {':'.join(f'{weight:g}' for weight in options['mix'])} (request:unicast:broadcast), "
+          f"concurrency {options['concurrency']}, seed {options['seed']}")
+    print(f"{'operations/s':<24} {report['operations_per_second']:>12.0f}")
+    print(f"{'packages routed/s':<24} {report['packages_per_second']:>12.0f}")
+    print(f"{'failed requests':<24} {report['failed']:>12}")
+    print(f"{'request p50 / p99 (ms)':<24} {report['request_latency_ms']['p50']:>12.3f}"
+          f" {report['request_latency_ms']['p99']:>10.3f}")
+    print(f"{'delivery p50 / p99 (ms)':<24} {report['delivery_latency_ms']['p50']:>12.3f}"
+          f" {report['delivery_latency_ms']['p99']:>10.3f}")
+    print(f"{'server CPU % / RSS (MB)':<24} {report['server']['cpu_percent']:>12.1f}"
+          f" {report['server']['rss_mb']:>10.1f}")
+    print(f"{'clients CPU % / RSS (MB)':<24} {report['clients']['cpu_percent']:>12.1f}"
+          f" {report['clients']['rss_mb']:>10.1f}")
+
+
+@click.command()
+@click.option("-l", "--links", default=16, help="The number of links to connect to the server.")
+@click.option("-p", "--processes", default=1, help="The number of processes to split the links between.")
+@click.option("-m", "--mix", default="7:2:1", help="The weights of requests, unicasts and broadcasts.")
+@click.option("-c", "--concurrency", default=1, help="The number of operations each link sends at the same time.")
+@click.option("-d", "--duration", default=10.0, help="The number of seconds to measure for.")
+@click.option("-w", "--warmup", default=1.0, help="The number of seconds to send traffic for before measuring.")
+@click.option("--payload", default=64, help="The number of padding bytes added to every package.")
+@click.option("--seed", default=0, help="The seed of the random traffic.")
+@click.option("--codec", "codecs", multiple=True, help="The codecs the server should allow; all if not specified.")
+@click.option("--batch/--no-batch", default=True, help="Allow the server to batch packages.")
+@click.option("--timeout", default=10.0, help="The number of seconds after which a request is considered failed.")
+@click.option("--port", default=44460, help="The port the benchmark server should listen on.")
+@click.option("--json", "as_json", is_flag=True, help="Print the results as JSON, to compare them between runs.")
+def run(as_json: bool, mix: str, codecs: Tuple[str], **options):
+    options["mix"] = [float(weight) for weight in mix.split(":")]
+    if len(options["mix"]) != len(operations):
+        raise click.BadParameter("The mix must contain three weights", param_hint="--mix")
+    options["codecs"] = list(codecs) if codecs else None
+    report = load_test(options)
+    if as_json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,42 @@
+"""Measure how the cost of routing a package in the Herald server grows with the size of its data.
+
+For every codec, it times what the server does with every received package: decoding it and encoding it again for its
+destination. Framed codecs should take about the same time regardless of the size of the data.
+
+Run it with: ::
+
+    python -m benchmarks.herald_passthrough
+
+"""
+from typing import *
+import timeit
+import uuid
+import click
+import royalnet.herald as rh
+from royalnet.herald.codecs import available_codecs
+from .payloads import ytdl_info, package
+
+
+def route(data: bytes, codec: rh.Codec, destination: str) -> List[bytes]:
+    """Do what the server does with a received message containing a single package."""
+    received = rh.Package.from_bytes_multi(data, codec)[0]
+    return received.to_bytes_multi([destination], codec)
+
+
+@click.command()
+@click.option("-n", "--number", default=500, help="The number of times each package should be routed.")
+def run(number: int):
+    destination = str(uuid.uuid4())
+    sizes = [0, 10, 100, 1000]
+    print(f"{'codec':<16} {'songs':>6} {'bytes':>10} {'routes/s':>12} {'MB/s':>10}")
+    for codec in available_codecs.values():
+        for size in sizes:
+            pkg = package({"songs": [ytdl_info(index) for index in range(size)]})
+            data = pkg.to_bytes(codec)
+            elapsed = timeit.timeit(lambda: route(data, codec, destination), number=number)
+            print(f"{codec.name:<16} {size:>6} {len(data):>10} {number / elapsed:>12.0f}"
+                  f" {len(data) * number / elapsed / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    run()
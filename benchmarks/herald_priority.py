@@ -0,0 +1,129 @@
+"""Measure the latency of Herald requests while another service is flooding the same destination with broadcasts.
+
+The server and the ``bulk`` link run in their own processes: the ``bulk`` link sends broadcasts to ``discord`` at a
+fixed rate, while the ``telegram`` link sends a request to ``discord`` every few milliseconds, as users would.
+``discord`` takes some milliseconds to handle every package, as if it was querying a database, so when the broadcasts
+arrive faster than they can be handled they wait for a free handler slot:
+
+- ``idle``: no broadcasts are being sent;
+- ``fifo``: the broadcasts have the same priority as the requests, and everything is handled in order;
+- ``lanes``: the broadcasts are sent with :data:`royalnet.herald.PRIORITY_BULK`.
+
+Run it with: ::
+
+    python -m benchmarks.herald_priority --duration 5 --rate 2000 --handler-ms 20
+
+"""
+from typing import *
+import asyncio as aio
+import multiprocessing
+import statistics
+import time
+import click
+import royalnet.herald as rh
+from .payloads import summon_request, user_list_response
+
+
+async def handler(message):
+    if isinstance(message, rh.Request):
+        return rh.ResponseSuccess(message.data)
+
+
+def slow_handler(delay: float):
+    async def handler(message):
+        await aio.sleep(delay)
+        if isinstance(message, rh.Request):
+            return rh.ResponseSuccess(message.data)
+
+    return handler
+
+
+def run_server(config: rh.Config):
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+    loop.run_until_complete(rh.Server(config, loop=loop).run())
+    loop.run_forever()
+
+
+def run_bulk(config: rh.Config, priority: int, rate: int):
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+
+    async def main():
+        link = rh.Link(config.copy(name="bulk"), handler, loop=loop)
+        loop.create_task(link.run())
+        await link.identify_event.wait()
+        broadcast = rh.Broadcast("users", user_list_response(10))
+        # Send the broadcasts in small bursts every 10 milliseconds
+        while True:
+            start = loop.time()
+            for _ in range(rate // 100):
+                await link.broadcast("discord", broadcast, priority=priority)
+            await aio.sleep(max(0.0, 0.01 - (loop.time() - start)))
+
+    loop.run_until_complete(main())
+
+
+async def measure(config: rh.Config, duration: float, interval: float, delay: float) -> List[float]:
+    loop = aio.get_event_loop()
+    links = [rh.Link(config.copy(name="telegram"), handler, loop=loop),
+             rh.Link(config.copy(name="discord"), slow_handler(delay), loop=loop)]
+    tasks = [loop.create_task(link.run()) for link in links]
+    for link in links:
+        await link.identify_event.wait()
+    request = rh.Request.from_dict(summon_request())
+
+    async def timed() -> float:
+        start = time.perf_counter()
+        await links[0].request("discord", request, timeout=None)
+        return (time.perf_counter() - start) * 1000
+
+    requests = []
+    deadline = loop.time() + duration
+    while loop.time() < deadline:
+        requests.append(loop.create_task(timed()))
+        await aio.sleep(interval)
+    latencies = await aio.gather(*requests)
+    for task in tasks:
+        task.cancel()
+    return latencies
+
+
+def main(duration: float, rate: int, interval: float, delay: float, port: int):
+    modes = [
+        ("idle", None),
+        ("fifo", rh.PRIORITY_INTERACTIVE),
+        ("lanes", rh.PRIORITY_BULK),
+    ]
+    # Don't fork the event loop of this process, which is still running the links of the previous modes
+    context = multiprocessing.get_context("spawn")
+    print(f"{'mode':<8} {'requests':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for offset, (name, priority) in enumerate(modes):
+        config = rh.Config(name="<server>", address="127.0.0.1", port=port + offset, secret="benchmark")
+        processes = [context.Process(target=run_server, args=(config,), daemon=True)]
+        if priority is not None:
+            processes.append(context.Process(target=run_bulk, args=(config, priority, rate), daemon=True))
+        processes[0].start()
+        time.sleep(1)
+        for process in processes[1:]:
+            process.start()
+        latencies = sorted(aio.get_event_loop().run_until_complete(measure(config, duration, interval, delay)))
+        for process in processes:
+            process.terminate()
+        print(f"{name:<8} {len(latencies):>10} {statistics.mean(latencies):>10.3f}"
+              f" {latencies[len(latencies) // 2]:>10.3f}"
+              f" {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:>10.3f} {latencies[-1]:>10.3f}")
+
+
+@click.command()
+@click.option("-t", "--duration", default=5.0, help="The seconds requests are sent for in every mode.")
+@click.option("-r", "--rate", default=2000, help="The broadcasts sent every second by the bulk link.")
+@click.option("-i", "--interval-ms", default=10.0, help="The milliseconds between two requests.")
+@click.option("-d", "--handler-ms", default=20.0, help="The milliseconds discord takes to handle every package.")
+@click.option("--port", default=44490, help="The port of the first Herald server; the other modes use the next ones.")
+def run(duration: float, rate: int, interval_ms: float, handler_ms: float, port: int):
+    main(duration, rate, interval_ms / 1000, handler_ms / 1000, port)
+
+
+if __name__ == "__main__":
+    run()
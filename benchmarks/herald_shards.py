@@ -0,0 +1,100 @@
+"""Measure how the request throughput of a Herald server scales with the number of shards.
+
+Every client process connects some links to the server; every link sends requests to a link of the next client process,
+so that most requests have to cross the shard bus when the server is sharded.
+
+Run it with: ::
+
+    python -m benchmarks.herald_shards --shards 1 --shards 2 --shards 4
+
+"""
+from typing import *
+import asyncio as aio
+import multiprocessing
+import time
+import click
+import royalnet.herald as rh
+
+
+def run_shard(config: rh.Config, shard: int):
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+    server = rh.Server(config, shard=shard, loop=loop)
+    loop.run_until_complete(server.run())
+    loop.run_forever()
+
+
+def run_client(config: rh.Config, process: int, processes: int, links: int, duration: float, barrier, results):
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+
+    async def handler(message):
+        if isinstance(message, rh.Request):
+            return rh.ResponseSuccess(message.data)
+
+    async def requester(link: rh.Link, destination: str, deadline: float) -> int:
+        completed = 0
+        while time.monotonic() < deadline:
+            try:
+                await link.request(destination, rh.Request("benchmark", {"n": completed}))
+            except rh.RequestTimeoutError:
+                continue
+            completed += 1
+        return completed
+
+    async def main():
+        clients = [rh.Link(config.copy(name=f"bench{process}x{i}"), handler, loop=loop) for i in range(links)]
+        tasks = [loop.create_task(client.run()) for client in clients]
+        for client in clients:
+            await client.identify_event.wait()
+        # Wait for every process to connect and for the joins to be propagated between the shards
+        await loop.run_in_executor(None, barrier.wait)
+        await aio.sleep(1)
+        deadline = time.monotonic() + duration
+        counts = await aio.gather(*[requester(client, f"bench{(process + 1) % processes}x{i}", deadline)
+                                    for i, client in enumerate(clients)])
+        results.put(sum(counts))
+        for task in tasks:
+            task.cancel()
+
+    loop.run_until_complete(main())
+
+
+def measure(shards: int, processes: int, links: int, duration: float, port: int) -> float:
+    config = rh.Config(name="<server>", address="127.0.0.1", port=port, secret="benchmark", shards=shards,
+                       request_timeout=5.0)
+    servers = [multiprocessing.Process(target=run_shard, args=(config, shard), daemon=True) for shard in range(shards)]
+    for server in servers:
+        server.start()
+    time.sleep(1)
+    barrier = multiprocessing.Barrier(processes)
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=run_client,
+                                       args=(config, process, processes, links, duration, barrier, results),
+                                       daemon=True)
+               for process in range(processes)]
+    for client in clients:
+        client.start()
+    total = sum(results.get() for _ in clients)
+    for client in clients:
+        client.join()
+    for server in servers:
+        server.terminate()
+        server.join()
+    return total / duration
+
+
+@click.command()
+@click.option("-s", "--shards", multiple=True, type=int, default=[1, 2, 4], help="The numbers of shards to test.")
+@click.option("-p", "--processes", default=4, help="The number of client processes.")
+@click.option("-l", "--links", default=8, help="The number of links in each client process.")
+@click.option("-d", "--duration", default=5.0, help="The number of seconds each test should last.")
+@click.option("--port", default=44445, help="The port the benchmark server should listen on.")
+def run(shards: List[int], processes: int, links: int, duration: float, port: int):
+    print(f"{'shards':>6} {'requests/s':>12}")
+    for count in shards:
+        print(f"{count:>6} {measure(count, processes, links, duration, port):>12.0f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,92 @@
+"""Compare sending a big result as a single Herald response with streaming it in chunks, with different windows.
+
+For each mode, it measures how long the requester waits for the first song and for the whole result, and the highest
+number of songs that were received but not consumed yet, while the requester spends some time on every song.
+
+Run it with: ::
+
+    python -m benchmarks.herald_stream --songs 2000
+
+"""
+from typing import *
+import asyncio as aio
+import time
+import click
+import royalnet.herald as rh
+from .payloads import ytdl_info
+
+
+async def main(songs: int, chunk_size: int, windows: List[int], work: float, port: int):
+    loop = aio.get_event_loop()
+    config = rh.Config(name="<server>", address="127.0.0.1", port=port, secret="benchmark")
+    await rh.Server(config, loop=loop).run()
+    produced = 0
+
+    async def chunks():
+        nonlocal produced
+        for start in range(0, songs, chunk_size):
+            chunk = [ytdl_info(index) for index in range(start, min(start + chunk_size, songs))]
+            produced += len(chunk)
+            yield rh.ResponseChunk({"songs": chunk})
+
+    async def handler(message):
+        nonlocal produced
+        if message.handler == "whole":
+            produced = songs
+            return rh.ResponseSuccess({"songs": [ytdl_info(index) for index in range(songs)]})
+        return chunks()
+
+    responder = rh.Link(config.copy(name="responder"), handler, loop=loop)
+    requester = rh.Link(config.copy(name="requester"), handler, loop=loop)
+    tasks = [loop.create_task(link.run()) for link in (responder, requester)]
+    for link in (responder, requester):
+        await link.identify_event.wait()
+
+    async def consume(results: AsyncIterator[dict]) -> Tuple[float, float, int]:
+        nonlocal produced
+        produced = 0
+        start = time.perf_counter()
+        first = None
+        consumed = 0
+        max_buffered = 0
+        async for result in results:
+            for _ in result["songs"]:
+                if first is None:
+                    first = time.perf_counter() - start
+                max_buffered = max(max_buffered, produced - consumed)
+                consumed += 1
+                await aio.sleep(work)
+        assert consumed == songs, consumed
+        return first, time.perf_counter() - start, max_buffered
+
+    async def whole():
+        yield (await requester.request("responder", rh.Request("whole", {}), timeout=None)).data
+
+    async def stream(window: int):
+        async for result in await requester.request_stream("responder", rh.Request("stream", {}),
+                                                           window=window, timeout=None):
+            yield result
+
+    print(f"{'mode':<16} {'first ms':>10} {'total ms':>10} {'max buffered songs':>20}")
+    first, total, buffered = await consume(whole())
+    print(f"{'whole':<16} {first * 1000:>10.1f} {total * 1000:>10.1f} {buffered:>20}")
+    for window in windows:
+        first, total, buffered = await consume(stream(window))
+        print(f"{f'window={window}':<16} {first * 1000:>10.1f} {total * 1000:>10.1f} {buffered:>20}")
+    for task in tasks:
+        task.cancel()
+
+
+@click.command()
+@click.option("-s", "--songs", default=2000, help="The number of songs in the result.")
+@click.option("-c", "--chunk-size", default=10, help="The number of songs in every chunk.")
+@click.option("-w", "--window", "windows", default=[1, 4, 16, 64], multiple=True,
+              help="The windows to try; can be repeated.")
+@click.option("--work", default=0.0, help="The seconds the requester spends on every song.")
+@click.option("--port", default=44460, help="The port of the Herald server.")
+def run(songs: int, chunk_size: int, windows: List[int], work: float, port: int):
+    aio.get_event_loop().run_until_complete(main(songs, chunk_size, list(windows), work, port))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+"""Compare the request latency of the Herald transports, with a server and two links running in this process.
+
+For every transport, it sends requests one at a time to measure the latency, then many at the same time to measure the
+throughput.
+
+Run it with: ::
+
+    python -m benchmarks.herald_transports --requests 2000
+
+"""
+from typing import *
+import asyncio as aio
+import os
+import statistics
+import tempfile
+import time
+import click
+import royalnet.herald as rh
+from .payloads import summon_request
+
+
+async def measure(url: str, requests: int, concurrency: int) -> Tuple[List[float], float]:
+    loop = aio.get_event_loop()
+    config = rh.Config(name="<server>", address="127.0.0.1", port=0, secret="benchmark", url=url)
+    await rh.Server(config, loop=loop).run()
+
+    async def handler(message):
+        if isinstance(message, rh.Request):
+            return rh.ResponseSuccess(message.data)
+
+    links = [rh.Link(config.copy(name=name), handler, loop=loop) for name in ("telegram", "discord")]
+    tasks = [loop.create_task(link.run()) for link in links]
+    for link in links:
+        await link.identify_event.wait()
+    request = rh.Request.from_dict(summon_request())
+
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await links[0].request("discord", request)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    async def worker(count: int):
+        for _ in range(count):
+            await links[0].request("discord", request)
+
+    start = time.perf_counter()
+    await aio.gather(*[worker(requests // concurrency) for _ in range(concurrency)])
+    throughput = (requests // concurrency * concurrency) / (time.perf_counter() - start)
+    for task in tasks:
+        task.cancel()
+    return latencies, throughput
+
+
+async def main(requests: int, concurrency: int, port: int):
+    with tempfile.TemporaryDirectory() as directory:
+        urls = [
+            ("memory", "memory://benchmark"),
+            ("ws+unix", f"ws+unix://{os.path.join(directory, 'herald.sock')}"),
+            ("ws", f"ws://127.0.0.1:{port}/"),
+        ]
+        print(f"{'transport':<10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>10}")
+        for name, url in urls:
+            latencies, throughput = await measure(url, requests, concurrency)
+            latencies.sort()
+            print(f"{name:<10} {statistics.mean(latencies):>10.3f} {latencies[len(latencies) // 2]:>10.3f}"
+                  f" {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:>10.3f} {throughput:>10.0f}")
+
+
+@click.command()
+@click.option("-n", "--requests", default=2000, help="The number of requests to send for each transport.")
+@click.option("-c", "--concurrency", default=32, help="The number of requests in flight when measuring throughput.")
+@click.option("--port", default=44480, help="The port of the TCP Herald server.")
+def run(requests: int, concurrency: int, port: int):
+    aio.get_event_loop().run_until_complete(main(requests, concurrency, port))
+
+
+if __name__ == "__main__":
+    run()
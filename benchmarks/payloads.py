@@ -0,0 +1,76 @@
+"""Realistic Herald payloads, shared by the benchmarks in this directory."""
+from typing import *
+import uuid
+import royalnet.herald as rh
+import royalnet.utils as ru
+
+
+def ytdl_info(index: int) -> Dict[str, Any]:
+    """A trimmed down version of the info that :mod:`youtube_dl` extracts from a video."""
+    return {
+        "id": f"dQw4w9WgXc{index % 10}",
+        "title": f"Song number {index} (Official Video)",
+        "uploader": "Some Uploader",
+        "uploader_id": "UCuAXFkgsw1L7xaCfnd5JJOw",
+        "uploader_url": "https://www.youtube.com/channel/UCuAXFkgsw1L7xaCfnd5JJOw",
+        "upload_date": "20091025",
+        "duration": 212 + index,
+        "view_count": 800000000 + index,
+        "like_count": 8000000,
+        "dislike_count": 300000,
+        "webpage_url": f"https://www.youtube.com/watch?v=dQw4w9WgXc{index % 10}",
+        "thumbnail": f"https://i.ytimg.com/vi/dQw4w9WgXc{index % 10}/maxresdefault.jpg",
+        "description": "A very long description of the video. " * 10,
+        "tags": ["music", "video", "official", "pop", f"tag{index}"],
+        "categories": ["Music"],
+        "is_live": False,
+    }
+
+
+def summon_request() -> Dict[str, Any]:
+    """A small request, such as the ones sent by the Telegram serf to the Discord serf."""
+    return rh.Request(handler="discord_summon", data={
+        "channel_name": "General",
+        "guild_id": 123456789012345678,
+        "user_str": "Steffo#1234",
+    }).to_dict()
+
+
+def queue_response(length: int = 25) -> Dict[str, Any]:
+    """A big response, such as the queue of a music bot."""
+    return rh.ResponseSuccess(data={
+        "type": "PlayableQueue",
+        "queue": [ytdl_info(index) for index in range(length)],
+    }).to_dict()
+
+
+def user_list_response(length: int = 100) -> Dict[str, Any]:
+    """A medium response, such as a list of users returned by an event."""
+    return rh.ResponseSuccess(data={
+        "users": [{
+            "uid": index,
+            "username": f"user{index}",
+            "role": "member",
+            "avatar": None,
+            "telegram": [{"tg_id": 100000000 + index, "first_name": "User", "username": f"user{index}"}],
+        } for index in range(length)]
+    }).to_dict()
+
+
+def package(data: Dict[str, Any], compact_ids: bool = False) -> rh.Package:
+    """Wrap some data in a :class:`rh.Package` going from a random nid to another.
+
+    If ``compact_ids`` is :const:`True`, use the ids generated by a :class:`rh.Link` with
+    :attr:`rh.Config.compact_ids` enabled."""
+    if compact_ids:
+        return rh.Package(data, source=ru.to_urluuid(uuid.uuid4()), destination=ru.to_urluuid(uuid.uuid4()),
+                          source_conv_id=1234)
+    return rh.Package(data, source=str(uuid.uuid4()), destination=str(uuid.uuid4()))
+
+
+payloads: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "summon_request": summon_request,
+    "user_list_response": user_list_response,
+    "queue_response": queue_response,
+}
+"""All the available payloads, indexed by name."""
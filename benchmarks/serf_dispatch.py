@@ -0,0 +1,99 @@
+"""Compare the ways of finding the command called by a chat message, on a realistic mix of group chat messages.
+
+Most messages in a group aren't commands, some are commands with parameters, and a few are mistyped commands or
+commands addressed to other bots:
+
+- ``split``: the lookup used by the Serfs before :meth:`royalnet.serf.Serf.find_command`, splitting the whole message;
+- ``parse``: :meth:`LazyCommands.parse` with exact names and aliases only;
+- ``parse+prefix``: :meth:`LazyCommands.parse` also matching unambiguous prefixes.
+
+Run it with: ::
+
+    python -m benchmarks.serf_dispatch --messages 100000
+
+"""
+from typing import *
+import random
+import timeit
+import click
+import royalnet.commands as rc
+from royalnet.serf.lazycommands import LazyCommands, CommandLoader
+
+command_names = [
+    "ciao", "color", "cv", "diario", "dice", "dog", "eat", "emojify", "fortune", "ghostify", "help", "leaguoftitle",
+    "magickfiorygi", "matchmaking", "pause", "peertube", "play", "queue", "rage", "reminder", "royalnetaliases",
+    "royalnetroles", "royalnetsync", "royalnetversion", "skip", "smecds", "spell", "summon", "trivia", "userinfo",
+    "videochannel", "vote", "wiki", "youtube", "zawarudo",
+]
+
+chat_words = ["ok", "ma", "raga", "stasera", "chi", "gioca", "?", "lol", "si", "no", "dopo", "cena", "arrivo", "dai",
+              "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "che", "bello", "ahah", "io", "ci", "sono"]
+
+
+def make_commands() -> LazyCommands:
+    commands = LazyCommands()
+    for name in command_names:
+        command_class = type(f"{name.capitalize()}Command", (rc.Command,), {"name": name, "aliases": [name[:2] + "x"]})
+        loader = CommandLoader(command_class, lambda command_class=command_class: command_class(None))
+        for alias in [command_class.name, *command_class.aliases]:
+            if f"/{alias}" not in commands:
+                commands.register(f"/{alias}", loader)
+    return commands
+
+
+def make_messages(number: int, seed: int) -> Dict[str, List[str]]:
+    """Generate chat traffic, grouped by kind of message."""
+    rng = random.Random(seed)
+    messages = {"chat": [], "command": [], "mistyped": [], "all": []}
+    for _ in range(number):
+        chat = " ".join(rng.choice(chat_words) for _ in range(rng.randint(1, 40)))
+        roll = rng.random()
+        if roll < 0.85:
+            kind, text = "chat", chat
+        elif roll < 0.95:
+            kind, text = "command", f"/{rng.choice(command_names)} {chat}"
+        elif roll < 0.97:
+            kind, text = "command", f"/{rng.choice(command_names)}@royalbot {chat}"
+        elif roll < 0.99:
+            kind, text = "mistyped", f"/{rng.choice(command_names)[:4]} {chat}"
+        else:
+            kind, text = "mistyped", f"/start@otherbot {chat}"
+        messages[kind].append(text)
+        messages["all"].append(text)
+    return messages
+
+
+def split(commands: LazyCommands, text: str) -> Optional[Tuple[rc.Command, List[str]]]:
+    if not text.startswith("/"):
+        return None
+    command_text, *parameters = text.split(" ")
+    command_name = command_text.replace("@royalbot", "").lower()
+    try:
+        return commands[command_name], parameters
+    except KeyError:
+        return None
+
+
+@click.command()
+@click.option("-n", "--messages", default=100000, help="The number of chat messages to dispatch.")
+@click.option("-r", "--repeat", default=10, help="The number of times the dispatch is measured; the best is kept.")
+@click.option("--seed", default=0, help="The seed of the generated chat traffic.")
+def run(messages: int, repeat: int, seed: int):
+    commands = make_commands()
+    texts = make_messages(messages, seed)
+    modes = {
+        "split": lambda text: split(commands, text),
+        "parse": lambda text: commands.parse(text, "/", suffix="@royalbot"),
+        "parse+prefix": lambda text: commands.parse(text, "/", suffix="@royalbot", prefix_matching=True),
+    }
+    print(f"{'messages':<10} {'mode':<14} {'count':>8} {'msg/s':>12} {'ns/msg':>10} {'found':>8}")
+    for kind, kind_texts in texts.items():
+        for name, dispatch in modes.items():
+            found = sum(1 for text in kind_texts if dispatch(text) is not None)
+            elapsed = min(timeit.repeat(lambda: [dispatch(text) for text in kind_texts], number=1, repeat=repeat))
+            print(f"{kind:<10} {name:<14} {len(kind_texts):>8} {len(kind_texts) / elapsed:>12.0f}"
+                  f" {elapsed / len(kind_texts) * 1e9:>10.0f} {found:>8}")
+
+
+if __name__ == "__main__":
+    run()
@@ -58,21 +58,24 @@ def run(config_filename: str):
 
     # Herald Server
     herald_cfg = None
-    herald_process = None
+    herald_processes = []
     if rh is not None and "Herald" in config:
         if "Local" in config["Herald"] and config["Herald"]["Local"]["enabled"]:
-            # Create a Herald server
-            herald_server = rh.Server(rh.Config.from_config(name="<server>", **config["Herald"]["Local"]))
-            # Run the Herald server on a new process
-            herald_process = multiprocessing.Process(name="Herald.Local",
-                                                     target=herald_server.run_blocking,
-                                                     daemon=True,
-                                                     kwargs={
-                                                         "logging_cfg": config["Logging"]
-                                                     })
-            herald_process.start()
+            server_cfg = rh.Config.from_config(name="<server>", **config["Herald"]["Local"])
+            # Run every shard of the Herald server on a new process
+            for shard in range(server_cfg.shards):
+                herald_server = rh.Server(server_cfg, shard=shard)
+                herald_process = multiprocessing.Process(name="Herald.Local" if server_cfg.shards == 1
+                                                         else f"Herald.Local.{shard}",
+                                                         target=herald_server.run_blocking,
+                                                         daemon=True,
+                                                         kwargs={
+                                                             "logging_cfg": config["Logging"]
+                                                         })
+                herald_process.start()
+                herald_processes.append(herald_process)
             herald_cfg = config["Herald"]["Local"]
-            log.info("Herald: Enabled (Local)")
+            log.info(f"Herald: Enabled (Local, {server_cfg.shards} shards)")
         elif "Remote" in config["Herald"] and config["Herald"]["Remote"]["enabled"]:
             log.info("Herald: Enabled (Remote)")
             herald_cfg = config["Herald"]["Remote"]
@@ -168,9 +171,10 @@ def run(config_filename: str):
     if matrix_process is not None:
         log.info("Waiting for Serf.Matrix to stop...")
         matrix_process.join()
-    if herald_process is not None:
+    if herald_processes:
         log.info("Waiting for Herald to stop...")
-        herald_process.join()
+        for herald_process in herald_processes:
+            herald_process.join()
 
 
 if __name__ == "__main__":
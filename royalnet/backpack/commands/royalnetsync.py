@@ -51,6 +51,7 @@ class RoyalnetsyncCommand(rc.Command):
                 tg_user.last_name = from_user.last_name
                 tg_user.username = from_user.username
             await data.session_commit()
+            self.serf.invalidate_identity(from_user.id)
             await data.reply(f"↔️ Account {tg_user} synced to {author}!")
 
         elif self.interface.name == "discord":
@@ -77,6 +78,7 @@ class RoyalnetsyncCommand(rc.Command):
                 ds_user.discriminator = author.discriminator
                 ds_user.avatar_url = author.avatar_url
             await data.session_commit()
+            self.serf.invalidate_identity(author.id)
             await data.reply(f"↔️ Account {ds_user} synced to {author}!")
 
         elif self.interface.name == "matrix":
@@ -6,7 +6,8 @@ from .commanddata import CommandData
 from .commandargs import CommandArgs
 from .event import Event
 from .errors import \
-    CommandError, InvalidInputError, UnsupportedError, ConfigurationError, ExternalError, UserError, ProgramError
+    CommandError, InvalidInputError, UnsupportedError, ConfigurationError, ExternalError, UserError, ProgramError, \
+    herald_failure_error
 from .keyboardkey import KeyboardKey
 from .configdict import ConfigDict
 
@@ -22,6 +23,7 @@ __all__ = [
     "ExternalError",
     "UserError",
     "ProgramError",
+    "herald_failure_error",
     "Event",
     "KeyboardKey",
     "ConfigDict",
@@ -74,3 +74,18 @@ class CommandInterface:
             :class:`~royalnet.serf.telegram.TelegramSerf`.
         """
         raise UnsupportedError(f"{self.call_herald_event.__name__} is not supported on this platform.")
+
+    async def call_herald_event_stream(self, destination: str, event_name: str, **kwargs) -> AsyncIterator[dict]:
+        """Call an event function on a different :class:`~royalnet.serf.Serf`, and iterate on the chunks of its
+        streamed response as they arrive.
+
+        Events stream their response by being asynchronous generators; the chunks are sent only as fast as they are
+        consumed. Events that aren't streamed produce a single chunk.
+
+        Example:
+            You can show the progress of a download running on a :class:`~royalnet.serf.discord.DiscordSerf` from a
+            :class:`~royalnet.serf.telegram.TelegramSerf`.
+        """
+        raise UnsupportedError(f"{self.call_herald_event_stream.__name__} is not supported on this platform.")
+        # noinspection PyUnreachableCode
+        yield
@@ -1,3 +1,9 @@
+from typing import *
+
+if TYPE_CHECKING:
+    from royalnet.herald import ResponseFailure
+
+
 class CommandError(Exception):
     """Something went wrong during the execution of this command.
 
@@ -32,3 +38,37 @@ class ExternalError(CommandError):
 
 class ProgramError(CommandError):
     """The command encountered an error in the program."""
+
+
+def herald_failure_error(destination: str, event_name: str, response: "ResponseFailure") -> CommandError:
+    """Convert the :class:`royalherald.ResponseFailure` to a request sent to a Herald event to the error that should be
+    raised in the command that sent it."""
+    if response.name == "no_event":
+        return ProgramError(f"There is no event named {event_name} in {destination}.")
+    elif response.name == "no_destination":
+        return ExternalError(f"{destination} isn't connected to the Herald right now.")
+    elif response.name == "error_in_event":
+        if response.extra_info["type"] == "CommandError":
+            return CommandError(response.extra_info["message"])
+        elif response.extra_info["type"] == "UserError":
+            return UserError(response.extra_info["message"])
+        elif response.extra_info["type"] == "InvalidInputError":
+            return InvalidInputError(response.extra_info["message"])
+        elif response.extra_info["type"] == "UnsupportedError":
+            return UnsupportedError(response.extra_info["message"])
+        elif response.extra_info["type"] == "ConfigurationError":
+            return ConfigurationError(response.extra_info["message"])
+        elif response.extra_info["type"] == "ExternalError":
+            return ExternalError(response.extra_info["message"])
+        else:
+            return ProgramError(f"Invalid error in Herald event '{event_name}':\n"
+                                f"[b]{response.extra_info['type']}[/b]\n"
+                                f"{response.extra_info['message']}")
+    elif response.name == "unhandled_exception_in_event":
+        return ProgramError(f"Unhandled exception in Herald event '{event_name}':\n"
+                            f"[b]{response.extra_info['type']}[/b]\n"
+                            f"{response.extra_info['message']}")
+    else:
+        return ProgramError(f"Unknown response in Herald event '{event_name}':\n"
+                            f"[b]{response.name}[/b]"
+                            f"[p]{response}[/p]")
@@ -38,4 +38,8 @@ class Event:
         return self.interface.config
 
     async def run(self, **kwargs):
+        """Handle the event, returning the data of the response.
+
+        It can also be an asynchronous generator, yielding the data of the response in multiple chunks: they will be
+        sent to the caller while they are produced, with :meth:`CommandInterface.call_herald_event_stream`."""
         raise NotImplementedError()
@@ -1,7 +1,7 @@
 from typing import *
 import asyncio as aio
 import logging
-import importlib
+import inspect
 import uvicorn
 import starlette.applications
 import royalnet.alchemy as ra
@@ -36,21 +36,11 @@ class Constellation:
                  constellation_cfg: Dict[str, Any],
                  logging_cfg: Dict[str, Any]
                  ):
-        # Import packs
-        pack_names = packs_cfg["active"]
-        packs = {}
-        for pack_name in pack_names:
-            log.debug(f"Importing pack: {pack_name}")
-            try:
-                packs[pack_name] = {
-                    "commands": importlib.import_module(f"{pack_name}.commands"),
-                    "events": importlib.import_module(f"{pack_name}.events"),
-                    "stars": importlib.import_module(f"{pack_name}.stars"),
-                    "tables": importlib.import_module(f"{pack_name}.tables"),
-                }
-            except ImportError as e:
-                log.error(f"Error during the import of {pack_name}: {e}")
-        log.info(f"Packs: {len(packs)} imported")
+        # Import only the parts of the packs that a Constellation uses: commands aren't needed
+        submodules = ["events", "stars"]
+        if ra.Alchemy is not None and alchemy_cfg is not None and alchemy_cfg["enabled"]:
+            submodules.append("tables")
+        packs = ru.import_packs(packs_cfg["active"], submodules, packs_cfg.get("import_time_warning"))
 
         self.alchemy = None
         """The :class:`~ra.Alchemy` of this Constellation."""
@@ -160,43 +150,29 @@ class Constellation:
                 """Send a :class:`royalherald.Request` to a specific destination, and wait for a
                 :class:`royalherald.Response`."""
                 if self.herald is None:
-                    raise rc.UnsupportedError("`royalherald` is not enabled on this serf.")
+                    raise rc.UnsupportedError("`royalherald` is not enabled on this constellation.")
                 request: rh.Request = rh.Request(handler=event_name, data=kwargs)
                 response: rh.Response = await self.herald.request(destination=destination, request=request)
                 if isinstance(response, rh.ResponseFailure):
-                    if response.name == "no_event":
-                        raise rc.ProgramError(f"There is no event named {event_name} in {destination}.")
-                    elif response.name == "error_in_event":
-                        if response.extra_info["type"] == "CommandError":
-                            raise rc.CommandError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "UserError":
-                            raise rc.UserError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "InvalidInputError":
-                            raise rc.InvalidInputError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "UnsupportedError":
-                            raise rc.UnsupportedError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "ConfigurationError":
-                            raise rc.ConfigurationError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "ExternalError":
-                            raise rc.ExternalError(response.extra_info["message"])
-                        else:
-                            raise rc.ProgramError(f"Invalid error in Herald event '{event_name}':\n"
-                                                  f"[b]{response.extra_info['type']}[/b]\n"
-                                                  f"{response.extra_info['message']}")
-                    elif response.name == "unhandled_exception_in_event":
-                        raise rc.ProgramError(f"Unhandled exception in Herald event '{event_name}':\n"
-                                              f"[b]{response.extra_info['type']}[/b]\n"
-                                              f"{response.extra_info['message']}")
-                    else:
-                        raise rc.ProgramError(f"Unknown response in Herald event '{event_name}':\n"
-                                              f"[b]{response.name}[/b]"
-                                              f"[p]{response}[/p]")
+                    raise rc.herald_failure_error(destination, event_name, response)
                 elif isinstance(response, rh.ResponseSuccess):
                     return response.data
                 else:
                     raise rc.ProgramError(f"Other Herald Link returned unknown response:\n"
                                           f"[p]{response}[/p]")
 
+            async def call_herald_event_stream(ci, destination: str, event_name: str, **kwargs) -> AsyncIterator[Dict]:
+                """Send a :class:`royalherald.Request` to a specific destination, and iterate on the chunks of its
+                streamed :class:`royalherald.Response`."""
+                if self.herald is None:
+                    raise rc.UnsupportedError("`royalherald` is not enabled on this constellation.")
+                request: rh.Request = rh.Request(handler=event_name, data=kwargs)
+                async with await self.herald.request_stream(destination=destination, request=request) as stream:
+                    async for chunk in stream:
+                        yield chunk
+                if isinstance(stream.response, rh.ResponseFailure):
+                    raise rc.herald_failure_error(destination, event_name, stream.response)
+
         return GenericInterface
 
     def init_herald(self, herald_cfg: Dict[str, Any]):
@@ -204,7 +180,8 @@ class Constellation:
         herald_cfg["name"] = "constellation"
         self.herald: rh.Link = rh.Link(rh.Config.from_config(**herald_cfg), self.network_handler)
 
-    async def network_handler(self, message: Union[rh.Request, rh.Broadcast]) -> rh.Response:
+    async def network_handler(self, message: Union[rh.Request, rh.Broadcast]) \
+            -> Union[rh.Response, AsyncIterator[rh.Response]]:
         try:
             event: rc.Event = self.events[message.handler]
         except KeyError:
@@ -213,18 +190,32 @@ class Constellation:
         log.debug(f"Event called: {event.name}")
         if isinstance(message, rh.Request):
             try:
-                response_data = await event.run(**message.data)
+                result = event.run(**message.data)
+                # Events that are asynchronous generators stream their response
+                if inspect.isasyncgen(result):
+                    return rh.stream_chunks(result, lambda e: self.event_failure(message, e))
+                response_data = await result
                 return rh.ResponseSuccess(data=response_data)
             except Exception as e:
-                ru.sentry_exc(e)
-                return rh.ResponseFailure("exception_in_event",
-                                          f"An exception was raised in the event for '{message.handler}'.",
-                                          extra_info={
-                                              "type": e.__class__.__qualname__,
-                                              "message": str(e)
-                                          })
+                return self.event_failure(message, e)
         elif isinstance(message, rh.Broadcast):
-            await event.run(**message.data)
+            result = event.run(**message.data)
+            if inspect.isasyncgen(result):
+                async for _ in result:
+                    pass
+            else:
+                await result
+
+    @staticmethod
+    def event_failure(message: rh.Request, e: Exception) -> rh.ResponseFailure:
+        """Create the :class:`rh.ResponseFailure` to send when an :class:`rc.Event` raises an exception."""
+        ru.sentry_exc(e)
+        return rh.ResponseFailure("exception_in_event",
+                                  f"An exception was raised in the event for '{message.handler}'.",
+                                  extra_info={
+                                      "type": e.__class__.__qualname__,
+                                      "message": str(e)
+                                  })
 
     def register_events(self, events: List[Type[rc.Event]], pack_cfg: Dict[str, Any]):
         for SelectedEvent in events:
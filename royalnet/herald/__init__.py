@@ -13,11 +13,17 @@ You can install it with: ::
 from .config import Config
 from .errors import *
 from .link import Link
-from .package import Package
+from .package import Package, PRIORITY_INTERACTIVE, PRIORITY_BULK
 from .request import Request
-from .response import Response, ResponseSuccess, ResponseFailure
+from .response import Response, ResponseSuccess, ResponseFailure, ResponseChunk
+from .stream import ResponseStream, StreamCredit, stream_chunks
 from .server import Server
 from .broadcast import Broadcast
+from .codecs import Codec, JSONCodec, MsgpackCodec, FramedCodec
+from .outboundqueue import OutboundQueue
+from .bus import Bus, RemoteClient
+from .metrics import ServerMetrics
+from .compression import Compressor, ZlibCompressor, ZstdCompressor
 
 
 __all__ = [
@@ -26,13 +32,32 @@ __all__ = [
     "ConnectionClosedError",
     "LinkError",
     "InvalidServerResponseError",
+    "RequestTimeoutError",
+    "QueueFullError",
     "ServerError",
     "Link",
     "Package",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BULK",
     "Request",
     "Response",
     "ResponseSuccess",
     "ResponseFailure",
+    "ResponseChunk",
+    "ResponseStream",
+    "StreamCredit",
+    "stream_chunks",
     "Server",
     "Broadcast",
+    "Codec",
+    "JSONCodec",
+    "MsgpackCodec",
+    "FramedCodec",
+    "OutboundQueue",
+    "Bus",
+    "RemoteClient",
+    "ServerMetrics",
+    "Compressor",
+    "ZlibCompressor",
+    "ZstdCompressor",
 ]
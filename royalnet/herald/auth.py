@@ -0,0 +1,48 @@
+from typing import *
+import hmac
+import hashlib
+import secrets
+
+
+auth_methods: List[str] = ["hmac", "plaintext"]
+"""The ways a :class:`Link` can prove to a :class:`Server` that it knows the secret:
+
+- ``hmac``: the :class:`Link` and the :class:`Server` exchange random nonces, and prove to each other that they know
+  the secret by sending HMACs of them;
+- ``plaintext``: the :class:`Link` sends the secret as it is, like the older versions of Royalnet do."""
+
+
+def new_nonce() -> str:
+    """Generate a random nonce for the challenge-response identification."""
+    return secrets.token_hex(16)
+
+
+def is_nonce(nonce: str) -> bool:
+    """Check that a nonce received from the network is long enough and can be safely put in a message."""
+    return 32 <= len(nonce) <= 128 and all(c in "0123456789abcdef" for c in nonce)
+
+
+def _digest(secret: str, *parts: str) -> str:
+    return hmac.new(bytes(secret, encoding="utf8"), bytes(":".join(parts), encoding="utf8"), hashlib.sha256).hexdigest()
+
+
+def identify_digest(secret: str, client_nonce: str, server_nonce: str, nid: str, name: str) -> str:
+    """The HMAC sent by a :class:`Link` instead of the secret, binding it to its ``nid`` and ``link_type``."""
+    return _digest(secret, "identify", client_nonce, server_nonce, nid, name)
+
+
+def server_proof(secret: str, client_nonce: str, server_nonce: str) -> str:
+    """The HMAC sent by a :class:`Server` to prove to the :class:`Link` that it knows the secret too."""
+    return _digest(secret, "server", client_nonce, server_nonce)
+
+
+def bus_proof(secret: str, role: str, connector_nonce: str, acceptor_nonce: str, name: str) -> str:
+    """The HMAC sent by a :class:`Server` to prove to a bus peer that it knows the secret.
+
+    The ``role`` is either ``"acceptor"`` or ``"connector"``, so that a proof can't be sent back to its sender."""
+    return _digest(secret, "bus", role, connector_nonce, acceptor_nonce, name)
+
+
+def compare(a: str, b: str) -> bool:
+    """Compare two secrets or digests in constant time."""
+    return hmac.compare_digest(bytes(a, encoding="utf8"), bytes(b, encoding="utf8"))
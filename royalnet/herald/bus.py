@@ -0,0 +1,304 @@
+from typing import *
+import asyncio as aio
+import json
+import random
+import logging
+import websockets
+from .auth import new_nonce, is_nonce, bus_proof, compare
+from .codecs import Codec, available_codecs, negotiate_codec
+from .errors import HeraldError
+from .package import Package, PRIORITY_INTERACTIVE
+
+if TYPE_CHECKING:
+    from .server import Server, ConnectedClient
+
+
+log = logging.getLogger(__name__)
+
+
+class RemoteClient:
+    """The :py:class:`Server`-side representation of a :py:class:`Link` connected to another :py:class:`Server`,
+    reachable through a :class:`BusPeer`."""
+    def __init__(self, nid: str, link_type: str, codec: Codec, peer: "BusPeer", path: List[str]):
+        self.nid: str = nid
+        self.link_type: str = link_type
+        self.codec: Codec = codec
+        """The :class:`Codec` used by the :py:class:`Link`, so that the other server can forward packages to it
+        without encoding them again."""
+        self.peer: "BusPeer" = peer
+        """The peer packages for this client should be forwarded to."""
+        self.path: List[str] = path
+        """The names of the servers the client can be reached through, starting from the one it is connected to."""
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self.nid} via {' <- '.join(self.path)}>"
+
+    async def send(self, package: Package):
+        """Send a :py:class:`Package` to the :py:class:`Link`."""
+        await self.send_bytes(package.to_bytes(self.codec), package.priority)
+
+    async def send_bytes(self, data: bytes, priority: int = PRIORITY_INTERACTIVE):
+        """Send an already encoded :py:class:`Package` to the :py:class:`Link`."""
+        await self.peer.deliver(self.nid, self.codec.name, data, self.peer.bus.max_hops, priority)
+
+
+class BusPeer:
+    """A connection between two :py:class:`Server`, used to exchange the clients connected to each of them and to
+    deliver packages to them.
+
+    Control messages are sent as JSON text messages; packages are sent as binary messages containing the destination
+    ``nid``, the name of the :class:`Codec`, the number of hops the package can still do, the priority of the package
+    and the encoded package, separated by spaces."""
+    def __init__(self, bus: "Bus", name: str, websocket: "websockets.WebSocketCommonProtocol"):
+        self.bus: "Bus" = bus
+        self.name: str = name
+        self.websocket: "websockets.WebSocketCommonProtocol" = websocket
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self.name}>"
+
+    async def send_control(self, message: Dict[str, Any]) -> None:
+        await self.websocket.send(json.dumps(message))
+
+    async def deliver(self, nid: str, codec_name: str, data: bytes, hops: int,
+                      priority: int = PRIORITY_INTERACTIVE) -> None:
+        await self.websocket.send(b" ".join((bytes(nid, encoding="utf8"),
+                                             bytes(codec_name, encoding="utf8"),
+                                             bytes(str(hops), encoding="ascii"),
+                                             bytes(str(priority), encoding="ascii"),
+                                             data)))
+
+    async def handle(self) -> None:
+        """Handle the messages received from the other :py:class:`Server` until the connection is closed."""
+        try:
+            async for message in self.websocket:
+                if isinstance(message, str):
+                    await self.bus.handle_control(self, json.loads(message))
+                else:
+                    await self.bus.handle_delivery(self, message)
+        except websockets.ConnectionClosed:
+            pass
+
+
+class Bus:
+    """Connects a :py:class:`Server` to other servers, making the clients connected to any of them reachable from all
+    the others.
+
+    Every server announces its own clients to its peers, and the peers announce them to their own peers, adding
+    themselves to the ``path`` of the announcement: a server ignores the announcements that have already passed through
+    it, and prefers the shortest path to each client, so that packages never go around in circles.
+
+    Routes aren't recomputed when a peer disconnects, so the servers should be connected in a tree or in a full mesh."""
+    def __init__(self, server: "Server", name: str, secret: str, *, max_hops: int = 8):
+        self.server: "Server" = server
+        self.name: str = name
+        """The name of this server on the bus. It must be unique among the connected servers."""
+        self.secret: str = secret
+        """The secret the peers must know to connect to this server."""
+        self.max_hops: int = max_hops
+        """The maximum number of servers a package can be forwarded through."""
+        self.peers: Set[BusPeer] = set()
+        """The connections to the other servers.
+        
+        There may be more than one connection to the same server, for example if both servers are configured to
+        connect to each other."""
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self.name} ({len(self.peers)} peers)>"
+
+    def _hello(self, connector_nonce: Optional[str] = None) -> Dict[str, Any]:
+        """Create a hello message containing a new nonce.
+
+        If the hello of the connecting server has already been received, add the proof that this server knows the
+        secret."""
+        hello = {"type": "hello", "name": self.name, "nonce": new_nonce()}
+        if connector_nonce is not None:
+            hello["proof"] = bus_proof(self.secret, "acceptor", connector_nonce, hello["nonce"], self.name)
+        return hello
+
+    def _check_hello(self, hello: Dict[str, Any]) -> bool:
+        return hello.get("type") == "hello" and isinstance(hello.get("name"), str) and hello["name"] != self.name \
+            and isinstance(hello.get("nonce"), str) and is_nonce(hello["nonce"])
+
+    @staticmethod
+    def is_hello(message: Union[str, bytes]) -> bool:
+        """Check if the first message received from a websocket is a :class:`Bus` hello instead of an identification."""
+        return isinstance(message, str) and message.startswith("{")
+
+    async def listener(self, websocket: "websockets.WebSocketServerProtocol", path) -> None:
+        """Accept a connection from another :py:class:`Server`."""
+        await self.accept(websocket, await websocket.recv())
+
+    async def accept(self, websocket: "websockets.WebSocketServerProtocol", message: str) -> None:
+        """Accept a connection from another :py:class:`Server` whose hello message has already been received.
+
+        The servers never send the secret: each one proves to know it by sending an HMAC of both nonces, starting from
+        the accepting one, so that the connecting server doesn't send anything useful to a server without the
+        secret."""
+        try:
+            hello = json.loads(message)
+        except ValueError:
+            hello = {}
+        if not isinstance(hello, dict) or not self._check_hello(hello):
+            log.warning(f"Invalid bus hello from {websocket.remote_address}")
+            await websocket.close(code=1008, reason="Invalid hello")
+            return
+        own_hello = self._hello(connector_nonce=hello["nonce"])
+        await websocket.send(json.dumps(own_hello))
+        try:
+            proof = json.loads(await websocket.recv())
+        except (ValueError, websockets.ConnectionClosed):
+            proof = {}
+        expected = bus_proof(self.secret, "connector", hello["nonce"], own_hello["nonce"], hello["name"])
+        if not isinstance(proof, dict) or proof.get("type") != "proof" or not isinstance(proof.get("proof"), str) \
+                or not compare(proof["proof"], expected):
+            log.warning(f"Invalid bus proof from {websocket.remote_address}")
+            await websocket.close(code=1008, reason="Invalid proof")
+            return
+        await self._run_peer(BusPeer(self, hello["name"], websocket))
+
+    async def connect_forever(self, connect: Callable[[], Awaitable["websockets.WebSocketClientProtocol"]]) -> None:
+        """Connect to another :py:class:`Server`, reconnecting every time the connection is lost.
+
+        Parameters:
+            connect: A coroutine function creating the websocket connection."""
+        attempts = 0
+        while True:
+            if attempts:
+                delay = random.uniform(0, min(5.0, 0.1 * 2 ** attempts))
+                log.debug(f"Connecting to a bus peer again in {delay:.1f}s")
+                await aio.sleep(delay)
+            attempts += 1
+            try:
+                websocket = await connect()
+                own_hello = self._hello()
+                await websocket.send(json.dumps(own_hello))
+                hello = json.loads(await websocket.recv())
+            except (OSError, ValueError, websockets.InvalidHandshake, websockets.ConnectionClosed) as e:
+                log.debug(f"Could not connect to a bus peer: {e!r}")
+                continue
+            if not isinstance(hello, dict) or not self._check_hello(hello) or not isinstance(hello.get("proof"), str) \
+                    or not compare(hello["proof"], bus_proof(self.secret, "acceptor", own_hello["nonce"],
+                                                             hello["nonce"], hello["name"])):
+                log.error(f"Invalid bus hello from {websocket.remote_address}, is the secret the same?")
+                await websocket.close(code=1008, reason="Invalid hello")
+                continue
+            try:
+                await websocket.send(json.dumps({
+                    "type": "proof",
+                    "proof": bus_proof(self.secret, "connector", own_hello["nonce"], hello["nonce"], self.name),
+                }))
+            except websockets.ConnectionClosed as e:
+                log.debug(f"Could not connect to a bus peer: {e!r}")
+                continue
+            attempts = 0
+            await self._run_peer(BusPeer(self, hello["name"], websocket))
+
+    async def _run_peer(self, peer: BusPeer) -> None:
+        self.peers.add(peer)
+        log.info(f"Bus peer connected: {peer.name}")
+        try:
+            # Tell the peer about all the clients reachable through this server
+            for client in list(self.server.identified_clients):
+                message = self._join_message(client, peer)
+                if message is not None:
+                    await peer.send_control(message)
+            await peer.handle()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.peers.discard(peer)
+            for client in [client for client in self.server.identified_clients
+                           if isinstance(client, RemoteClient) and client.peer is peer]:
+                self.server.unregister_client(client)
+                await self.announce_leave(client)
+            log.info(f"Bus peer disconnected: {peer.name}")
+
+    def _join_message(self, client: Union["ConnectedClient", RemoteClient], peer: BusPeer) -> Optional[Dict[str, Any]]:
+        if isinstance(client, RemoteClient):
+            # Never announce a client back to the peer it was announced by
+            if client.peer is peer:
+                return None
+            path = [*client.path, self.name]
+        else:
+            path = [self.name]
+        return {"type": "join", "nid": client.nid, "link_type": client.link_type, "codec": client.codec.name,
+                "path": path}
+
+    async def _send_control(self, peers: Iterable[BusPeer], messages: Iterable[Optional[Dict[str, Any]]]) -> None:
+        sends = [peer.send_control(message) for peer, message in zip(peers, messages) if message is not None]
+        results = await aio.gather(*sends, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                log.warning(f"Could not send a message to a bus peer: {result!r}")
+
+    async def announce_join(self, client: Union["ConnectedClient", RemoteClient]) -> None:
+        """Tell all peers that a client can be reached through this server."""
+        peers = list(self.peers)
+        await self._send_control(peers, [self._join_message(client, peer) for peer in peers])
+
+    async def announce_leave(self, client: Union["ConnectedClient", RemoteClient]) -> None:
+        """Tell all peers that a client can't be reached through this server anymore."""
+        peers = [peer for peer in self.peers
+                 if not isinstance(client, RemoteClient) or client.peer is not peer]
+        await self._send_control(peers, [{"type": "leave", "nid": client.nid} for _ in peers])
+
+    async def handle_control(self, peer: BusPeer, message: Dict[str, Any]) -> None:
+        if message["type"] == "join":
+            path = message["path"]
+            if self.name in path:
+                log.debug(f"Ignoring join of {message['nid']}, as it has already passed through this server")
+                return
+            current = self.server.find_client(nid=message["nid"])
+            if current and not isinstance(current[0], RemoteClient):
+                # A client connected to this server is always closer than one announced by a peer
+                log.debug(f"Ignoring join of {message['nid']}, as it is connected to this server")
+                return
+            if current:
+                # Keep the shortest route, unless it is the peer of the current route that is updating it
+                if current[0].peer is not peer and len(current[0].path) < len(path):
+                    return
+            client = RemoteClient(nid=message["nid"],
+                                  link_type=message["link_type"],
+                                  codec=negotiate_codec([message["codec"]]),
+                                  peer=peer,
+                                  path=path)
+            self.server.register_client(client)
+            await self.announce_join(client)
+        elif message["type"] == "leave":
+            client = self.server.find_client(nid=message["nid"])
+            if not client:
+                return
+            if isinstance(client[0], RemoteClient) and client[0].peer is peer:
+                self.server.unregister_client(client[0])
+                await self.announce_leave(client[0])
+            else:
+                # The client has connected somewhere else in the meantime, and the peer may have ignored its join
+                await self._send_control([peer], [self._join_message(client[0], peer)])
+        else:
+            log.warning(f"Unknown bus message from {peer}: {message}")
+
+    async def handle_delivery(self, peer: BusPeer, message: bytes) -> None:
+        nid, codec_name, hops, priority, data = message.split(b" ", 4)
+        nid, codec_name, hops = str(nid, encoding="utf8"), str(codec_name, encoding="utf8"), int(hops)
+        priority = int(priority)
+        client = self.server.find_client(nid=nid)
+        if not client:
+            log.debug(f"Dropping bus package for {nid}, as it isn't reachable from this server")
+            package = Package.from_bytes(data, available_codecs[codec_name])
+            await self.server.reject_package(package, f"{nid} has left the Herald.")
+            return
+        client = client[0]
+        if isinstance(client, RemoteClient):
+            if hops <= 1 or client.peer is peer:
+                log.warning(f"Dropping bus package for {nid}, as it is going around in circles")
+                return
+            await client.peer.deliver(nid, codec_name, data, hops - 1, priority)
+            return
+        # The client codec might not be available in the process that encoded the package
+        if client.codec.name != codec_name:
+            data = Package.from_bytes(data, available_codecs[codec_name]).to_bytes(client.codec)
+        try:
+            await client.send_bytes(data, priority)
+        except HeraldError as e:
+            log.warning(f"Could not deliver bus package to {client}: {e!r}")
@@ -0,0 +1,275 @@
+from typing import *
+import re
+import json
+import struct
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+if TYPE_CHECKING:
+    from .package import Package
+
+
+log = logging.getLogger(__name__)
+
+long_number = re.compile(rb"[0-9]{19}")
+"""Matches the numbers that may not fit in 64 bits, which :func:`orjson.loads` would turn into floats."""
+
+long_number_str = re.compile(r"[0-9]{19}")
+"""The same as :data:`long_number`, for the messages received as :class:`str`."""
+
+
+class Codec:
+    """A way to convert :class:`Package` dictionaries to bytes and back, negotiated by :class:`Link` and
+    :class:`Server` during the identification."""
+
+    name: str = NotImplemented
+    """The name of the codec, sent over the network during the identification."""
+
+    def dumps(self, obj: Any) -> bytes:
+        """Encode an object into bytes."""
+        raise NotImplementedError()
+
+    def loads(self, data: bytes) -> Any:
+        """Decode bytes into an object."""
+        raise NotImplementedError()
+
+    def envelope(self, package: "Package") -> Tuple[bytes, bytes]:
+        """Encode everything in a :class:`Package` except the ``destination.nid``.
+
+        Returns:
+            A :class:`tuple` containing the bytes that come before and after the encoded ``destination.nid``."""
+        raise NotImplementedError()
+
+    def join(self, items: List[bytes]) -> bytes:
+        """Encode a list from items that have already been encoded with this codec."""
+        raise NotImplementedError()
+
+    def encode_package(self, package: "Package") -> bytes:
+        """Encode a :class:`Package`."""
+        return self.dumps(package.to_dict())
+
+    def encode_package_multi(self, package: "Package", destinations: Sequence[str]) -> List[bytes]:
+        """Encode a :class:`Package` once for every passed destination, replacing its ``destination.nid``.
+
+        By default, everything but the ``destination.nid`` is encoded only once, using :meth:`.envelope`."""
+        head, tail = self.envelope(package)
+        return [head + self.dumps(destination) + tail for destination in destinations]
+
+    def decode_packages(self, data: bytes) -> List["Package"]:
+        """Decode bytes containing either a single :class:`Package` or a batch of packages."""
+        from .package import Package
+        obj = self.loads(data)
+        if isinstance(obj, list):
+            return [Package.from_dict(d) for d in obj]
+        return [Package.from_dict(obj)]
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}>"
+
+
+class JSONCodec(Codec):
+    """A codec using UTF-8-encoded JSON, compatible with every :class:`Link` and :class:`Server`.
+
+    If :mod:`orjson` is installed, it will be used instead of :mod:`json` whenever possible."""
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                # orjson is stricter than json (for example, with non-str dict keys): fall back to json
+                pass
+        return bytes(json.dumps(obj), encoding="utf8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        if isinstance(data, str):
+            if orjson is not None and long_number_str.search(data) is None:
+                return orjson.loads(data)
+            return json.loads(data)
+        # Numbers that may not fit in 64 bits are rare, and only json can decode them as ints
+        if orjson is not None and long_number.search(data) is None:
+            return orjson.loads(data)
+        return json.loads(str(data, encoding="utf8"))
+
+    def envelope(self, package: "Package") -> Tuple[bytes, bytes]:
+        head = b'{"source":' + self.dumps({"nid": package.source, "conv_id": package.source_conv_id}) + \
+               b',"destination":{"nid":'
+        tail = b',"conv_id":' + self.dumps(package.destination_conv_id) + \
+               b'},"data":' + self.dumps(package.data)
+        if package.priority:
+            tail += b',"priority":' + self.dumps(package.priority)
+        return head, tail + b'}'
+
+    def join(self, items: List[bytes]) -> bytes:
+        return b"[" + b",".join(items) + b"]"
+
+
+class MsgpackCodec(Codec):
+    """A compact binary codec using `MessagePack <https://msgpack.org/>`_.
+
+    It requires the :mod:`msgpack` package to be installed."""
+
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("'msgpack' is not installed")
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+    def envelope(self, package: "Package") -> Tuple[bytes, bytes]:
+        # 0x83, 0x84 and 0x82 are the headers of maps with respectively 3, 4 and 2 items
+        head = (b"\x84" if package.priority else b"\x83") + \
+               self.dumps("source") + self.dumps({"nid": package.source, "conv_id": package.source_conv_id}) + \
+               self.dumps("destination") + b"\x82" + self.dumps("nid")
+        tail = self.dumps("conv_id") + self.dumps(package.destination_conv_id) + \
+               self.dumps("data") + self.dumps(package.data)
+        if package.priority:
+            tail += self.dumps("priority") + self.dumps(package.priority)
+        return head, tail
+
+    def join(self, items: List[bytes]) -> bytes:
+        # 0x90 is the header of arrays with up to 15 items, 0xdc and 0xdd are followed by the length of the array
+        length = len(items)
+        if length < 16:
+            header = bytes([0x90 | length])
+        elif length < 2 ** 16:
+            header = b"\xdc" + length.to_bytes(2, "big")
+        else:
+            header = b"\xdd" + length.to_bytes(4, "big")
+        return header + b"".join(items)
+
+
+class FramedCodec(Codec):
+    """A codec wrapping another one, that encodes the ``data`` of a :class:`Package` separately from the rest of the
+    package.
+
+    This allows a :class:`Server` to route packages decoding only their source and destination, and to forward the
+    ``data`` without decoding and encoding it again.
+
+    Every package is encoded as a frame: ::
+
+        0xC1 | header length (2 bytes) | data length (4 bytes) | header | data
+
+    where the header is the inner encoding of ``[source.nid, source.conv_id, destination.nid, destination.conv_id]``,
+    followed by the ``priority`` if it isn't the default one, and the data is the inner encoding of the ``data``.
+    Multiple frames can be concatenated in a single message."""
+
+    magic: bytes = b"\xc1"
+    """The first byte of every frame; it is never used by msgpack, and it is invalid in JSON."""
+
+    prefix: struct.Struct = struct.Struct(">cHI")
+
+    def __init__(self, inner: Codec):
+        self.inner: Codec = inner
+        self.name: str = f"framed-{inner.name}"
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self.inner.name}>"
+
+    def dumps(self, obj: Any) -> bytes:
+        from .package import Package
+        return self.encode_package(Package.from_dict(obj))
+
+    def loads(self, data: bytes) -> Any:
+        packages = self.decode_packages(data)
+        if len(packages) == 1:
+            return packages[0].to_dict()
+        return [package.to_dict() for package in packages]
+
+    def join(self, items: List[bytes]) -> bytes:
+        return b"".join(items)
+
+    def _frame(self, package: "Package", destination: str, payload: Union[bytes, memoryview]) -> bytes:
+        fields = [package.source, package.source_conv_id, destination, package.destination_conv_id]
+        if package.priority:
+            fields.append(package.priority)
+        header = self.inner.dumps(fields)
+        return b"".join((self.prefix.pack(self.magic, len(header), len(payload)), header, payload))
+
+    def _payload(self, package: "Package") -> Union[bytes, memoryview]:
+        # Forward the data as it was received, if it was encoded with the same codec
+        raw_data = package.raw_data(self.inner)
+        if raw_data is not None:
+            return raw_data
+        return self.inner.dumps(package.data)
+
+    def encode_package(self, package: "Package") -> bytes:
+        return self._frame(package, package.destination, self._payload(package))
+
+    def encode_package_multi(self, package: "Package", destinations: Sequence[str]) -> List[bytes]:
+        payload = self._payload(package)
+        return [self._frame(package, destination, payload) for destination in destinations]
+
+    def decode_packages(self, data: bytes) -> List["Package"]:
+        from .package import Package
+        view = memoryview(data)
+        packages = []
+        offset = 0
+        while offset < len(view):
+            magic, header_length, data_length = self.prefix.unpack_from(view, offset)
+            if magic != self.magic:
+                raise ValueError("Invalid frame")
+            offset += self.prefix.size
+            header = self.inner.loads(view[offset:offset + header_length])
+            source, source_conv_id, destination, destination_conv_id = header[:4]
+            offset += header_length
+            if offset + data_length > len(view):
+                raise ValueError("Truncated frame")
+            packages.append(Package(None,
+                                    source=source,
+                                    destination=destination,
+                                    source_conv_id=source_conv_id,
+                                    destination_conv_id=destination_conv_id,
+                                    raw_data=view[offset:offset + data_length],
+                                    raw_codec=self.inner,
+                                    priority=header[4] if len(header) > 4 else 0))
+            offset += data_length
+        return packages
+
+
+json_codec = JSONCodec()
+"""The default :class:`Codec`, used during the identification and with peers that don't support anything else."""
+
+available_codecs: Dict[str, Codec] = {json_codec.name: json_codec}
+"""The codecs that can be used in this process, indexed by name."""
+
+if msgpack is not None:
+    available_codecs[MsgpackCodec.name] = MsgpackCodec()
+
+for _codec in list(available_codecs.values()):
+    _framed = FramedCodec(_codec)
+    available_codecs[_framed.name] = _framed
+
+default_codec_preferences: List[str] = ["framed-msgpack", "msgpack", "framed-json", "json"]
+"""The order in which codecs are preferred if nothing else is specified."""
+
+
+def negotiate_codec(preferences: Iterable[str]) -> Codec:
+    """Choose the first codec of the passed list that is available in this process.
+
+    Parameters:
+        preferences: The names of the codecs supported by the peer, in order of preference.
+
+    Returns:
+        The chosen :class:`Codec`, or :data:`json_codec` if none of them is available."""
+    for name in preferences:
+        codec = available_codecs.get(name)
+        if codec is not None:
+            return codec
+    return json_codec
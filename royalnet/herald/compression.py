@@ -0,0 +1,138 @@
+from typing import *
+import zlib
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+log = logging.getLogger(__name__)
+
+max_decompressed_size: int = 64 * 2 ** 20
+"""The maximum size of a decompressed message, to protect from messages that decompress to huge sizes."""
+
+
+class Compressor:
+    """A compression algorithm for the messages sent between :class:`Link` and :class:`Server`, negotiated during the
+    identification.
+
+    Compressed messages start with the :attr:`.marker` of the algorithm, a byte that no :class:`Codec` ever uses as the
+    first byte of a message, so that uncompressed messages can still be sent without any overhead."""
+
+    name: str = NotImplemented
+    """The name of the algorithm, sent over the network during the identification."""
+
+    marker: bytes = NotImplemented
+    """The byte prepended to the messages compressed with this algorithm."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress some data, without prepending the :attr:`.marker`."""
+        raise NotImplementedError()
+
+    def decompress(self, data: Union[bytes, memoryview]) -> bytes:
+        """Decompress some data compressed with :meth:`.compress`.
+
+        Raises:
+            :exc:`ValueError` if the decompressed data would be larger than :data:`max_decompressed_size`."""
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}>"
+
+
+class ZlibCompressor(Compressor):
+    """The DEFLATE algorithm, as implemented by :mod:`zlib`; it is always available."""
+
+    name = "zlib"
+    marker = b"\x01"
+
+    def __init__(self, level: int = 6):
+        self.level: int = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: Union[bytes, memoryview]) -> bytes:
+        decompressor = zlib.decompressobj()
+        result = decompressor.decompress(data, max_decompressed_size)
+        if decompressor.unconsumed_tail:
+            raise ValueError("Decompressed message is too large")
+        return result
+
+
+class ZstdCompressor(Compressor):
+    """The `Zstandard <https://facebook.github.io/zstd/>`_ algorithm, faster than zlib at similar ratios.
+
+    It requires the :mod:`zstandard` package to be installed."""
+
+    name = "zstd"
+    marker = b"\x02"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise ImportError("'zstandard' is not installed")
+        self.level: int = level
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: Union[bytes, memoryview]) -> bytes:
+        # The compressed frames contain the size of the original data, which is checked against the limit
+        try:
+            return self._decompressor.decompress(data, max_output_size=max_decompressed_size)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid compressed message: {e}")
+
+
+available_compressors: Dict[str, Compressor] = {ZlibCompressor.name: ZlibCompressor()}
+"""The compression algorithms that can be used in this process, indexed by name."""
+
+if zstandard is not None:
+    available_compressors[ZstdCompressor.name] = ZstdCompressor()
+
+_compressors_by_marker: Dict[int, Compressor] = {ord(c.marker): c for c in available_compressors.values()}
+
+default_compression_preferences: List[str] = ["zstd", "zlib"]
+"""The order in which compression algorithms are preferred if nothing else is specified."""
+
+
+def negotiate_compressor(preferences: Iterable[str]) -> Optional[Compressor]:
+    """Choose the first compression algorithm of the passed list that is available in this process.
+
+    Returns:
+        The chosen :class:`Compressor`, or :const:`None` if none of them is available."""
+    for name in preferences:
+        compressor = available_compressors.get(name)
+        if compressor is not None:
+            return compressor
+    return None
+
+
+def compress_message(message: bytes, compressor: Optional[Compressor], threshold: Optional[int]) -> bytes:
+    """Compress a message, if a :class:`Compressor` has been negotiated and the message is at least ``threshold``
+    bytes long.
+
+    The message is sent uncompressed if compressing it doesn't make it smaller."""
+    if compressor is None or threshold is None or len(message) < threshold:
+        return message
+    compressed = compressor.marker + compressor.compress(message)
+    if len(compressed) >= len(message):
+        return message
+    return compressed
+
+
+def decompress_message(message: Union[bytes, str]) -> Union[bytes, str]:
+    """Decompress a message if it starts with the marker of a :class:`Compressor`, otherwise return it unchanged.
+
+    Raises:
+        :exc:`ValueError` if the message was compressed with an unavailable algorithm, or is too large."""
+    if not isinstance(message, bytes) or not message or message[0] > 0x1f:
+        return message
+    compressor = _compressors_by_marker.get(message[0])
+    if compressor is None:
+        raise ValueError(f"Unsupported compression marker: {message[0]}")
+    return compressor.decompress(memoryview(message)[1:])
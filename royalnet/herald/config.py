@@ -1,4 +1,11 @@
-from typing import Optional
+from typing import Optional, List
+import os
+import ssl
+import socket
+import tempfile
+from .outboundqueue import overflow_policies
+from .auth import auth_methods
+from .transports import transport_of
 
 
 class Config:
@@ -8,7 +15,39 @@ class Config:
                  port: int,
                  secret: str,
                  secure: bool = False,
-                 path: str = "/"
+                 path: str = "/",
+                 codecs: Optional[List[str]] = None,
+                 max_handlers: int = 32,
+                 request_timeout: Optional[float] = 300.0,
+                 reconnect: bool = False,
+                 reconnect_min_delay: float = 0.5,
+                 reconnect_max_delay: float = 60.0,
+                 send_buffer_size: int = 256,
+                 client_queue_size: int = 256,
+                 overflow_policy: str = "block",
+                 starvation_limit: int = 8,
+                 batch: bool = True,
+                 batch_max_packages: int = 64,
+                 batch_max_bytes: int = 65536,
+                 shards: int = 1,
+                 shards_path: Optional[str] = None,
+                 node_name: Optional[str] = None,
+                 peers: Optional[List[str]] = None,
+                 metrics: bool = False,
+                 metrics_port: Optional[int] = None,
+                 compact_ids: bool = False,
+                 compression: Optional[List[str]] = None,
+                 compression_threshold: Optional[int] = 16384,
+                 websocket_compression: bool = False,
+                 stream_window: int = 16,
+                 certfile: Optional[str] = None,
+                 keyfile: Optional[str] = None,
+                 cafile: Optional[str] = None,
+                 tls_hostname: Optional[str] = None,
+                 auth: str = "plaintext",
+                 url: Optional[str] = None,
+                 heartbeat_interval: Optional[float] = 15.0,
+                 heartbeat_timeout: float = 45.0
                  ):
         if ":" in name:
             raise ValueError("Herald names cannot contain colons (:)")
@@ -30,24 +69,294 @@ class Config:
             raise ValueError("Herald paths must start with a slash (/)")
         self.path = path
 
+        self.codecs: Optional[List[str]] = codecs
+        """The names of the codecs that should be used for packages, in order of preference.
+
+        If :const:`None`, the default preferences are used."""
+
+        if max_handlers < 1:
+            raise ValueError("Herald max_handlers must be at least 1")
+        self.max_handlers: int = max_handlers
+        """The maximum number of requests and broadcasts that a :class:`Link` will handle at the same time."""
+
+        self.request_timeout: Optional[float] = request_timeout
+        """The default number of seconds a :class:`Link` waits for a :class:`Response` before giving up.
+        
+        If :const:`None`, wait forever."""
+
+        self.reconnect: bool = reconnect
+        """Should a :class:`Link` reconnect to the :class:`Server` when the connection is lost?"""
+
+        if reconnect_min_delay <= 0 or reconnect_max_delay < reconnect_min_delay:
+            raise ValueError("Invalid Herald reconnection delays")
+        self.reconnect_min_delay: float = reconnect_min_delay
+        """The maximum number of seconds to wait before the first reconnection attempt."""
+
+        self.reconnect_max_delay: float = reconnect_max_delay
+        """The maximum number of seconds to wait between two reconnection attempts."""
+
+        if send_buffer_size < 1:
+            raise ValueError("Herald send_buffer_size must be at least 1")
+        self.send_buffer_size: int = send_buffer_size
+        """The maximum number of packages a :class:`Link` can queue while it isn't connected to the :class:`Server`."""
+
+        if client_queue_size < 1:
+            raise ValueError("Herald client_queue_size must be at least 1")
+        self.client_queue_size: int = client_queue_size
+        """The maximum number of packages the :class:`Server` can queue for each connected client."""
+
+        if overflow_policy not in overflow_policies:
+            raise ValueError(f"Herald overflow_policy must be one of {', '.join(overflow_policies)}")
+        self.overflow_policy: str = overflow_policy
+        """What the :class:`Server` should do when the queue of a client is full: ``block`` the sender, 
+        ``drop_oldest`` package in the queue, or ``disconnect`` the slow client."""
+
+        if starvation_limit < 1:
+            raise ValueError("Herald starvation_limit must be at least 1")
+        self.starvation_limit: int = starvation_limit
+        """The maximum number of interactive packages that can be sent or handled in a row while a bulk package is
+        waiting for its turn."""
+
+        self.batch: bool = batch
+        """Should multiple packages be sent in a single message, if the other side supports it?
+        
+        Only the packages that are already waiting to be sent are batched together, so no latency is added."""
+
+        if batch_max_packages < 1:
+            raise ValueError("Herald batch_max_packages must be at least 1")
+        self.batch_max_packages: int = batch_max_packages
+        """The maximum number of packages that can be sent in a single message."""
+
+        self.batch_max_bytes: int = batch_max_bytes
+        """The maximum size of a message containing multiple packages."""
+
+        if shards < 1:
+            raise ValueError("Herald shards must be at least 1")
+        self.shards: int = shards
+        """The number of processes the :class:`Server` should be split into.
+        
+        All the processes listen on the same port, and are connected to each other through unix sockets."""
+
+        self.shards_path: str = shards_path if shards_path else tempfile.gettempdir()
+        """The directory where the unix sockets connecting the :class:`Server` shards are created."""
+
+        self.node_name: str = node_name if node_name else f"{socket.gethostname()}:{port}"
+        """The name of the :class:`Server` when peering with other servers. It must be unique among the peers."""
+
+        self.peers: List[str] = peers if peers else []
+        """The URLs of the other :class:`Server` this one should connect to, sharing with them the connected clients.
+        
+        The peers must have the same :attr:`.secret`."""
+
+        self.metrics: bool = metrics or metrics_port is not None
+        """Should the :class:`Server` collect metrics about the routed packages?
+        
+        They can be requested by sending a ``metrics`` :class:`Request` to ``<server>``."""
+
+        if metrics_port is not None and (metrics_port < 0 or metrics_port > 65535):
+            raise ValueError("No such port")
+        self.metrics_port: Optional[int] = metrics_port
+        """The port on which the :class:`Server` should expose its metrics in the Prometheus text format, if any.
+        
+        If the :class:`Server` is split in multiple shards, each one uses the following port."""
+
+        self.compact_ids: bool = compact_ids
+        """Should a :class:`Link` use a base64 nid and integer conv_ids instead of UUID strings?
+        
+        Enable it only if the :class:`Server` has been updated too: older servers parse the destination of every
+        package as an UUID, so they can't route anything to a :class:`Link` with a compact nid."""
+
+        self.compression: Optional[List[str]] = compression
+        """The names of the compression algorithms that can be used for large messages, in order of preference.
+
+        If :const:`None`, the default preferences are used."""
+
+        if compression_threshold is not None and compression_threshold < 0:
+            raise ValueError("Herald compression_threshold cannot be negative")
+        self.compression_threshold: Optional[int] = compression_threshold
+        """The minimum size in bytes of a message to be compressed; if :const:`None`, messages are never compressed."""
+
+        self.websocket_compression: bool = websocket_compression
+        """Should the websocket ``permessage-deflate`` extension be used, compressing every message?"""
+
+        if stream_window < 1:
+            raise ValueError("Herald stream_window must be at least 1")
+        self.stream_window: int = stream_window
+        """The maximum number of chunks of a streamed response that can be received but not consumed yet; the
+        sender waits for them to be consumed before sending more."""
+
+        self.certfile: Optional[str] = certfile
+        """The path of the PEM file containing the certificate chain of the :class:`Server`, required if
+        :attr:`.secure` is enabled."""
+
+        self.keyfile: Optional[str] = keyfile
+        """The path of the private key of the :class:`Server`, if it isn't included in the :attr:`.certfile`."""
+
+        self.cafile: Optional[str] = cafile
+        """The path of the certificates used to verify the :class:`Server`; if :const:`None`, the system ones are
+        used."""
+
+        self.tls_hostname: Optional[str] = tls_hostname
+        """The hostname the certificate of the :class:`Server` is checked against, if different from
+        :attr:`.address`."""
+
+        if auth not in auth_methods:
+            raise ValueError(f"Herald auth must be one of {', '.join(auth_methods)}")
+        self.auth: str = auth
+        """How the :class:`Link` proves that it knows the secret: ``hmac`` never sends the secret over the network,
+        ``plaintext`` is compatible with older versions of Royalnet.
+
+        A :class:`Server` always accepts ``hmac``, and accepts ``plaintext`` only if it is set here.
+        Older servers only understand ``plaintext`` and older links only send it, so ``hmac`` should be enabled only
+        once every :class:`Link` and the :class:`Server` have been updated."""
+
+        if url is not None:
+            transport_of(url)
+        self._url: Optional[str] = url
+        """The URL of the :class:`Server`, if it shouldn't be built from :attr:`.address`, :attr:`.port`,
+        :attr:`.secure` and :attr:`.path`; its scheme chooses the transport, see :data:`transports`."""
+
+        if self.shards > 1 and self.transport not in ("ws", "wss"):
+            raise ValueError("Only Herald servers listening on TCP can be split into shards")
+
+        if heartbeat_interval is not None and heartbeat_interval < 0:
+            raise ValueError("Herald heartbeat_interval cannot be negative")
+        self.heartbeat_interval: Optional[float] = heartbeat_interval or None
+        """The seconds after which a heartbeat is sent to the other side of an idle connection, so that it knows that
+        this side is still alive; if :const:`None` or ``0``, heartbeats are disabled."""
+
+        if self.heartbeat_interval is not None and heartbeat_timeout <= self.heartbeat_interval:
+            raise ValueError("Herald heartbeat_timeout must be greater than heartbeat_interval")
+        self.heartbeat_timeout: float = heartbeat_timeout
+        """The seconds after which the other side of a connection is considered dead if nothing has been received from
+        it, if both sides have heartbeats enabled."""
+
+        self._server_ssl_context: Optional[ssl.SSLContext] = None
+        self._client_ssl_context: Optional[ssl.SSLContext] = None
+
     @property
     def url(self):
+        if self._url is not None:
+            return self._url
         return f"ws{'s' if self.secure else ''}://{self.address}:{self.port}{self.path}"
 
+    @property
+    def transport(self) -> str:
+        """The transport used to reach the :class:`Server`: ``ws``, ``wss``, ``ws+unix`` or ``memory``."""
+        return transport_of(self.url)
+
+    def server_ssl_context(self) -> ssl.SSLContext:
+        """Get the :class:`ssl.SSLContext` of the :class:`Server`.
+
+        It is created only once, so that the certificates aren't loaded again for every connection, and so that
+        the session tickets issued to the clients stay valid."""
+        if self._server_ssl_context is None:
+            if self.certfile is None:
+                raise ValueError("Secure Herald servers require a certfile")
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(self.certfile, self.keyfile)
+            self._server_ssl_context = context
+        return self._server_ssl_context
+
+    def client_ssl_context(self) -> ssl.SSLContext:
+        """Get the :class:`ssl.SSLContext` used to connect to a secure :class:`Server`.
+
+        It is created only once, so that the certificate authorities aren't loaded again at every reconnection.
+
+        Note that :mod:`asyncio` doesn't allow reusing the TLS session of a previous connection, so every reconnection
+        still performs a full handshake."""
+        if self._client_ssl_context is None:
+            self._client_ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=self.cafile)
+        return self._client_ssl_context
+
+    def shard_socket(self, shard: int) -> str:
+        """The path of the unix socket of a :class:`Server` shard."""
+        return os.path.join(self.shards_path, f"royalnet-herald-{self.port}-{shard}.sock")
+
     def copy(self,
              name: Optional[str] = None,
              address: Optional[str] = None,
              port: Optional[int] = None,
              secret: Optional[str] = None,
              secure: Optional[bool] = None,
-             path: Optional[str] = None):
+             path: Optional[str] = None,
+             codecs: Optional[List[str]] = None,
+             max_handlers: Optional[int] = None,
+             request_timeout: Optional[float] = None,
+             reconnect: Optional[bool] = None,
+             reconnect_min_delay: Optional[float] = None,
+             reconnect_max_delay: Optional[float] = None,
+             send_buffer_size: Optional[int] = None,
+             client_queue_size: Optional[int] = None,
+             overflow_policy: Optional[str] = None,
+             starvation_limit: Optional[int] = None,
+             batch: Optional[bool] = None,
+             batch_max_packages: Optional[int] = None,
+             batch_max_bytes: Optional[int] = None,
+             shards: Optional[int] = None,
+             shards_path: Optional[str] = None,
+             node_name: Optional[str] = None,
+             peers: Optional[List[str]] = None,
+             metrics: Optional[bool] = None,
+             metrics_port: Optional[int] = None,
+             compact_ids: Optional[bool] = None,
+             compression: Optional[List[str]] = None,
+             compression_threshold: Optional[int] = None,
+             websocket_compression: Optional[bool] = None,
+             stream_window: Optional[int] = None,
+             certfile: Optional[str] = None,
+             keyfile: Optional[str] = None,
+             cafile: Optional[str] = None,
+             tls_hostname: Optional[str] = None,
+             auth: Optional[str] = None,
+             url: Optional[str] = None,
+             heartbeat_interval: Optional[float] = None,
+             heartbeat_timeout: Optional[float] = None):
         """Create an exact copy of this configuration, but with different parameters."""
         return self.__class__(name=name if name else self.name,
                               address=address if address else self.address,
                               port=port if port else self.port,
                               secret=secret if secret else self.secret,
                               secure=secure if secure else self.secure,
-                              path=path if path else self.path)
+                              path=path if path else self.path,
+                              codecs=codecs if codecs else self.codecs,
+                              max_handlers=max_handlers if max_handlers else self.max_handlers,
+                              request_timeout=request_timeout if request_timeout else self.request_timeout,
+                              reconnect=reconnect if reconnect else self.reconnect,
+                              reconnect_min_delay=reconnect_min_delay if reconnect_min_delay
+                              else self.reconnect_min_delay,
+                              reconnect_max_delay=reconnect_max_delay if reconnect_max_delay
+                              else self.reconnect_max_delay,
+                              send_buffer_size=send_buffer_size if send_buffer_size else self.send_buffer_size,
+                              client_queue_size=client_queue_size if client_queue_size else self.client_queue_size,
+                              overflow_policy=overflow_policy if overflow_policy else self.overflow_policy,
+                              starvation_limit=starvation_limit if starvation_limit else self.starvation_limit,
+                              batch=batch if batch else self.batch,
+                              batch_max_packages=batch_max_packages if batch_max_packages
+                              else self.batch_max_packages,
+                              batch_max_bytes=batch_max_bytes if batch_max_bytes else self.batch_max_bytes,
+                              shards=shards if shards else self.shards,
+                              shards_path=shards_path if shards_path else self.shards_path,
+                              node_name=node_name if node_name else self.node_name,
+                              peers=peers if peers else self.peers,
+                              metrics=metrics if metrics else self.metrics,
+                              metrics_port=metrics_port if metrics_port else self.metrics_port,
+                              compact_ids=compact_ids if compact_ids is not None else self.compact_ids,
+                              compression=compression if compression else self.compression,
+                              compression_threshold=compression_threshold if compression_threshold
+                              else self.compression_threshold,
+                              websocket_compression=websocket_compression if websocket_compression is not None
+                              else self.websocket_compression,
+                              stream_window=stream_window if stream_window else self.stream_window,
+                              certfile=certfile if certfile else self.certfile,
+                              keyfile=keyfile if keyfile else self.keyfile,
+                              cafile=cafile if cafile else self.cafile,
+                              tls_hostname=tls_hostname if tls_hostname else self.tls_hostname,
+                              auth=auth if auth else self.auth,
+                              url=url if url else self._url,
+                              heartbeat_interval=heartbeat_interval if heartbeat_interval
+                              else self.heartbeat_interval,
+                              heartbeat_timeout=heartbeat_timeout if heartbeat_timeout else self.heartbeat_timeout)
 
     def __repr__(self):
         return f"<HeraldConfig for {self.url}>"
@@ -60,6 +369,38 @@ class Config:
                     secret: str,
                     secure: bool = False,
                     path: str = "/",
+                    codecs: Optional[List[str]] = None,
+                    max_handlers: int = 32,
+                    request_timeout: Optional[float] = 300.0,
+                    reconnect: bool = False,
+                    reconnect_min_delay: float = 0.5,
+                    reconnect_max_delay: float = 60.0,
+                    send_buffer_size: int = 256,
+                    client_queue_size: int = 256,
+                    overflow_policy: str = "block",
+                    starvation_limit: int = 8,
+                    batch: bool = True,
+                    batch_max_packages: int = 64,
+                    batch_max_bytes: int = 65536,
+                    shards: int = 1,
+                    shards_path: Optional[str] = None,
+                    node_name: Optional[str] = None,
+                    peers: Optional[List[str]] = None,
+                    metrics: bool = False,
+                    metrics_port: Optional[int] = None,
+                    compact_ids: bool = False,
+                    compression: Optional[List[str]] = None,
+                    compression_threshold: Optional[int] = 16384,
+                    websocket_compression: bool = False,
+                    stream_window: int = 16,
+                    certfile: Optional[str] = None,
+                    keyfile: Optional[str] = None,
+                    cafile: Optional[str] = None,
+                    tls_hostname: Optional[str] = None,
+                    auth: str = "plaintext",
+                    url: Optional[str] = None,
+                    heartbeat_interval: Optional[float] = 15.0,
+                    heartbeat_timeout: float = 45.0,
                     enabled: ... = ...
                     ):
         return cls(
@@ -68,5 +409,37 @@ class Config:
             port=port,
             secret=secret,
             secure=secure,
-            path=path
+            path=path,
+            codecs=codecs,
+            max_handlers=max_handlers,
+            request_timeout=request_timeout,
+            reconnect=reconnect,
+            reconnect_min_delay=reconnect_min_delay,
+            reconnect_max_delay=reconnect_max_delay,
+            send_buffer_size=send_buffer_size,
+            client_queue_size=client_queue_size,
+            overflow_policy=overflow_policy,
+            starvation_limit=starvation_limit,
+            batch=batch,
+            batch_max_packages=batch_max_packages,
+            batch_max_bytes=batch_max_bytes,
+            shards=shards,
+            shards_path=shards_path,
+            node_name=node_name,
+            peers=peers,
+            metrics=metrics,
+            metrics_port=metrics_port,
+            compact_ids=compact_ids,
+            compression=compression,
+            compression_threshold=compression_threshold,
+            websocket_compression=websocket_compression,
+            stream_window=stream_window,
+            certfile=certfile,
+            keyfile=keyfile,
+            cafile=cafile,
+            tls_hostname=tls_hostname,
+            auth=auth,
+            url=url,
+            heartbeat_interval=heartbeat_interval,
+            heartbeat_timeout=heartbeat_timeout
         )
@@ -16,3 +16,11 @@ class ConnectionClosedError(LinkError):
 
 class InvalidServerResponseError(LinkError):
     """The :py:class:`Server` sent invalid data to the :class:`Link`."""
+
+
+class RequestTimeoutError(LinkError):
+    """A :class:`Request` sent by a :class:`Link` didn't receive a :class:`Response` in time."""
+
+
+class QueueFullError(HeraldError):
+    """An :class:`OutboundQueue` is full, and its overflow policy doesn't allow waiting for free space."""
@@ -0,0 +1,146 @@
+from typing import *
+import asyncio as aio
+import collections
+import contextlib
+
+
+class PriorityLanes:
+    """Items waiting in a lane for each priority, from ``0`` (the most urgent) to ``lanes - 1``.
+
+    The most urgent items are always taken first, but after :attr:`.starvation_limit` items have been taken in a row
+    while a less urgent lane was waiting, an item of that lane is taken, so that it can't be delayed forever."""
+
+    def __init__(self, lanes: int = 2, starvation_limit: int = 8):
+        if lanes < 1:
+            raise ValueError("lanes must be at least 1")
+        if starvation_limit < 1:
+            raise ValueError("starvation_limit must be at least 1")
+        self.starvation_limit: int = starvation_limit
+        """The maximum number of more urgent items that can be taken while an item of a lane is waiting."""
+        self._lanes: List[Deque[Any]] = [collections.deque() for _ in range(lanes)]
+        self._passed_over: List[int] = [0] * lanes
+        """How many items have been taken from more urgent lanes since an item was last taken from each lane."""
+        self._length: int = 0
+
+    def __len__(self):
+        return self._length
+
+    def depth(self, priority: int) -> int:
+        """The number of items waiting in the lane of a priority."""
+        return len(self._lanes[priority])
+
+    def _next_lane(self) -> int:
+        waiting = [index for index, lane in enumerate(self._lanes) if lane]
+        if not waiting:
+            raise IndexError("No items are waiting")
+        for index in reversed(waiting[1:]):
+            if self._passed_over[index] >= self.starvation_limit:
+                return index
+        return waiting[0]
+
+    def append(self, item: Any, priority: int) -> None:
+        """Add an item to the end of the lane of its priority."""
+        self._lanes[priority].append(item)
+        self._length += 1
+
+    def remove(self, item: Any, priority: int) -> None:
+        """Remove an item from the lane of its priority, wherever it is.
+
+        Raises:
+            :exc:`ValueError` if the item isn't in the lane."""
+        self._lanes[priority].remove(item)
+        self._length -= 1
+
+    def peek(self) -> Any:
+        """Return the item that would be taken next, without taking it.
+
+        Raises:
+            :exc:`IndexError` if no items are waiting."""
+        return self._lanes[self._next_lane()][0]
+
+    def popleft(self) -> Any:
+        """Take the next item.
+
+        Raises:
+            :exc:`IndexError` if no items are waiting."""
+        lane = self._next_lane()
+        for index in range(lane + 1, len(self._lanes)):
+            if self._lanes[index]:
+                self._passed_over[index] += 1
+        self._passed_over[lane] = 0
+        self._length -= 1
+        return self._lanes[lane].popleft()
+
+    def drop(self) -> Any:
+        """Take the oldest item of the least urgent lane, to make space for another one.
+
+        Raises:
+            :exc:`IndexError` if no items are waiting."""
+        for lane in reversed(self._lanes):
+            if lane:
+                self._length -= 1
+                return lane.popleft()
+        raise IndexError("No items are waiting")
+
+
+class PrioritySemaphore:
+    """A semaphore that gives the released slots to the most urgent waiters first, with the same starvation protection
+    as :class:`PriorityLanes`."""
+
+    def __init__(self, value: int, *,
+                 lanes: int = 2,
+                 starvation_limit: int = 8,
+                 loop: aio.AbstractEventLoop = None):
+        if value < 1:
+            raise ValueError("value must be at least 1")
+        self._value: int = value
+        """The number of free slots."""
+        self._waiters: PriorityLanes = PriorityLanes(lanes, starvation_limit)
+        if loop is None:
+            self._loop = aio.get_event_loop()
+        else:
+            self._loop = loop
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self._value} free, {len(self._waiters)} waiting>"
+
+    def waiting(self, priority: int) -> int:
+        """The number of coroutines of a priority that are waiting for a slot."""
+        return self._waiters.depth(priority)
+
+    async def acquire(self, priority: int = 0) -> None:
+        """Take a free slot, waiting for one to be released if there are none."""
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future: aio.Future = self._loop.create_future()
+        self._waiters.append(future, priority)
+        try:
+            await future
+        except aio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was given to this coroutine right before it was cancelled: give it to someone else
+                self.release()
+            else:
+                with contextlib.suppress(ValueError):
+                    # release() may have already discarded the cancelled future
+                    self._waiters.remove(future, priority)
+            raise
+
+    def release(self) -> None:
+        """Give the slot to the next waiter, or free it if nobody is waiting."""
+        while self._waiters:
+            future: aio.Future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        """Hold a slot for the duration of an ``async with`` block."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
@@ -1,39 +1,33 @@
 from typing import *
 import asyncio as aio
 import uuid
+import random
+import collections
 import functools
+import itertools
 import logging
+import urllib.parse
 import websockets
-from .package import Package
+import royalnet.utils as ru
+from .codecs import Codec, json_codec, available_codecs, default_codec_preferences
+from .package import Package, ConvId, PRIORITY_INTERACTIVE
 from .request import Request
-from .response import Response, ResponseSuccess, ResponseFailure
+from .response import Response, ResponseSuccess, ResponseFailure, ResponseChunk, response_from_dict
 from .broadcast import Broadcast
-from .errors import ConnectionClosedError, InvalidServerResponseError
+from .stream import StreamCredit, CreditWindow, ResponseStream
+from .outboundqueue import OutboundQueue
+from .lanes import PrioritySemaphore
+from .compression import Compressor, compress_message, decompress_message
+from .compression import available_compressors, default_compression_preferences
+from .auth import new_nonce, identify_digest, server_proof, compare
+from . import transports
+from .errors import ConnectionClosedError, InvalidServerResponseError, RequestTimeoutError
 from .config import Config
 
 
 log = logging.getLogger(__name__)
 
 
-class PendingRequest:
-    def __init__(self, *, loop: aio.AbstractEventLoop = None):
-        if loop is None:
-            self.loop = aio.get_event_loop()
-        else:
-            self.loop = loop
-        self.event: aio.Event = aio.Event(loop=loop)
-        self.data: Optional[dict] = None
-
-    def __repr__(self):
-        if self.event.is_set():
-            return f"<{self.__class__.__qualname__}: {self.data.__class__.__name__}>"
-        return f"<{self.__class__.__qualname__}>"
-
-    def set(self, data):
-        self.data = data
-        self.event.set()
-
-
 def requires_connection(func):
     @functools.wraps(func)
     async def new_func(self, *args, **kwargs):
@@ -42,23 +36,46 @@ def requires_connection(func):
     return new_func
 
 
-def requires_identification(func):
-    @functools.wraps(func)
-    async def new_func(self, *args, **kwargs):
-        await self.identify_event.wait()
-        return await func(self, *args, **kwargs)
-    return new_func
-
-
 class Link:
     def __init__(self, config: Config, request_handler, *,
                  loop: aio.AbstractEventLoop = None):
         self.config: Config = config
-        self.nid: str = str(uuid.uuid4())
+        if self.config.compact_ids:
+            self.nid: str = ru.to_urluuid(uuid.uuid4())
+        else:
+            self.nid: str = str(uuid.uuid4())
+        self._conv_ids: Iterator[int] = itertools.count(1)
+        """The generator of the conv_ids of the packages sent by this :class:`Link`, if :attr:`Config.compact_ids`
+        is enabled."""
         self.websocket: Optional["websockets.WebSocketClientProtocol"] = None
         self.request_handler: Callable[[Union[Request, Broadcast]],
-                                       Awaitable[Response]] = request_handler
-        self._pending_requests: Dict[str, PendingRequest] = {}
+                                       Awaitable[Union[Response, AsyncIterator[Response]]]] = request_handler
+        """The function handling the received requests and broadcasts.
+
+        To stream a response, it can return an asynchronous iterator of :class:`ResponseChunk`, optionally ended by a
+        :class:`ResponseSuccess` or a :class:`ResponseFailure`."""
+        self._pending_requests: Dict[ConvId, aio.Future] = {}
+        """The requests sent by this :class:`Link` that are still waiting for a response, indexed by conv_id."""
+        self._pending_streams: Dict[ConvId, ResponseStream] = {}
+        """The streamed responses that are being received by this :class:`Link`, indexed by the conv_id of their
+        request."""
+        self._outgoing_streams: Dict[ConvId, CreditWindow] = {}
+        """The credit granted to the streamed responses that are being sent by this :class:`Link`, indexed by the
+        conv_id of their chunks."""
+        self.codec: Codec = json_codec
+        """The :class:`Codec` negotiated with the :class:`Server` during the identification."""
+        self.batching: bool = False
+        """Whether sending multiple packages in a single message was negotiated with the :class:`Server`."""
+        self.compressor: Optional[Compressor] = None
+        """The :class:`Compressor` negotiated with the :class:`Server` for large messages, if any."""
+        self.server_heartbeat: Optional[float] = None
+        """The interval of the heartbeats sent by the :class:`Server`, if heartbeats were negotiated."""
+        self.last_received: float = 0.0
+        """The :meth:`loop.time` at which the last message was received from the :class:`Server`."""
+        self.last_sent: float = 0.0
+        """The :meth:`loop.time` at which the last message was sent to the :class:`Server`."""
+        self._received: Deque[Package] = collections.deque()
+        """The packages received in a batch that haven't been returned by :meth:`.receive` yet."""
         if loop is None:
             self._loop = aio.get_event_loop()
         else:
@@ -66,6 +83,35 @@ class Link:
         self.error_event: aio.Event = aio.Event(loop=self._loop)
         self.connect_event: aio.Event = aio.Event(loop=self._loop)
         self.identify_event: aio.Event = aio.Event(loop=self._loop)
+        self._send_queue: OutboundQueue = OutboundQueue(self.config.send_buffer_size, "block",
+                                                          starvation_limit=self.config.starvation_limit,
+                                                          loop=self._loop)
+        """The packages waiting to be sent to the :class:`Server`, with the :class:`Codec` they were encoded with,
+        in a lane for each priority."""
+        self._unsent_requests: Set[ConvId] = set()
+        """The conv_ids of the pending requests whose package hasn't been sent yet."""
+        self._reconnect_attempts: int = 0
+        self._handler_semaphore: PrioritySemaphore = PrioritySemaphore(self.config.max_handlers,
+                                                                       starvation_limit=self.config.starvation_limit,
+                                                                       loop=self._loop)
+        """The handler slots, given to the waiting requests and broadcasts in order of priority."""
+        self._handler_tasks: Set[aio.Task] = set()
+        self.handlers_running: int = 0
+        """The number of requests and broadcasts that are currently being handled."""
+        self.handlers_completed: int = 0
+        """The number of requests and broadcasts that have been handled successfully."""
+        self.handlers_failed: int = 0
+        """The number of requests and broadcasts whose handler raised an exception."""
+
+    @property
+    def handlers_in_flight(self) -> int:
+        """The number of requests and broadcasts that have been received, but whose handling isn't complete yet."""
+        return len(self._handler_tasks)
+
+    @property
+    def handlers_waiting(self) -> int:
+        """The number of requests and broadcasts that are waiting for a free handler slot."""
+        return self.handlers_in_flight - self.handlers_running
 
     def __repr__(self):
         if self.identify_event.is_set():
@@ -80,7 +126,23 @@ class Link:
     async def connect(self):
         """Connect to the :class:`Server` at :attr:`.config.url`."""
         log.debug(f"Connecting to Herald Server at {self.config.url}...")
-        self.websocket = await websockets.connect(self.config.url, loop=self._loop)
+        kwargs = {}
+        if self.config.transport == "wss":
+            # The same context is reused at every reconnection
+            kwargs["ssl"] = self.config.client_ssl_context()
+            if self.config.tls_hostname is not None:
+                kwargs["server_hostname"] = self.config.tls_hostname
+        self.websocket = await transports.connect(self.config.url,
+                                                  compression="deflate" if self.config.websocket_compression else None,
+                                                  loop=self._loop,
+                                                  **kwargs)
+        # Packages are always encoded in JSON and sent one at a time until something else is negotiated
+        self.codec = json_codec
+        self.batching = False
+        self.compressor = None
+        self.server_heartbeat = None
+        self.last_received = self.last_sent = self._loop.time()
+        self.error_event.clear()
         self.connect_event.set()
         log.debug(f"Connected!")
 
@@ -91,15 +153,21 @@ class Link:
         Raises:
             :exc:`ConnectionClosedError` if the connection is closed."""
         try:
-            jbytes: bytes = await self.websocket.recv()
-            package: Package = Package.from_json_bytes(jbytes)
+            if self._received:
+                package: Package = self._received.popleft()
+            else:
+                jbytes: bytes = decompress_message(await self.websocket.recv())
+                self.last_received = self._loop.time()
+                package, *others = Package.from_bytes_multi(jbytes, self.codec)
+                self._received.extend(others)
         except websockets.ConnectionClosed:
-            self.error_event.set()
-            self.connect_event.clear()
-            self.identify_event.clear()
             log.warning(f"Herald Server connection closed: {self.config.url}")
-            # What to do now? Let's just reraise.
-            raise ConnectionClosedError()
+            raise self._receive_failed()
+        except (ValueError, KeyError, TypeError) as e:
+            # The next messages would fail in the same way: drop the connection, as if it were a protocol error
+            log.error(f"Invalid message from the Herald Server {self.config.url}: {e!r}")
+            await self.websocket.close(code=1002, reason="Invalid message")
+            raise self._receive_failed()
         if self.identify_event.is_set() and package.destination != self.nid:
             raise InvalidServerResponseError("Package is not addressed to this NetworkLink.")
         log.debug(f"Received package: {package}")
@@ -108,79 +176,485 @@ class Link:
     @requires_connection
     async def identify(self) -> None:
         log.debug(f"Identifying...")
-        await self.websocket.send(f"Identify {self.nid}:{self.config.name}:{self.config.secret}")
+        options = {
+            # Don't let the server choose a codec this process couldn't decode
+            "codecs": ",".join(name for name in self.config.codecs or default_codec_preferences
+                               if name in available_codecs)
+        }
+        if self.config.batch:
+            options["batch"] = "1"
+        if self.config.compression_threshold is not None:
+            # Don't let the server choose an algorithm this process couldn't decompress
+            compression = [name for name in self.config.compression or default_compression_preferences
+                           if name in available_compressors]
+            if compression:
+                options["compression"] = ",".join(compression)
+        if self.config.heartbeat_interval is not None:
+            options["heartbeat"] = str(self.config.heartbeat_interval)
+        options = urllib.parse.urlencode(options)
+        if self.config.auth == "hmac":
+            # Never send the secret: prove to know it by sending an HMAC of the nonces instead
+            client_nonce = new_nonce()
+            await self.websocket.send(f"Hello {client_nonce}")
+            challenge = await self._receive_service("challenge")
+            server_nonce = challenge.data["nonce"]
+            if not compare(challenge.data["proof"], server_proof(self.config.secret, client_nonce, server_nonce)):
+                raise InvalidServerResponseError("The server doesn't know the secret.")
+            credential = identify_digest(self.config.secret, client_nonce, server_nonce, self.nid, self.config.name)
+        else:
+            credential = self.config.secret
+        await self.websocket.send(f"Identify {self.nid}:{self.config.name}:{credential}:{options}")
+        response: Package = await self._receive_service("success")
+        # Servers that don't support codecs won't send any option
+        options = response.data.get("options", {})
+        codec = available_codecs.get(options.get("codec", json_codec.name))
+        if codec is None:
+            raise InvalidServerResponseError(f"The server chose an unavailable codec: {options['codec']}")
+        self.codec = codec
+        self.batching = options.get("batch", False)
+        if options.get("compression"):
+            self.compressor = available_compressors.get(options["compression"])
+            if self.compressor is None:
+                raise InvalidServerResponseError(f"The server chose an unavailable compression algorithm: "
+                                                 f"{options['compression']}")
+        else:
+            self.compressor = None
+        # Servers that don't send heartbeats may stay silent for any time
+        self.server_heartbeat = options.get("heartbeat") if self.config.heartbeat_interval is not None else None
+        self._reconnect_attempts = 0
+        self.identify_event.set()
+        log.debug(f"Identified successfully! (codec: {self.codec.name}, batching: {self.batching})")
+
+    async def _receive_service(self, msg_type: str) -> Package:
+        """Receive a service package sent by the :class:`Server` during the identification.
+
+        Raises:
+            :exc:`ConnectionClosedError` if the identification was refused.
+            :exc:`InvalidServerResponseError` if the package isn't of the expected type."""
         response: Package = await self.receive()
         if not response.source == "<server>":
             raise InvalidServerResponseError("Received a non-service package before identification.")
         if "type" not in response.data:
             raise InvalidServerResponseError("Missing 'type' in response data")
         if response.data["type"] == "error":
-            raise ConnectionClosedError(f"Identification error: {response.data['type']}")
-        assert response.data["type"] == "success"
-        self.identify_event.set()
-        log.debug(f"Identified successfully!")
+            raise ConnectionClosedError(f"Identification error: {response.data.get('service')}")
+        if response.data["type"] != msg_type:
+            raise InvalidServerResponseError(f"Expected a '{msg_type}' service package, got '{response.data['type']}'")
+        return response
+
+    def _receive_failed(self) -> ConnectionClosedError:
+        """Handle the loss of the connection while receiving.
+
+        Returns:
+            The :exc:`ConnectionClosedError` to raise, so that :meth:`.run` can decide whether to reconnect or not."""
+        self._connection_lost()
+        # The responses to the requests that were already sent will never arrive
+        self._fail_pending_requests(ConnectionClosedError("The connection was closed before the response arrived"),
+                                    include_unsent=not self.config.reconnect)
+        return ConnectionClosedError()
+
+    def _connection_lost(self) -> None:
+        self.error_event.set()
+        self.connect_event.clear()
+        self.identify_event.clear()
 
-    @requires_identification
     async def send(self, package: Package):
-        """Send a package to the :class:`Server`."""
+        """Send a package to the :class:`Server`.
+
+        The package is put in a queue of at most :attr:`.config.send_buffer_size` packages, which is sent as soon as
+        the :class:`Link` is identified; if the queue is full, wait until there's space for the package.
+
+        Packages with :data:`PRIORITY_INTERACTIVE` are sent before the ones with :data:`PRIORITY_BULK` that are already
+        in the queue, but never more than :attr:`.config.starvation_limit` in a row.
+
+        Raises:
+            :exc:`ConnectionClosedError` if the connection was closed and :attr:`.config.reconnect` is disabled."""
+        if self.error_event.is_set() and not self.config.reconnect:
+            raise ConnectionClosedError("The connection was closed, and the Link is not going to reconnect.")
         log.debug(f"Trying to send package: {package}")
         try:
-            jbytes = package.to_json_bytes()
+            jbytes = package.to_bytes(self.codec)
         except TypeError as e:
             log.fatal(f"Could not send package: {' '.join(e.args)}")
             raise
-        await self.websocket.send(jbytes)
-        log.debug(f"Sent package: {package}")
+        await self._send_queue.put((self.codec, jbytes, package), package.priority)
+        log.debug(f"Queued package: {package}")
+
+    async def _writer(self):
+        """Send the queued packages to the :class:`Server` as soon as the :class:`Link` is identified.
 
-    @requires_identification
-    async def broadcast(self, destination: str, broadcast: Broadcast) -> None:
-        package = Package(broadcast.to_dict(), source=self.nid, destination=destination)
+        If batching was negotiated, all the packages that are waiting in the queue are sent in a single message."""
+        while True:
+            items = await self._send_queue.get_batch(self.config.batch_max_packages,
+                                                     self.config.batch_max_bytes,
+                                                     size=lambda item: len(item[1]))
+            while items:
+                await self.identify_event.wait()
+                # The codec may have changed after a reconnection
+                items = [(codec, jbytes, package) if codec is self.codec
+                         else (self.codec, package.to_bytes(self.codec), package)
+                         for codec, jbytes, package in items]
+                count = len(items) if self.batching else 1
+                if count > 1:
+                    message = self.codec.join([jbytes for codec, jbytes, package in items])
+                else:
+                    message = items[0][1]
+                try:
+                    await self.websocket.send(compress_message(message, self.compressor,
+                                                               self.config.compression_threshold))
+                    self.last_sent = self._loop.time()
+                except websockets.ConnectionClosed:
+                    # Keep the packages and try again after the reconnection
+                    self._connection_lost()
+                    continue
+                for codec, jbytes, package in items[:count]:
+                    self._unsent_requests.discard(package.source_conv_id)
+                    log.debug(f"Sent package: {package}")
+                items = items[count:]
+
+    async def _heartbeat(self):
+        """Send a heartbeat to the :class:`Server` when nothing has been sent to it in
+        :attr:`.config.heartbeat_interval`, and drop the connection if nothing has been received from it in
+        :attr:`.config.heartbeat_timeout`."""
+        interval = self.config.heartbeat_interval
+        while True:
+            await aio.sleep(interval / 2)
+            if not self.identify_event.is_set() or self.server_heartbeat is None:
+                continue
+            now = self._loop.time()
+            timeout = max(self.config.heartbeat_timeout, self.server_heartbeat * 3)
+            if now - self.last_received > timeout:
+                log.warning(f"Nothing was received from the Herald Server in {timeout:g}s, dropping the connection")
+                self._connection_lost()
+                # Don't wait for the closing handshake, which may never complete, to fail the requests
+                self._fail_pending_requests(ConnectionClosedError("The Herald Server stopped sending heartbeats"),
+                                            include_unsent=not self.config.reconnect)
+                self._loop.create_task(self.websocket.close(code=1011, reason="Heartbeat timeout"))
+            # If the queue isn't empty something is already being sent, or the connection is stuck
+            elif now - self.last_sent >= interval and not len(self._send_queue):
+                await self.send(Package({"type": "heartbeat"}, source=self.nid, destination="<server>",
+                                        source_conv_id=self._next_conv_id()))
+
+    def _next_conv_id(self) -> Optional[ConvId]:
+        """Get the conv_id of a new package, or :const:`None` to use an UUID."""
+        if self.config.compact_ids:
+            return next(self._conv_ids)
+        return None
+
+    async def broadcast(self, destination: str, broadcast: Broadcast, *,
+                        priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Send a :class:`Broadcast` to one or more other :class:`Link`.
+
+        Parameters:
+            destination: The ``nid`` or the ``link_type`` of the destination, or ``*`` followed by a ``link_type``.
+            broadcast: The :class:`Broadcast` to send.
+            priority: The priority of the broadcast; use :data:`PRIORITY_BULK` for broadcasts nobody is waiting for,
+                      so that they don't delay the requests."""
+        package = Package(broadcast.to_dict(), source=self.nid, destination=destination,
+                          source_conv_id=self._next_conv_id(), priority=priority)
         await self.send(package)
         log.debug(f"Sent broadcast to {destination}: {broadcast}")
 
-    @requires_identification
-    async def request(self, destination: str, request: Request) -> Response:
+    async def request(self, destination: str, request: Request, *,
+                      timeout: Optional[float] = ...,
+                      priority: int = PRIORITY_INTERACTIVE) -> Response:
+        """Send a :class:`Request` to another :class:`Link` and wait for its :class:`Response`.
+
+        Parameters:
+            destination: The ``nid`` or the ``link_type`` of the destination.
+            request: The :class:`Request` to send.
+            timeout: The maximum number of seconds to wait for the response.
+                     If not specified, :attr:`.config.request_timeout` is used; if :const:`None`, wait forever.
+            priority: The priority of the request, also used by the destination for its response.
+
+        Raises:
+            :exc:`RequestTimeoutError` if no response is received in time.
+            :exc:`ConnectionClosedError` if the connection is closed before receiving a response."""
         if destination.startswith("*"):
             raise ValueError("requests cannot have multiple destinations")
-        package = Package(request.to_dict(), source=self.nid, destination=destination)
-        request = PendingRequest(loop=self._loop)
-        self._pending_requests[package.source_conv_id] = request
-        await self.send(package)
-        log.debug(f"Sent request to {destination}: {request}")
-        await request.event.wait()
-        if request.data["type"] == "ResponseSuccess":
-            response: Response = ResponseSuccess.from_dict(request.data)
-        elif request.data["type"] == "ResponseFailure":
-            response: Response = ResponseFailure.from_dict(request.data)
-        else:
-            raise TypeError("Unknown response type")
+        if timeout is ...:
+            timeout = self.config.request_timeout
+        package = Package(request.to_dict(), source=self.nid, destination=destination,
+                          source_conv_id=self._next_conv_id(), priority=priority)
+        future: aio.Future = self._loop.create_future()
+        self._pending_requests[package.source_conv_id] = future
+        self._unsent_requests.add(package.source_conv_id)
+        try:
+            await self.send(package)
+            log.debug(f"Sent request to {destination}: {request}")
+            try:
+                data: dict = await aio.wait_for(future, timeout=timeout)
+            except aio.TimeoutError:
+                raise RequestTimeoutError(f"{destination} didn't respond to {request} in {timeout}s")
+        finally:
+            del self._pending_requests[package.source_conv_id]
+            self._unsent_requests.discard(package.source_conv_id)
+        response: Response = response_from_dict(data)
         log.debug(f"Received from {destination}: {request} -> {response}")
         return response
 
-    async def run(self):
-        """Blockingly run the Link."""
-        log.debug(f"Running link: {self.config.name}")
-        if self.error_event.is_set():
-            raise ConnectionClosedError("RoyalnetLinks can't be rerun after an error.")
+    async def request_stream(self, destination: str, request: Request, *,
+                             window: Optional[int] = None,
+                             timeout: Optional[float] = ...,
+                             priority: int = PRIORITY_INTERACTIVE) -> ResponseStream:
+        """Send a :class:`Request` to another :class:`Link`, asking for its response to be streamed.
+
+        Handlers that don't stream their response send it as a single chunk.
+
+        Parameters:
+            destination: The ``nid`` or the ``link_type`` of the destination.
+            request: The :class:`Request` to send.
+            window: The maximum number of chunks that can be received but not consumed yet.
+                    If not specified, :attr:`.config.stream_window` is used.
+            timeout: The maximum number of seconds to wait for each chunk.
+                     If not specified, :attr:`.config.request_timeout` is used; if :const:`None`, wait forever.
+            priority: The priority of the request, also used by the destination for the chunks of the response.
+
+        Returns:
+            The :class:`ResponseStream` to iterate on."""
+        if destination.startswith("*"):
+            raise ValueError("requests cannot have multiple destinations")
+        if window is None:
+            window = self.config.stream_window
+        if timeout is ...:
+            timeout = self.config.request_timeout
+        request = Request(request.handler, request.data, stream=window)
+        package = Package(request.to_dict(), source=self.nid, destination=destination,
+                          source_conv_id=self._next_conv_id(), priority=priority)
+        stream = ResponseStream(self, destination, request, package.source_conv_id,
+                                window=window, timeout=timeout, loop=self._loop)
+        self._pending_streams[package.source_conv_id] = stream
+        self._unsent_requests.add(package.source_conv_id)
+        try:
+            await self.send(package)
+        except Exception:
+            self._forget_stream(stream)
+            raise
+        log.debug(f"Sent stream request to {destination}: {request}")
+        return stream
+
+    def _forget_stream(self, stream: ResponseStream) -> None:
+        """Stop routing the received chunks to a :class:`ResponseStream`."""
+        self._pending_streams.pop(stream.conv_id, None)
+        self._unsent_requests.discard(stream.conv_id)
+
+    def _fail_pending_requests(self, exc: Exception, include_unsent: bool = True) -> None:
+        """Make the pending requests raise an exception.
+
+        Parameters:
+            exc: The exception to raise.
+            include_unsent: Fail also the requests that are still waiting in the send queue."""
+        for conv_id, future in self._pending_requests.items():
+            if not include_unsent and conv_id in self._unsent_requests:
+                continue
+            if not future.done():
+                future.set_exception(exc)
+        for conv_id, stream in list(self._pending_streams.items()):
+            if not include_unsent and conv_id in self._unsent_requests:
+                continue
+            stream._fail(exc)
+
+    def _dispatch(self, package: Package) -> None:
+        """Handle a request or a broadcast in a new task, so that the :meth:`.run` loop can keep receiving."""
+        task = self._loop.create_task(self._handle(package))
+        self._handler_tasks.add(task)
+        task.add_done_callback(self._handler_tasks.discard)
+
+    async def _handle(self, package: Package) -> None:
+        """Call the :attr:`.request_handler` on a request or a broadcast, limiting the number of concurrent calls to
+        :attr:`.config.max_handlers`.
+
+        When all the slots are busy, the packages with :data:`PRIORITY_INTERACTIVE` get the first free slot."""
+        async with self._handler_semaphore.slot(package.priority):
+            self.handlers_running += 1
+            try:
+                # Package is a request
+                if package.data["msg_type"] == "Request":
+                    log.debug(f"Received request {package.source_conv_id}: {package}")
+                    request = Request.from_dict(package.data)
+                    try:
+                        response = await self.request_handler(request)
+                        if request.stream is not None:
+                            await self._send_stream(package, response, request.stream)
+                            self.handlers_completed += 1
+                            return
+                        if not isinstance(response, Response):
+                            response = await self._collect_stream(response)
+                    except Exception as e:
+                        ru.sentry_exc(e)
+                        response = ResponseFailure("unhandled_exception_in_event",
+                                                   f"The request handler raised an unhandled"
+                                                   f" {e.__class__.__qualname__}.",
+                                                   extra_info={
+                                                       "type": e.__class__.__qualname__,
+                                                       "message": str(e)
+                                                   })
+                        self.handlers_failed += 1
+                    else:
+                        self.handlers_completed += 1
+                    response_package: Package = package.reply(response.to_dict(),
+                                                              source_conv_id=self._next_conv_id())
+                    await self.send(response_package)
+                    log.debug(f"Replied to request {response_package.source_conv_id}: {response_package}")
+                # Package is a broadcast
+                elif package.data["msg_type"] == "Broadcast":
+                    log.debug(f"Received broadcast {package.source_conv_id}: {package}")
+                    try:
+                        await self.request_handler(Broadcast.from_dict(package.data))
+                    except Exception as e:
+                        ru.sentry_exc(e)
+                        self.handlers_failed += 1
+                    else:
+                        self.handlers_completed += 1
+            finally:
+                self.handlers_running -= 1
+
+    async def _send_stream(self, package: Package, responses: Union[Response, AsyncIterator[Response]],
+                           window: int) -> None:
+        """Send a streamed response to a request, waiting for credit from the requester before sending each chunk.
+
+        A single :class:`ResponseSuccess` is sent as a stream of one chunk."""
+        if isinstance(responses, ResponseSuccess):
+            responses = _single_chunk(responses)
+        elif isinstance(responses, Response):
+            # Failures are sent as they are
+            await self.send(package.reply(responses.to_dict(), source_conv_id=self._next_conv_id()))
+            return
+        conv_id = self._next_conv_id()
+        if conv_id is None:
+            conv_id = str(uuid.uuid4())
+        credits = CreditWindow(window, loop=self._loop)
+        self._outgoing_streams[conv_id] = credits
+        try:
+            final: Response = ResponseSuccess()
+            async for response in responses:
+                if not isinstance(response, ResponseChunk):
+                    final = response
+                    break
+                try:
+                    if not await credits.acquire(timeout=self.config.request_timeout):
+                        log.debug(f"Stream {conv_id} was cancelled by {package.source}")
+                        return
+                except aio.TimeoutError:
+                    log.warning(f"Stream {conv_id} stopped: {package.source} didn't grant credit in"
+                                f" {self.config.request_timeout}s")
+                    return
+                await self.send(Package(response.to_dict(), source=self.nid, destination=package.source,
+                                        source_conv_id=conv_id, destination_conv_id=package.source_conv_id,
+                                        priority=package.priority))
+            await self.send(Package(final.to_dict(), source=self.nid, destination=package.source,
+                                    source_conv_id=conv_id, destination_conv_id=package.source_conv_id,
+                                    priority=package.priority))
+            log.debug(f"Sent stream {conv_id} to {package.source}")
+        finally:
+            del self._outgoing_streams[conv_id]
+            if hasattr(responses, "aclose"):
+                await responses.aclose()
+
+    @staticmethod
+    async def _collect_stream(responses: AsyncIterator[Response]) -> Response:
+        """Merge a streamed response into a single :class:`Response`, for requests that didn't ask for a stream.
+
+        The data of the chunks is returned in the ``chunks`` list of a :class:`ResponseSuccess`."""
+        chunks = []
+        try:
+            async for response in responses:
+                if not isinstance(response, ResponseChunk):
+                    if isinstance(response, ResponseFailure):
+                        return response
+                    break
+                chunks.append(response.data)
+        finally:
+            if hasattr(responses, "aclose"):
+                await responses.aclose()
+        return ResponseSuccess({"chunks": chunks})
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait for the requests and broadcasts currently being handled to complete.
+
+        Parameters:
+            timeout: The maximum number of seconds to wait for. Handlers still running after it are cancelled."""
+        if not self._handler_tasks:
+            return
+        log.debug(f"Draining {self.handlers_in_flight} handlers...")
+        done, pending = await aio.wait(set(self._handler_tasks), timeout=timeout)
+        if pending:
+            log.warning(f"Cancelling {len(pending)} handlers still running after {timeout}s")
+            self._cancel_handlers()
+            await aio.wait(pending)
+
+    def _cancel_handlers(self) -> None:
+        for task in self._handler_tasks:
+            task.cancel()
+
+    def _reconnect_delay(self) -> float:
+        """Find how many seconds should be waited before the next reconnection attempt.
+
+        The delay grows exponentially with every failed attempt, and is randomized ("full jitter") so that many
+        :class:`Link` disconnected at the same time don't all reconnect at the same time."""
+        delay = min(self.config.reconnect_max_delay,
+                    self.config.reconnect_min_delay * 2 ** self._reconnect_attempts)
+        self._reconnect_attempts += 1
+        return random.uniform(0, delay)
+
+    async def _run_connection(self):
+        """Connect, identify and handle the received packages until the connection is closed."""
+        if not self.connect_event.is_set():
+            await self.connect()
+        if not self.identify_event.is_set():
+            await self.identify()
         while True:
-            if not self.connect_event.is_set():
-                await self.connect()
-            if not self.identify_event.is_set():
-                await self.identify()
             package: Package = await self.receive()
             # Package is a response
             if package.destination_conv_id in self._pending_requests:
-                request = self._pending_requests[package.destination_conv_id]
-                request.set(package.data)
+                future = self._pending_requests[package.destination_conv_id]
+                if not future.done():
+                    future.set_result(package.data)
                 continue
-            # Package is a request
-            elif package.data["msg_type"] == "Request":
-                log.debug(f"Received request {package.source_conv_id}: {package}")
-                response: Response = await self.request_handler(Request.from_dict(package.data))
-                response_package: Package = package.reply(response.to_dict())
-                await self.send(response_package)
-                log.debug(f"Replied to request {response_package.source_conv_id}: {response_package}")
-            # Package is a broadcast
-            elif package.data["msg_type"] == "Broadcast":
-                log.debug(f"Received broadcast {package.source_conv_id}: {package}")
-                await self.request_handler(Broadcast.from_dict(package.data))
+            # Package is a part of a streamed response
+            elif package.destination_conv_id in self._pending_streams:
+                self._pending_streams[package.destination_conv_id]._feed(package)
+            # Package grants credit to a streamed response
+            elif package.destination_conv_id in self._outgoing_streams:
+                if package.data.get("msg_type") == "StreamCredit":
+                    self._outgoing_streams[package.destination_conv_id].grant(StreamCredit.from_dict(package.data))
+            # Package is a request or a broadcast
+            elif package.data.get("msg_type") in ("Request", "Broadcast"):
+                self._dispatch(package)
+
+    async def run(self):
+        """Blockingly run the Link.
+
+        If :attr:`.config.reconnect` is enabled, the :class:`Link` will reconnect with the same nid every time the
+        connection is lost, sending the packages queued in the meantime.
+
+        Requests and broadcasts are handled in separate tasks; the ones still running when this coroutine stops are
+        cancelled, so use :meth:`.drain` first to wait for them to complete."""
+        log.debug(f"Running link: {self.config.name}")
+        if self.error_event.is_set() and not self.config.reconnect:
+            raise ConnectionClosedError("RoyalnetLinks can't be rerun after an error.")
+        writer = self._loop.create_task(self._writer())
+        heartbeat = self._loop.create_task(self._heartbeat()) if self.config.heartbeat_interval is not None else None
+        try:
+            while True:
+                try:
+                    await self._run_connection()
+                except (ConnectionClosedError, OSError, websockets.InvalidHandshake) as e:
+                    if not self.config.reconnect:
+                        raise
+                    if self.websocket is not None:
+                        await self.websocket.close()
+                    self._connection_lost()
+                    delay = self._reconnect_delay()
+                    log.warning(f"Herald connection failed ({e.__class__.__qualname__}),"
+                                f" reconnecting in {delay:.1f}s...")
+                    await aio.sleep(delay)
+        finally:
+            writer.cancel()
+            if heartbeat is not None:
+                heartbeat.cancel()
+            self._cancel_handlers()
+
+
+async def _single_chunk(response: ResponseSuccess) -> AsyncIterator[Response]:
+    yield ResponseChunk(response.data)
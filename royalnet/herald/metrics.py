@@ -0,0 +1,244 @@
+from typing import *
+import asyncio as aio
+import collections
+import time
+import logging
+
+if TYPE_CHECKING:
+    from .server import Server, ConnectedClient
+    from .package import Package
+
+
+log = logging.getLogger(__name__)
+
+latency_buckets: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""The upper bounds in seconds of the buckets of the handler latency histograms."""
+
+
+class HandlerMetrics:
+    """The metrics of the requests and broadcasts sent to a single handler."""
+
+    def __init__(self):
+        self.requests: int = 0
+        self.broadcasts: int = 0
+        self.successes: int = 0
+        self.failures: int = 0
+        """The number of requests that received a ``ResponseFailure``."""
+        self.latency_sum: float = 0.0
+        """The sum of the seconds elapsed between routing each request and routing its response."""
+        self.latency_max: float = 0.0
+        self.latency_buckets: List[int] = [0] * (len(latency_buckets) + 1)
+        """The number of responses received within each of the :data:`latency_buckets`, plus one for the slower ones;
+        unlike Prometheus histograms, they aren't cumulative."""
+
+    def observe(self, latency: float, success: bool) -> None:
+        if success:
+            self.successes += 1
+        else:
+            self.failures += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        for index, bound in enumerate(latency_buckets):
+            if latency <= bound:
+                self.latency_buckets[index] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        responses = self.successes + self.failures
+        return {
+            "requests": self.requests,
+            "broadcasts": self.broadcasts,
+            "successes": self.successes,
+            "failures": self.failures,
+            "latency_mean": self.latency_sum / responses if responses else None,
+            "latency_max": self.latency_max,
+            "latency_buckets": dict(zip([*map(str, latency_buckets), "+Inf"], self.latency_buckets)),
+        }
+
+
+class ServerMetrics:
+    """Counters about the packages routed by a :class:`Server`.
+
+    Requests are correlated with their responses through their ``conv_id``, to measure the time each handler takes
+    to reply, including the time spent travelling between the :class:`Server` and the handling :class:`Link`."""
+
+    def __init__(self, *, max_pending: int = 10000):
+        self.start_time: float = time.time()
+        self.received_packages: Counter[str] = collections.Counter()
+        """The number of packages received from the clients, indexed by the ``link_type`` of the sender."""
+        self.received_bytes: Counter[str] = collections.Counter()
+        self.sent_packages: Counter[str] = collections.Counter()
+        """The number of packages routed to the clients, indexed by the ``link_type`` of the receiver."""
+        self.sent_bytes: Counter[str] = collections.Counter()
+        self.handlers: Dict[str, HandlerMetrics] = {}
+        self.max_pending: int = max_pending
+        """The maximum number of requests waiting for a response that are remembered; the oldest are forgotten first."""
+        self._pending: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self.unanswered: int = 0
+        """The number of requests that were forgotten before receiving a response."""
+        self.rejected: int = 0
+        """The number of requests the server replied to, as their destination wasn't connected."""
+        self.reaped: int = 0
+        """The number of clients that were disconnected, as they stopped sending heartbeats."""
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} ({len(self._pending)} pending requests)>"
+
+    def _handler(self, name: str) -> HandlerMetrics:
+        handler = self.handlers.get(name)
+        if handler is None:
+            handler = self.handlers[name] = HandlerMetrics()
+        return handler
+
+    def message_received(self, client: "ConnectedClient", size: int) -> None:
+        """Count a message received from a client; it may contain more than one package."""
+        self.received_bytes[client.link_type] += size
+
+    def package_received(self, client: "ConnectedClient", package: "Package") -> None:
+        """Count a package received from a client, and correlate it with the other packages of its conversation."""
+        self.received_packages[client.link_type] += 1
+        data = package.data
+        msg_type = data.get("msg_type")
+        if msg_type == "Request":
+            handler = data.get("handler")
+            self._handler(handler).requests += 1
+            if len(self._pending) >= self.max_pending:
+                # Dicts keep the insertion order, so the first item is the oldest request
+                del self._pending[next(iter(self._pending))]
+                self.unanswered += 1
+            self._pending[(package.source, package.source_conv_id)] = (time.monotonic(), handler)
+        elif msg_type == "Broadcast":
+            self._handler(data.get("handler")).broadcasts += 1
+        elif data.get("type") == "ResponseChunk":
+            # Streamed responses are measured until the package that ends them
+            pass
+        elif package.destination_conv_id is not None:
+            pending = self._pending.pop((package.destination, package.destination_conv_id), None)
+            if pending is not None:
+                start, handler = pending
+                self._handler(handler).observe(time.monotonic() - start, data.get("type") == "ResponseSuccess")
+
+    def request_rejected(self, package: "Package") -> None:
+        """Count a request that couldn't be delivered, and stop waiting for its response."""
+        self.rejected += 1
+        self._pending.pop((package.source, package.source_conv_id), None)
+
+    def package_sent(self, link_type: str, size: int) -> None:
+        """Count a package routed to a client."""
+        self.sent_packages[link_type] += 1
+        self.sent_bytes[link_type] += size
+
+    def to_dict(self, server: "Server") -> Dict[str, Any]:
+        """Get all the metrics of a :class:`Server` in a JSON-serializable :class:`dict`."""
+        local_clients = server.local_clients()
+        return {
+            "uptime": time.time() - self.start_time,
+            "clients": len(local_clients),
+            "remote_clients": len(server.identified_clients) - len(local_clients),
+            "received": {link_type: {"packages": self.received_packages[link_type],
+                                     "bytes": self.received_bytes[link_type]}
+                         for link_type in self.received_bytes},
+            "sent": {link_type: {"packages": self.sent_packages[link_type],
+                                 "bytes": self.sent_bytes[link_type]}
+                     for link_type in self.sent_packages},
+            "handlers": {name: handler.to_dict() for name, handler in self.handlers.items()},
+            "pending_requests": len(self._pending),
+            "unanswered_requests": self.unanswered,
+            "rejected_requests": self.rejected,
+            "reaped_clients": self.reaped,
+            "queues": {client.nid: {"link_type": client.link_type,
+                                    "depth": client.queue.depth,
+                                    "max_depth": client.queue.max_depth,
+                                    "dropped": client.queue.dropped}
+                       for client in local_clients},
+        }
+
+    def to_prometheus(self, server: "Server") -> str:
+        """Get all the metrics of a :class:`Server` in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name: str, kind: str, description: str, samples: Iterable[Tuple[Dict[str, str], float]]):
+            lines.append(f"# HELP royalnet_herald_{name} {description}")
+            lines.append(f"# TYPE royalnet_herald_{name} {kind}")
+            for labels, value in samples:
+                if labels:
+                    label_text = ",".join(f'{key}="{escape(label)}"' for key, label in labels.items())
+                    lines.append(f"royalnet_herald_{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"royalnet_herald_{name} {value}")
+
+        def histogram(handler: HandlerMetrics) -> Iterable[Tuple[str, float]]:
+            total = 0
+            for bound, count in zip([*map(str, latency_buckets), "+Inf"], handler.latency_buckets):
+                total += count
+                yield bound, total
+
+        local_clients = server.local_clients()
+        metric("clients", "gauge", "The number of clients connected to this server.", [({}, len(local_clients))])
+        metric("remote_clients", "gauge", "The number of clients reachable through the peers of this server.",
+               [({}, len(server.identified_clients) - len(local_clients))])
+        metric("received_packages_total", "counter", "The packages received from the clients.",
+               [({"link_type": link_type}, value) for link_type, value in self.received_packages.items()])
+        metric("received_bytes_total", "counter", "The bytes received from the clients.",
+               [({"link_type": link_type}, value) for link_type, value in self.received_bytes.items()])
+        metric("sent_packages_total", "counter", "The packages routed to the clients.",
+               [({"link_type": link_type}, value) for link_type, value in self.sent_packages.items()])
+        metric("sent_bytes_total", "counter", "The bytes routed to the clients.",
+               [({"link_type": link_type}, value) for link_type, value in self.sent_bytes.items()])
+        metric("requests_total", "counter", "The requests routed to each handler.",
+               [({"handler": name}, handler.requests) for name, handler in self.handlers.items()])
+        metric("broadcasts_total", "counter", "The broadcasts routed to each handler.",
+               [({"handler": name}, handler.broadcasts) for name, handler in self.handlers.items()])
+        metric("responses_total", "counter", "The responses routed back from each handler.",
+               [({"handler": name, "result": result}, count) for name, handler in self.handlers.items()
+                for result, count in (("success", handler.successes), ("failure", handler.failures))])
+        lines.append("# HELP royalnet_herald_handler_latency_seconds The time each handler takes to reply.")
+        lines.append("# TYPE royalnet_herald_handler_latency_seconds histogram")
+        for name, handler in self.handlers.items():
+            for bound, count in histogram(handler):
+                lines.append(f'royalnet_herald_handler_latency_seconds_bucket{{handler="{escape(name)}",le="{bound}"}}'
+                             f' {count}')
+            lines.append(f'royalnet_herald_handler_latency_seconds_sum{{handler="{escape(name)}"}} '
+                         f'{handler.latency_sum}')
+            lines.append(f'royalnet_herald_handler_latency_seconds_count{{handler="{escape(name)}"}} '
+                         f'{handler.successes + handler.failures}')
+        metric("pending_requests", "gauge", "The requests waiting for a response.", [({}, len(self._pending))])
+        metric("unanswered_requests_total", "counter", "The requests forgotten before receiving a response.",
+               [({}, self.unanswered)])
+        metric("rejected_requests_total", "counter", "The requests whose destination wasn't connected.",
+               [({}, self.rejected)])
+        metric("reaped_clients_total", "counter", "The clients disconnected as they stopped sending heartbeats.",
+               [({}, self.reaped)])
+        metric("queue_depth", "gauge", "The packages waiting to be sent to each client.",
+               [({"nid": client.nid, "link_type": client.link_type}, client.queue.depth) for client in local_clients])
+        metric("queue_dropped_total", "counter", "The packages discarded because the queue of a client was full.",
+               [({"nid": client.nid, "link_type": client.link_type}, client.queue.dropped)
+                for client in local_clients])
+        return "\n".join(lines) + "\n"
+
+    async def serve_prometheus(self, server: "Server", host: str, port: int) -> aio.AbstractServer:
+        """Start a minimal HTTP server answering every request with :meth:`.to_prometheus`."""
+        async def handle(reader: aio.StreamReader, writer: aio.StreamWriter):
+            try:
+                # Read and ignore the request line and the headers
+                while (await reader.readline()).strip():
+                    pass
+                body = bytes(self.to_prometheus(server), encoding="utf8")
+                writer.write(b"HTTP/1.0 200 OK\r\n"
+                             b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                             b"Content-Length: " + bytes(str(len(body)), encoding="ascii") + b"\r\n\r\n" + body)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        log.info(f"Serving Herald metrics on http://{host}:{port}/")
+        return await aio.start_server(handle, host=host, port=port, loop=server.loop)
+
+
+def escape(label: Any) -> str:
+    """Escape a Prometheus label value."""
+    return str(label).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
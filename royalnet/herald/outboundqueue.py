@@ -0,0 +1,129 @@
+from typing import *
+import asyncio as aio
+import logging
+from .errors import QueueFullError
+from .lanes import PriorityLanes
+
+
+log = logging.getLogger(__name__)
+
+overflow_policies = ("block", "drop_oldest", "disconnect")
+"""The possible behaviours of a full :class:`OutboundQueue`:
+
+- ``block``: wait until there's space in the queue;
+- ``drop_oldest``: discard the oldest item in the queue;
+- ``disconnect``: raise :exc:`QueueFullError`, so that the slow consumer can be disconnected."""
+
+
+class OutboundQueue:
+    """A bounded queue of items waiting to be sent, with a configurable behaviour when it is full.
+
+    Items are put in a lane for each priority, and taken as described in :class:`PriorityLanes`."""
+
+    def __init__(self, maxsize: int, overflow_policy: str = "block", *,
+                 lanes: int = 2,
+                 starvation_limit: int = 8,
+                 loop: aio.AbstractEventLoop = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if overflow_policy not in overflow_policies:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.maxsize: int = maxsize
+        """The maximum number of items in all the lanes."""
+        self.overflow_policy: str = overflow_policy
+        self._lanes: PriorityLanes = PriorityLanes(lanes, starvation_limit)
+        self._not_empty: aio.Event = aio.Event(loop=loop)
+        self._not_full: aio.Event = aio.Event(loop=loop)
+        self._not_full.set()
+        self.max_depth: int = 0
+        """The maximum number of items that have been in the queue at the same time."""
+        self.dropped: int = 0
+        """The number of items that were discarded because the queue was full."""
+
+    def __len__(self):
+        return len(self._lanes)
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {len(self)}/{self.maxsize} ({self.overflow_policy})>"
+
+    @property
+    def depth(self) -> int:
+        """The number of items currently in the queue."""
+        return len(self._lanes)
+
+    def lane_depth(self, priority: int) -> int:
+        """The number of items currently in the lane of a priority."""
+        return self._lanes.depth(priority)
+
+    def _update(self) -> None:
+        length = len(self._lanes)
+        if length:
+            self._not_empty.set()
+        else:
+            self._not_empty.clear()
+        if length < self.maxsize:
+            self._not_full.set()
+        else:
+            self._not_full.clear()
+        self.max_depth = max(self.max_depth, length)
+
+    async def put(self, item: Any, priority: int = 0) -> None:
+        """Add an item to the end of its lane, applying the :attr:`.overflow_policy` if the queue is full.
+
+        With the ``drop_oldest`` policy, the oldest item of the least urgent lane is discarded.
+
+        Raises:
+            :exc:`QueueFullError` if the queue is full and the policy is ``disconnect``."""
+        while len(self._lanes) >= self.maxsize:
+            if self.overflow_policy == "block":
+                await self._not_full.wait()
+            elif self.overflow_policy == "drop_oldest":
+                self._lanes.drop()
+                self.dropped += 1
+            else:
+                self.dropped += 1
+                raise QueueFullError(f"{self} is full")
+        self._lanes.append(item, priority)
+        self._update()
+
+    async def get(self) -> Any:
+        """Remove and return the next item, waiting for one if the queue is empty."""
+        while not self._lanes:
+            await self._not_empty.wait()
+        item = self._lanes.popleft()
+        self._update()
+        return item
+
+    def clear(self) -> List[Any]:
+        """Remove and return all the items in the queue, in the order they would have been taken."""
+        items = []
+        while self._lanes:
+            items.append(self._lanes.popleft())
+        self._update()
+        return items
+
+    async def get_batch(self,
+                        max_items: int,
+                        max_size: Optional[int] = None,
+                        size: Callable[[Any], int] = len) -> List[Any]:
+        """Remove and return the next items, waiting for at least one if the queue is empty.
+
+        It never waits for more items than the ones already in the queue.
+
+        Parameters:
+            max_items: The maximum number of items to return.
+            max_size: The maximum total size of the items to return; the first item is returned even if it is bigger.
+            size: A function returning the size of an item.
+
+        Returns:
+            A :class:`list` containing at least one item."""
+        batch = [await self.get()]
+        total = size(batch[0])
+        while self._lanes and len(batch) < max_items:
+            if max_size is not None and total + size(self._lanes.peek()) > max_size:
+                break
+            item = self._lanes.popleft()
+            total += size(item)
+            batch.append(item)
+        self._update()
+        return batch
@@ -1,6 +1,23 @@
 import json
 import uuid
 from typing import *
+from .codecs import Codec, json_codec
+
+
+ConvId = Union[str, int]
+"""A conversation id: either an UUID string, or an integer unique for the :py:class:`Link` that generated it."""
+
+PRIORITY_INTERACTIVE: int = 0
+"""The priority of the packages someone is waiting for, such as most requests and their responses.
+
+It is the default priority, and it is never sent over the network."""
+
+PRIORITY_BULK: int = 1
+"""The priority of the packages that can wait, such as mass broadcasts: they are sent only when no interactive package
+is waiting, or when too many interactive packages have been sent in a row."""
+
+priorities: Tuple[int, ...] = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+"""All the priorities, from the most urgent to the least urgent."""
 
 
 class Package:
@@ -10,12 +27,15 @@ class Package:
     Contains info about the source and the destination."""
 
     def __init__(self,
-                 data: dict,
+                 data: Optional[dict],
                  *,
                  source: str,
                  destination: str,
-                 source_conv_id: Optional[str] = None,
-                 destination_conv_id: Optional[str] = None):
+                 source_conv_id: Optional[ConvId] = None,
+                 destination_conv_id: Optional[ConvId] = None,
+                 raw_data: Optional[Union[bytes, memoryview]] = None,
+                 raw_codec: Optional[Codec] = None,
+                 priority: int = PRIORITY_INTERACTIVE):
         """Create a Package.
 
         Parameters:
@@ -25,38 +45,74 @@ class Package:
                          Can also be the ``NULL`` value to send the message to nobody.
             source_conv_id: The conversation id of the node that created this package.
                             Akin to the sequence number on IP packets.
-            destination_conv_id: The conversation id of the node that this Package is a reply to."""
-        self.data: dict = data
+                            If not specified, a new UUID is generated.
+            destination_conv_id: The conversation id of the node that this Package is a reply to.
+            raw_data: The still encoded data, that will be decoded only if the :attr:`.data` is accessed.
+                      If specified, ``data`` should be :const:`None`.
+            raw_codec: The :class:`Codec` the ``raw_data`` was encoded with.
+            priority: The lane the package is queued in, either :data:`PRIORITY_INTERACTIVE` or
+                      :data:`PRIORITY_BULK`."""
+        if priority not in priorities:
+            raise ValueError(f"Invalid priority: {priority}")
+        self._data: Optional[dict] = data
+        self._raw_data: Optional[Union[bytes, memoryview]] = raw_data
+        self._raw_codec: Optional[Codec] = raw_codec
         self.source: str = source
-        self.source_conv_id: str = source_conv_id or str(uuid.uuid4())
+        self.source_conv_id: ConvId = source_conv_id if source_conv_id is not None else str(uuid.uuid4())
         self.destination: str = destination
-        self.destination_conv_id: Optional[str] = destination_conv_id
+        self.destination_conv_id: Optional[ConvId] = destination_conv_id
+        self.priority: int = priority
 
     def __repr__(self):
         return f"<{self.__class__.__qualname__} {self.source} » {self.destination}>"
 
+    @property
+    def data(self) -> dict:
+        """The data contained in the package, decoded the first time it is accessed."""
+        if self._data is None and self._raw_data is not None:
+            self._data = self._raw_codec.loads(self._raw_data)
+        return self._data
+
+    @data.setter
+    def data(self, value: dict) -> None:
+        self._data = value
+        self._raw_data = None
+        self._raw_codec = None
+
+    def raw_data(self, codec: Codec) -> Optional[Union[bytes, memoryview]]:
+        """Get the data as it was received, if it was encoded with the passed :class:`Codec`, without decoding it."""
+        if self._raw_codec is codec:
+            return self._raw_data
+        return None
+
     def __eq__(self, other):
         if isinstance(other, Package):
             return (self.data == other.data) and \
                    (self.source == other.source) and \
                    (self.destination == other.destination) and \
                    (self.source_conv_id == other.source_conv_id) and \
-                   (self.destination_conv_id == other.destination_conv_id)
+                   (self.destination_conv_id == other.destination_conv_id) and \
+                   (self.priority == other.priority)
         return False
 
-    def reply(self, data) -> "Package":
-        """Reply to this :class:`Package` with another :class:`Package`.
+    def reply(self, data, source_conv_id: Optional[ConvId] = None) -> "Package":
+        """Reply to this :class:`Package` with another :class:`Package`, with the same priority.
 
         Parameters:
             data: The data that should be sent. Usually a :class:`Request`.
+            source_conv_id: The conversation id of the reply, used if this :class:`Package` doesn't have a
+                            ``destination_conv_id``. If not specified, a new UUID is generated.
 
         Returns:
             The reply :class:`Package`."""
+        if self.destination_conv_id is not None:
+            source_conv_id = self.destination_conv_id
         return Package(data,
                        source=self.destination,
                        destination=self.source,
-                       source_conv_id=self.destination_conv_id or str(uuid.uuid4()),
-                       destination_conv_id=self.source_conv_id)
+                       source_conv_id=source_conv_id,
+                       destination_conv_id=self.source_conv_id,
+                       priority=self.priority)
 
     @staticmethod
     def from_dict(d) -> "Package":
@@ -79,11 +135,14 @@ class Package:
                        source=d["source"]["nid"],
                        destination=d["destination"]["nid"],
                        source_conv_id=d["source"]["conv_id"],
-                       destination_conv_id=d["destination"]["conv_id"])
+                       destination_conv_id=d["destination"]["conv_id"],
+                       priority=d.get("priority", PRIORITY_INTERACTIVE))
 
     def to_dict(self) -> dict:
-        """Convert the :class:`Package` into a dictionary."""
-        return {
+        """Convert the :class:`Package` into a dictionary.
+
+        The ``priority`` is included only if it isn't the default one."""
+        d = {
             "source": {
                 "nid": self.source,
                 "conv_id": self.source_conv_id
@@ -94,6 +153,9 @@ class Package:
             },
             "data": self.data
         }
+        if self.priority != PRIORITY_INTERACTIVE:
+            d["priority"] = self.priority
+        return d
 
     @staticmethod
     def from_json_string(string: str) -> "Package":
@@ -112,3 +174,34 @@ class Package:
     def to_json_bytes(self) -> bytes:
         """Convert the :class:`Package` into UTF-8-encoded JSON bytes."""
         return bytes(self.to_json_string(), encoding="utf8")
+
+    @staticmethod
+    def from_bytes(b: bytes, codec: Codec = json_codec) -> "Package":
+        """Create a :class:`Package` from bytes encoded with the specified :class:`Codec`."""
+        packages = codec.decode_packages(b)
+        if len(packages) != 1:
+            raise ValueError("Expected a single package, got a batch")
+        return packages[0]
+
+    @staticmethod
+    def from_bytes_multi(b: bytes, codec: Codec = json_codec) -> List["Package"]:
+        """Create a :class:`list` of :class:`Package` from bytes encoded with the specified :class:`Codec`, containing
+        either a single package or a batch of packages."""
+        return codec.decode_packages(b)
+
+    def to_bytes(self, codec: Codec = json_codec) -> bytes:
+        """Convert the :class:`Package` into bytes with the specified :class:`Codec`."""
+        return codec.encode_package(self)
+
+    def to_bytes_multi(self, destinations: Sequence[str], codec: Codec = json_codec) -> List[bytes]:
+        """Convert the :class:`Package` into bytes once for every passed destination.
+
+        The ``data`` is encoded only once, and only the ``destination.nid`` is spliced in every result.
+
+        Parameters:
+            destinations: The ``nid`` of the nodes that should replace the :attr:`.destination` of the package.
+            codec: The :class:`Codec` to encode the package with.
+
+        Returns:
+            A :class:`list` of the encoded packages, in the same order as the destinations."""
+        return codec.encode_package_multi(self, destinations)
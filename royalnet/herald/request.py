@@ -6,16 +6,23 @@ class Request:
 
      It contains the name of the requested handler, in addition to the data."""
 
-    def __init__(self, handler: str, data: dict, msg_type: Optional[str] = None):
+    def __init__(self, handler: str, data: dict, msg_type: Optional[str] = None, stream: Optional[int] = None):
         super().__init__()
         if msg_type is not None:
             assert msg_type == self.__class__.__name__
         self.msg_type = self.__class__.__name__
         self.handler: str = handler
         self.data: dict = data
+        self.stream: Optional[int] = stream
+        """If the response should be streamed, the number of chunks that can be sent before waiting for more
+        credit."""
 
     def to_dict(self):
-        return self.__dict__
+        d = dict(self.__dict__)
+        # Don't send the stream field at all for normal requests, so that they can be handled by older Links
+        if d["stream"] is None:
+            del d["stream"]
+        return d
 
     @classmethod
     def from_dict(cls, d: dict):
@@ -38,6 +38,20 @@ class ResponseSuccess(Response):
         return f"{self.__class__.__qualname__}(data={self.data})"
 
 
+class ResponseChunk(Response):
+    """A part of a streamed response to a :py:class:`Request`; the stream is ended by a :py:class:`ResponseSuccess`
+    or a :py:class:`ResponseFailure`."""
+
+    def __init__(self, data: Optional[dict] = None):
+        if data is None:
+            self.data = {}
+        else:
+            self.data = data
+
+    def __repr__(self):
+        return f"{self.__class__.__qualname__}(data={self.data})"
+
+
 class ResponseFailure(Response):
     """A response to a invalid :py:class:`Request`."""
 
@@ -48,3 +62,18 @@ class ResponseFailure(Response):
 
     def __repr__(self):
         return f"{self.__class__.__qualname__}(name={self.name}, description={self.description}, extra_info={self.extra_info})"
+
+
+def response_from_dict(d: dict) -> Response:
+    """Recreate a received response, choosing its class from its ``type``.
+
+    Raises:
+        :exc:`TypeError` if the type of the response is unknown."""
+    if d["type"] == "ResponseSuccess":
+        return ResponseSuccess.from_dict(d)
+    elif d["type"] == "ResponseFailure":
+        return ResponseFailure.from_dict(d)
+    elif d["type"] == "ResponseChunk":
+        return ResponseChunk.from_dict(d)
+    else:
+        raise TypeError("Unknown response type")
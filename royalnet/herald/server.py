@@ -1,13 +1,25 @@
 from typing import *
 import asyncio as aio
 import re
+import os
 import datetime
-import uuid
 import logging
+import functools
+import urllib.parse
 import websockets
 import royalnet.utils as ru
-from .package import Package
+from .codecs import Codec, json_codec, negotiate_codec
+from .package import Package, PRIORITY_INTERACTIVE
 from .config import Config
+from .errors import QueueFullError
+from .outboundqueue import OutboundQueue
+from .bus import Bus, RemoteClient
+from .metrics import ServerMetrics
+from .compression import Compressor, negotiate_compressor, compress_message, decompress_message
+from .auth import new_nonce, is_nonce, identify_digest, server_proof, compare
+from . import transports
+from .request import Request
+from .response import Response, ResponseSuccess, ResponseFailure
 
 
 log = logging.getLogger(__name__)
@@ -15,11 +27,54 @@ log = logging.getLogger(__name__)
 
 class ConnectedClient:
     """The :py:class:`Server`-side representation of a connected :py:class:`Link`."""
-    def __init__(self, socket: "websockets.WebSocketServerProtocol"):
+    def __init__(self,
+                 socket: "websockets.WebSocketServerProtocol",
+                 *,
+                 queue_size: int = 256,
+                 overflow_policy: str = "block",
+                 starvation_limit: int = 8,
+                 batch_max_packages: int = 64,
+                 batch_max_bytes: int = 65536,
+                 compression_threshold: Optional[int] = None,
+                 loop: aio.AbstractEventLoop = None):
         self.socket: "websockets.WebSocketServerProtocol" = socket
         self.nid: Optional[str] = None
         self.link_type: Optional[str] = None
+        self.codec: Codec = json_codec
+        self.batching: bool = False
+        self.compressor: Optional[Compressor] = None
+        """The :class:`Compressor` negotiated with the :py:class:`Link`, if any."""
+        self.compression_threshold: Optional[int] = compression_threshold
         self.connection_datetime: datetime.datetime = datetime.datetime.now()
+        if loop is None:
+            self.loop = aio.get_event_loop()
+        else:
+            self.loop = loop
+        self.queue: OutboundQueue = OutboundQueue(queue_size, overflow_policy,
+                                                  starvation_limit=starvation_limit,
+                                                  loop=self.loop)
+        """The packages waiting to be sent to the :py:class:`Link`, in a lane for each priority."""
+        self.sent_packages: int = 0
+        """The number of packages that have been sent to the :py:class:`Link` through the :attr:`.queue`."""
+        self.sent_messages: int = 0
+        """The number of websocket messages that have been sent to the :py:class:`Link` by the writer.
+        
+        It is lower than :attr:`.sent_packages` if batching is enabled."""
+        self.batch_max_packages: int = batch_max_packages
+        self.batch_max_bytes: int = batch_max_bytes
+        self.last_received: float = self.loop.time()
+        """The :meth:`loop.time` at which the last message was received from the :py:class:`Link`."""
+        self.last_sent: float = self.loop.time()
+        """The :meth:`loop.time` at which the last message was sent to the :py:class:`Link`."""
+        self.heartbeat_timeout: Optional[float] = None
+        """The seconds after which the :py:class:`Link` is considered dead if nothing is received from it, if it
+        negotiated heartbeats."""
+        self.routing: bool = False
+        """Is the :py:class:`Server` routing a message received from the :py:class:`Link`?
+
+        Nothing else is read from the :py:class:`Link` in the meantime, so it can't be considered dead."""
+        self._writer_task: Optional[aio.Task] = None
+        self._closing: bool = False
 
     def __repr__(self):
         return f"<{self.__class__.__qualname__} {self.nid}>"
@@ -29,117 +84,410 @@ class ConnectedClient:
         """Has the client sent a valid identification package?"""
         return bool(self.nid)
 
-    async def send_service(self, msg_type: str, message: str):
-        await self.send(Package({"type": msg_type, "service": message},
+    async def send_service(self, msg_type: str, message: str, **kwargs):
+        await self.send(Package({"type": msg_type, "service": message, **kwargs},
                                 source="<server>",
                                 destination=self.nid))
 
     async def send(self, package: Package):
         """Send a :py:class:`Package` to the :py:class:`Link`."""
-        await self.socket.send(package.to_json_bytes())
+        await self.send_bytes(package.to_bytes(self.codec), package.priority)
+
+    async def send_bytes(self, data: bytes, priority: int = PRIORITY_INTERACTIVE):
+        """Send an already encoded :py:class:`Package` to the :py:class:`Link`.
+
+        If the writer has been started, the package is put in the lane of its ``priority`` in the :attr:`.queue`
+        instead of being sent immediately.
+
+        Raises:
+            :exc:`QueueFullError` if the queue is full and its policy is ``disconnect``; the client is disconnected."""
+        if self._writer_task is None:
+            await self.socket.send(compress_message(data, self.compressor, self.compression_threshold))
+            self.last_sent = self.loop.time()
+            return
+        try:
+            await self.queue.put(data, priority)
+        except QueueFullError:
+            if not self._closing:
+                log.warning(f"Disconnecting {self}, as it isn't receiving packages fast enough")
+                self._closing = True
+                self.loop.create_task(self.socket.close(code=1008, reason="Send queue is full"))
+            raise
+
+    def start_writer(self) -> None:
+        """Start sending the packages put in the :attr:`.queue`."""
+        self._writer_task = self.loop.create_task(self._writer())
+
+    def stop_writer(self) -> List[Package]:
+        """Stop sending the packages put in the :attr:`.queue`.
+
+        Returns:
+            The packages that were still waiting in the queue, that will never be sent."""
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+        unsent = []
+        for data in self.queue.clear():
+            unsent += Package.from_bytes_multi(data, self.codec)
+        return unsent
+
+    async def _writer(self):
+        try:
+            while True:
+                if self.batching:
+                    # Send together all the packages that are already waiting, without waiting for new ones
+                    batch = await self.queue.get_batch(self.batch_max_packages, self.batch_max_bytes)
+                else:
+                    batch = [await self.queue.get()]
+                message = self.codec.join(batch) if len(batch) > 1 else batch[0]
+                await self.socket.send(compress_message(message, self.compressor, self.compression_threshold))
+                self.last_sent = self.loop.time()
+                self.sent_packages += len(batch)
+                self.sent_messages += 1
+        except websockets.ConnectionClosed:
+            pass
+
+
+Client = Union[ConnectedClient, RemoteClient]
 
 
 class Server:
-    def __init__(self, config: Config, *, loop: aio.AbstractEventLoop = None):
+    def __init__(self, config: Config, *, shard: int = 0, loop: aio.AbstractEventLoop = None):
         self.config: Config = config
-        self.identified_clients: List[ConnectedClient] = []
+        if not 0 <= shard < config.shards:
+            raise ValueError(f"Invalid shard number: {shard}")
+        self.shard: int = shard
+        """The number of this shard, if the server is split in multiple processes (see :attr:`Config.shards`)."""
+        self.bus: Bus = Bus(self, config.node_name if config.shards == 1 else f"{config.node_name}#{shard}",
+                            config.secret)
+        """The :class:`Bus` connecting this server to the other shards and to its peers."""
+        self.identified_clients: Set[Client] = set()
+        """The :class:`set` of all the identified clients, used as destination for ``*`` packages."""
+        self._clients_by_nid: Dict[str, Client] = {}
+        """An index of the identified clients by their ``nid``."""
+        self._clients_by_link_type: Dict[str, Set[Client]] = {}
+        """An index of the identified clients by their ``link_type``."""
+        self.metrics: Optional[ServerMetrics] = ServerMetrics() if config.metrics else None
+        """The metrics about the routed packages, if :attr:`Config.metrics` is enabled."""
+        self.heartbeat_task: Optional[aio.Task] = None
+        """The task running :meth:`.heartbeat`, if :attr:`Config.heartbeat_interval` is set; cancel it to stop sending
+        heartbeats and reaping the clients."""
         self.loop = loop
 
+    @property
+    def queue_depths(self) -> Dict[str, int]:
+        """The number of packages waiting to be sent to each client connected to this server, indexed by ``nid``."""
+        return {client.nid: client.queue.depth for client in self.local_clients()}
+
     def __repr__(self):
+        if self.config.shards > 1:
+            return f"<{self.__class__.__qualname__} shard {self.shard}>"
         return f"<{self.__class__.__qualname__}>"
 
-    def find_client(self, *, nid: str = None, link_type: str = None) -> List[ConnectedClient]:
+    def local_clients(self) -> List[ConnectedClient]:
+        """Get the identified clients connected to this server, excluding the ones connected to other shards."""
+        return [client for client in self._clients_by_nid.values() if isinstance(client, ConnectedClient)]
+
+    def register_client(self, client: Client) -> None:
+        """Add an identified client to the routing indexes.
+
+        If another client was already identified with the same ``nid``, it is replaced."""
+        previous = self._clients_by_nid.get(client.nid)
+        if previous is not None:
+            log.warning(f"{client.nid} identified again, replacing the previous connection.")
+            self.unregister_client(previous)
+        self.identified_clients.add(client)
+        self._clients_by_nid[client.nid] = client
+        self._clients_by_link_type.setdefault(client.link_type, set()).add(client)
+
+    def unregister_client(self, client: Client) -> bool:
+        """Remove a client from the routing indexes, if it was present.
+
+        Returns:
+            :const:`True` if the client was present, :const:`False` if it had already been removed or replaced."""
+        if client not in self.identified_clients:
+            return False
+        self.identified_clients.discard(client)
+        if self._clients_by_nid.get(client.nid) is client:
+            del self._clients_by_nid[client.nid]
+        same_type = self._clients_by_link_type.get(client.link_type)
+        if same_type is not None:
+            same_type.discard(client)
+            if not same_type:
+                del self._clients_by_link_type[client.link_type]
+        return True
+
+    def find_client(self, *, nid: str = None, link_type: str = None) -> List[Client]:
         assert not (nid and link_type)
         if nid:
-            matching = [client for client in self.identified_clients if client.nid == nid]
-            assert len(matching) <= 1
-            return matching
+            client = self._clients_by_nid.get(nid)
+            if client is None:
+                return []
+            return [client]
         if link_type:
-            matching = [client for client in self.identified_clients if client.link_type == link_type]
-            return matching or []
+            return list(self._clients_by_link_type.get(link_type, ()))
+        return []
 
     async def listener(self, websocket: "websockets.server.WebSocketServerProtocol", path):
-        connected_client = ConnectedClient(websocket)
+        connected_client = ConnectedClient(websocket,
+                                           queue_size=self.config.client_queue_size,
+                                           overflow_policy=self.config.overflow_policy,
+                                           starvation_limit=self.config.starvation_limit,
+                                           batch_max_packages=self.config.batch_max_packages,
+                                           batch_max_bytes=self.config.batch_max_bytes,
+                                           compression_threshold=self.config.compression_threshold,
+                                           loop=self.loop)
+        # The address isn't available anymore once a TLS connection is closed, and Unix sockets don't have one
+        address = ":".join(map(str, websocket.remote_address[:2])) if websocket.remote_address else "unix"
         # Wait for identification
         identify_msg = await websocket.recv()
-        log.debug(f"{websocket.remote_address} identified itself with: {identify_msg}.")
+        # Check if it is another server connecting to this one
+        if self.bus.is_hello(identify_msg):
+            await self.bus.accept(websocket, identify_msg)
+            return
+        # Challenge-response identification: the nonces are exchanged before the Identify message
+        nonces: Optional[Tuple[str, str]] = None
+        if isinstance(identify_msg, str) and identify_msg.startswith("Hello "):
+            client_nonce = identify_msg[len("Hello "):]
+            if not is_nonce(client_nonce):
+                log.warning(f"Invalid Herald nonce: {address}")
+                await connected_client.send_service("error", "Invalid nonce")
+                return
+            server_nonce = new_nonce()
+            await connected_client.send_service("challenge", "Prove that you know the secret!",
+                                                nonce=server_nonce,
+                                                proof=server_proof(self.config.secret, client_nonce, server_nonce))
+            nonces = (client_nonce, server_nonce)
+            identify_msg = await websocket.recv()
+        log.debug(f"{address} identified itself.")
         if not isinstance(identify_msg, str):
-            log.warning(f"Failed Herald identification: {websocket.remote_address[0]}:{websocket.remote_address[1]}")
+            log.warning(f"Failed Herald identification: {address}")
             await connected_client.send_service("error", "Invalid identification message (not a str)")
             return
-        identification = re.match(r"Identify ([^:\s]+):([^:\s]+):([^:\s]+)", identify_msg)
+        identification = re.match(r"Identify ([^:\s]+):([^:\s]+):([^:\s]+)(?::(\S+))?", identify_msg)
         if identification is None:
-            log.warning(f"Failed Herald identification: {websocket.remote_address[0]}:{websocket.remote_address[1]}")
+            log.warning(f"Failed Herald identification: {address}")
             await connected_client.send_service("error", "Invalid identification message (regex failed)")
             return
         secret = identification.group(3)
-        if secret != self.config.secret:
-            log.warning(f"Invalid Herald secret: {websocket.remote_address[0]}:{websocket.remote_address[1]}")
+        if nonces is not None:
+            expected = identify_digest(self.config.secret, *nonces, identification.group(1), identification.group(2))
+        elif self.config.auth == "plaintext":
+            expected = self.config.secret
+        else:
+            log.warning(f"Refused plaintext Herald secret: {address}")
+            await connected_client.send_service("error", "Plaintext secrets aren't accepted by this server")
+            return
+        if not compare(secret, expected):
+            log.warning(f"Invalid Herald secret: {address}")
             await connected_client.send_service("error", "Invalid secret")
             return
         # Identification successful
         connected_client.nid = identification.group(1)
         connected_client.link_type = identification.group(2)
-        log.info(f"Joined the Herald: {websocket.remote_address[0]}:{websocket.remote_address[1]}"
+        # Links that don't support codecs won't send any option
+        options = urllib.parse.parse_qs(identification.group(4) or "")
+        codec = self.negotiate_codec(options.get("codecs", [json_codec.name])[0].split(","))
+        batching = self.config.batch and options.get("batch", ["0"])[0] == "1"
+        compressor = self.negotiate_compressor(options.get("compression", [""])[0].split(","))
+        heartbeat_timeout = self.negotiate_heartbeat(options.get("heartbeat", [""])[0])
+        log.info(f"Joined the Herald: {address}"
                  f" ({connected_client.link_type})")
-        self.identified_clients.append(connected_client)
-        await connected_client.send_service("success", "Identification successful!")
-        log.debug(f"{connected_client.nid}'s identification confirmed.")
-        # Main loop
+        try:
+            # Confirm the identification before any other package can be routed to the client
+            await connected_client.send_service("success", "Identification successful!",
+                                                options={"codec": codec.name,
+                                                         "batch": batching,
+                                                         "compression": compressor.name if compressor else None,
+                                                         "heartbeat": self.config.heartbeat_interval
+                                                         if heartbeat_timeout is not None else None})
+            connected_client.codec = codec
+            connected_client.batching = batching
+            connected_client.compressor = compressor
+            connected_client.heartbeat_timeout = heartbeat_timeout
+            connected_client.start_writer()
+            self.register_client(connected_client)
+            await self.bus.announce_join(connected_client)
+            log.debug(f"{connected_client.nid}'s identification confirmed."
+                      f" (codec: {codec.name}, batching: {batching})")
+            # Main loop
+            while True:
+                # Receive packages
+                raw_bytes = await websocket.recv()
+                connected_client.last_received = self.loop.time()
+                if self.metrics is not None:
+                    self.metrics.message_received(connected_client, len(raw_bytes))
+                raw_bytes = decompress_message(raw_bytes)
+                connected_client.routing = True
+                try:
+                    for package in Package.from_bytes_multi(raw_bytes, connected_client.codec):
+                        log.debug(f"Received package: {package}")
+                        # Check if the package destination is the server itself.
+                        if package.destination == "<server>":
+                            await self.handle_server_package(connected_client, package)
+                            continue
+                        if self.metrics is not None:
+                            self.metrics.package_received(connected_client, package)
+                        # Otherwise, route the package to its destination
+                        # If a destination queue is full, this waits for it, slowing down the sender too
+                        await self.route_package(package)
+                finally:
+                    connected_client.routing = False
+        except websockets.ConnectionClosed:
+            log.info(f"Left the Herald: {address}"
+                     f" ({connected_client.link_type})")
+        finally:
+            await self.disconnect_client(connected_client)
+
+    async def disconnect_client(self, client: ConnectedClient) -> None:
+        """Stop routing packages to a client that has disconnected or is dead.
+
+        The packages still waiting in its queue are routed again: they reach the client if it has already connected
+        again with the same ``nid``, otherwise the requests among them are rejected."""
+        unsent = client.stop_writer()
+        # Don't announce the leave if the client has already connected again
+        if self.unregister_client(client):
+            await self.bus.announce_leave(client)
+        for package in unsent:
+            await self.route_package(package)
+
+    async def reap_client(self, client: ConnectedClient) -> None:
+        """Disconnect a client that hasn't sent anything, not even a heartbeat, for too long."""
+        log.warning(f"Disconnecting {client}, as nothing was received from it in {client.heartbeat_timeout:g}s")
+        if self.metrics is not None:
+            self.metrics.reaped += 1
+        # Closing the connection waits for the client to answer, which may never happen
+        self.loop.create_task(client.socket.close(code=1011, reason="Heartbeat timeout"))
+        await self.disconnect_client(client)
+
+    async def heartbeat(self) -> None:
+        """Send a heartbeat to the clients nothing has been sent to in :attr:`Config.heartbeat_interval`, and reap the
+        ones nothing has been received from in their heartbeat timeout."""
+        interval = self.config.heartbeat_interval
         while True:
-            # Receive packages
-            raw_bytes = await websocket.recv()
-            package: Package = Package.from_json_bytes(raw_bytes)
-            log.debug(f"Received package: {package}")
-            # Check if the package destination is the server itself.
-            if package.destination == "<server>":
-                # Do... nothing for now?
-                pass
-            # Otherwise, route the package to its destination
-            # noinspection PyAsyncCall
-            self.loop.create_task(self.route_package(package))
-
-    def find_destination(self, package: Package) -> List[ConnectedClient]:
+            await aio.sleep(interval / 2)
+            now = self.loop.time()
+            for client in self.local_clients():
+                if client.heartbeat_timeout is None:
+                    continue
+                # A client whose connection is breaking shouldn't stop the heartbeats of all the others
+                try:
+                    # The heartbeats of a client waiting for a slow destination are still waiting to be read
+                    if now - client.last_received > client.heartbeat_timeout and not client.routing:
+                        await self.reap_client(client)
+                    # If the queue isn't empty the client is already being sent something, or it isn't receiving
+                    elif now - client.last_sent >= interval and not client.queue.depth:
+                        await client.send_service("heartbeat", "The server is alive!")
+                except Exception as e:
+                    log.error(f"Heartbeat of {client} failed: {e!r}")
+                    ru.sentry_exc(e)
+
+    def negotiate_heartbeat(self, interval: str) -> Optional[float]:
+        """Find after how many seconds a client should be considered dead, given the heartbeat interval it requested.
+
+        Returns:
+            The heartbeat timeout, or :const:`None` if either side has heartbeats disabled."""
+        if self.config.heartbeat_interval is None or not interval:
+            return None
+        try:
+            interval = float(interval)
+        except ValueError:
+            return None
+        if interval <= 0:
+            return None
+        # Leave room for a couple of lost heartbeats, even if the client sends them less often than the server expects
+        return max(self.config.heartbeat_timeout, interval * 3)
+
+    async def handle_server_package(self, client: ConnectedClient, package: Package) -> None:
+        """Handle a :class:`Package` sent to ``<server>``, replying to the requests it supports:
+
+        - ``metrics``: reply with the :attr:`.metrics`, if they are enabled."""
+        if package.data.get("msg_type") != "Request":
+            return
+        request = Request.from_dict(package.data)
+        response: Response
+        if request.handler == "metrics":
+            if self.metrics is None:
+                response = ResponseFailure("metrics_disabled", "Metrics aren't enabled on this server.")
+            else:
+                response = ResponseSuccess(self.metrics.to_dict(self))
+        else:
+            response = ResponseFailure("no_such_handler", f"The server has no handler called {request.handler}.")
+        await client.send(package.reply(response.to_dict()))
+
+    def negotiate_compressor(self, preferences: List[str]) -> Optional[Compressor]:
+        """Choose the :class:`Compressor` to use with a client, given its preferences."""
+        if self.config.compression_threshold is None:
+            return None
+        if self.config.compression is not None:
+            preferences = [name for name in preferences if name in self.config.compression]
+        return negotiate_compressor(preferences)
+
+    def negotiate_codec(self, preferences: List[str]) -> Codec:
+        """Choose the :class:`Codec` to use with a client, given its preferences."""
+        if self.config.codecs is not None:
+            preferences = [name for name in preferences if name in self.config.codecs]
+        return negotiate_codec(preferences)
+
+    def find_destination(self, package: Package) -> List[Client]:
         """Find a list of destinations for the package.
 
         Parameters:
             package: The package to find the destination of.
 
         Returns:
-            A :class:`list` of :class:`ConnectedClient` to send the package to."""
+            A :class:`list` of :class:`ConnectedClient` and :class:`RemoteClient` to send the package to."""
         # Parse destination
         # Is it nothing?
         if package.destination == "<none>":
             return []
         # Is it all possible destinations?
         if package.destination == "*":
-            return self.identified_clients
-        # Is it a valid nid?
-        try:
-            destination = str(uuid.UUID(package.destination))
-        except ValueError:
-            pass
-        else:
-            return self.find_client(nid=destination)
+            return list(self.identified_clients)
+        # Is it a nid?
+        client = self._clients_by_nid.get(package.destination)
+        if client is not None:
+            return [client]
         # Is it a link_type?
-        return self.find_client(link_type=package.destination)
+        return list(self._clients_by_link_type.get(package.destination, ()))
 
     async def route_package(self, package: Package) -> None:
         """Executed every time a :class:`Package` is received and must be routed somewhere."""
         destinations = self.find_destination(package)
         log.debug(f"Routing package: {package} -> {destinations}")
+        if not destinations:
+            if package.destination != "<none>":
+                await self.reject_package(package, f"Nothing is connected to the Herald as {package.destination}.")
+            return
+        # Group the destinations by codec
+        by_codec: Dict[Codec, List[Client]] = {}
         for destination in destinations:
-            # This may have some consequences
-            specific_package = Package(package.data,
-                                       source=package.source,
-                                       destination=destination.nid,
-                                       source_conv_id=package.source_conv_id,
-                                       destination_conv_id=package.destination_conv_id)
-            await destination.send(specific_package)
+            by_codec.setdefault(destination.codec, []).append(destination)
+        # Encode the data only once per codec, then send the package to all destinations at the same time
+        targets: List[Client] = []
+        sends: List[Awaitable] = []
+        for codec, clients in by_codec.items():
+            encoded = package.to_bytes_multi([client.nid for client in clients], codec)
+            targets += clients
+            sends += [client.send_bytes(data, package.priority) for client, data in zip(clients, encoded)]
+            if self.metrics is not None:
+                for client, data in zip(clients, encoded):
+                    self.metrics.package_sent(client.link_type, len(data))
+        results = await aio.gather(*sends, return_exceptions=True)
+        for destination, result in zip(targets, results):
+            if isinstance(result, Exception):
+                log.warning(f"Could not route package to {destination}: {result!r}")
+
+    async def reject_package(self, package: Package, reason: str) -> None:
+        """Reply with a :class:`ResponseFailure` to a request that can't be delivered, so that its sender doesn't wait
+        until the request times out; other packages are dropped."""
+        if package.data.get("msg_type") != "Request":
+            return
+        log.debug(f"Rejecting request {package}: {reason}")
+        if self.metrics is not None:
+            self.metrics.request_rejected(package)
+        await self.route_package(package.reply(ResponseFailure("no_destination", reason).to_dict()))
 
     def serve(self):
-        if self.config.secure:
-            raise Exception("Secure servers aren't supported yet")
         log.debug(f"Serving on {self.config.url}")
         try:
             self.loop.run_until_complete(self.run())
@@ -148,10 +496,48 @@ class Server:
         self.loop.run_forever()
 
     async def run(self):
-        await websockets.serve(self.listener,
-                               host=self.config.address,
-                               port=self.config.port,
-                               loop=self.loop)
+        await self.run_bus()
+        if self.config.metrics_port is not None:
+            await self.metrics.serve_prometheus(self, self.config.address, self.config.metrics_port + self.shard)
+        kwargs = {}
+        if self.config.transport in ("ws", "wss"):
+            # All the shards listen on the same port, and the kernel distributes the connections between them
+            kwargs["reuse_port"] = self.config.shards > 1
+        if self.config.transport == "wss":
+            kwargs["ssl"] = self.config.server_ssl_context()
+        if self.config.heartbeat_interval is not None:
+            self.heartbeat_task = self.loop.create_task(self.heartbeat())
+        await transports.serve(self.listener, self.config.url,
+                               compression="deflate" if self.config.websocket_compression else None,
+                               loop=self.loop,
+                               **kwargs)
+
+    async def run_bus(self):
+        """Connect the :class:`Bus` to the other shards and to the peers.
+
+        Every shard listens on its own unix socket, and connects to the sockets of the shards with a lower number.
+
+        Only the first shard connects to the peers: the clients of the other shards are announced to the peers through
+        it."""
+        if self.config.shards > 1:
+            path = self.config.shard_socket(self.shard)
+            # Remove the socket left behind by a previous run
+            if os.path.exists(path):
+                os.unlink(path)
+            await websockets.unix_serve(self.bus.listener, path, loop=self.loop)
+            for shard in range(self.shard):
+                connect = functools.partial(websockets.unix_connect, self.config.shard_socket(shard), loop=self.loop)
+                self.loop.create_task(self.bus.connect_forever(connect))
+        if self.shard == 0:
+            for url in self.config.peers:
+                kwargs = {}
+                if transports.transport_of(url) == "wss":
+                    kwargs["ssl"] = self.config.client_ssl_context()
+                connect = functools.partial(transports.connect, url,
+                                            compression="deflate" if self.config.websocket_compression else None,
+                                            loop=self.loop,
+                                            **kwargs)
+                self.loop.create_task(self.bus.connect_forever(connect))
 
     def run_blocking(self, logging_cfg: Dict[str, Any]):
         ru.init_logging(logging_cfg)
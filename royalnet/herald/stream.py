@@ -0,0 +1,184 @@
+from typing import *
+import asyncio as aio
+import logging
+from .package import Package, ConvId
+from .request import Request
+from .response import Response, ResponseChunk, ResponseFailure, response_from_dict
+from .errors import RequestTimeoutError
+
+if TYPE_CHECKING:
+    from .link import Link
+
+
+log = logging.getLogger(__name__)
+
+
+class StreamCredit:
+    """Sent by the :class:`Link` receiving a streamed response, to allow the sender to send more chunks, or to stop
+    the stream altogether."""
+
+    def __init__(self, credit: int, cancel: bool = False, msg_type: Optional[str] = None):
+        if msg_type is not None:
+            assert msg_type == self.__class__.__name__
+        self.msg_type = self.__class__.__name__
+        self.credit: int = credit
+        """The number of additional chunks that can be sent."""
+        self.cancel: bool = cancel
+        """Whether the receiver isn't interested in the rest of the stream anymore."""
+
+    def to_dict(self):
+        return self.__dict__
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(**d)
+
+    def __repr__(self):
+        return f"{self.__class__.__qualname__}(credit={self.credit}, cancel={self.cancel})"
+
+
+class CreditWindow:
+    """The chunks that a :class:`Link` is allowed to send for a streamed response, granted by the receiver."""
+
+    def __init__(self, credit: int, *, loop: aio.AbstractEventLoop):
+        self.credit: int = credit
+        self.cancelled: bool = False
+        self._granted: aio.Event = aio.Event(loop=loop)
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} ({self.credit} credit{', cancelled' if self.cancelled else ''})>"
+
+    def grant(self, credit: StreamCredit) -> None:
+        self.credit += credit.credit
+        if credit.cancel:
+            self.cancelled = True
+        self._granted.set()
+
+    async def acquire(self, timeout: Optional[float]) -> bool:
+        """Wait until a chunk can be sent, and use a credit for it.
+
+        Returns:
+            :const:`False` if the receiver cancelled the stream, :const:`True` otherwise.
+
+        Raises:
+            :exc:`asyncio.TimeoutError` if no credit was granted in ``timeout`` seconds."""
+        while self.credit <= 0 and not self.cancelled:
+            self._granted.clear()
+            await aio.wait_for(self._granted.wait(), timeout=timeout)
+        if self.cancelled:
+            return False
+        self.credit -= 1
+        return True
+
+
+async def stream_chunks(chunks: AsyncGenerator[Any, None],
+                        on_error: Callable[[Exception], Response]) -> AsyncIterator[Response]:
+    """Convert the data yielded by an asynchronous generator to the chunks of a streamed :class:`Response`.
+
+    Parameters:
+        chunks: The asynchronous generator, such as the one returned by an :class:`Event` streaming its result.
+        on_error: A function creating the :class:`Response` that ends the stream if the generator raises an
+                  exception."""
+    try:
+        async for chunk in chunks:
+            yield ResponseChunk(data=chunk)
+    except Exception as e:
+        yield on_error(e)
+    finally:
+        await chunks.aclose()
+
+
+class ResponseStream:
+    """The streamed response to a :class:`Request`, iterated with ``async for`` to get the data of its chunks.
+
+    At most ``window`` chunks are buffered: more credit is sent to the responder as the chunks are consumed.
+
+    Use it as an asynchronous context manager to stop the stream if the iteration is interrupted: ::
+
+        async with await link.request_stream("discord", request) as stream:
+            async for chunk in stream:
+                ...
+    """
+
+    def __init__(self, link: "Link", destination: str, request: Request, conv_id: ConvId, *,
+                 window: int, timeout: Optional[float], loop: aio.AbstractEventLoop):
+        if window < 1:
+            raise ValueError("the window of a stream must be at least 1")
+        self.link: "Link" = link
+        self.destination: str = destination
+        self.request: Request = request
+        self.conv_id: ConvId = conv_id
+        """The conv_id of the package containing the :class:`Request`, that all the chunks are replies to."""
+        self.window: int = window
+        self.timeout: Optional[float] = timeout
+        """The maximum number of seconds to wait for each chunk."""
+        self.response: Optional[Response] = None
+        """The :class:`ResponseSuccess` or :class:`ResponseFailure` that ended the stream, once received."""
+        self._queue: aio.Queue = aio.Queue(loop=loop)
+        """The received packages that haven't been consumed yet, or the exception that stopped the stream."""
+        self._last_chunk: Optional[Package] = None
+        """The last received chunk, that credit is sent as a reply to."""
+        self._consumed: int = 0
+        """The chunks consumed since the last credit was sent."""
+        self.closed: bool = False
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} to {self.destination} ({self._queue.qsize()} buffered)>"
+
+    def _feed(self, package: Package) -> None:
+        """Add a package received by the :class:`Link` to the stream."""
+        self._queue.put_nowait(package)
+
+    def _fail(self, exc: Exception) -> None:
+        """Make the iteration raise an exception."""
+        self._queue.put_nowait(exc)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        if self.closed:
+            raise StopAsyncIteration()
+        try:
+            package = await aio.wait_for(self._queue.get(), timeout=self.timeout)
+        except aio.TimeoutError:
+            await self.cancel()
+            raise RequestTimeoutError(f"{self.destination} didn't send a chunk of {self.request} in {self.timeout}s")
+        if isinstance(package, Exception):
+            self._close()
+            raise package
+        response = response_from_dict(package.data)
+        if not isinstance(response, ResponseChunk):
+            self.response = response
+            self._close()
+            log.debug(f"Stream from {self.destination} ended: {response}")
+            raise StopAsyncIteration()
+        self._last_chunk = package
+        self._consumed += 1
+        # Send credit in bulk, instead of once for every chunk
+        if self._consumed >= max(1, self.window // 2):
+            await self.link.send(package.reply(StreamCredit(self._consumed).to_dict()))
+            self._consumed = 0
+        return response.data
+
+    async def cancel(self) -> None:
+        """Stop receiving the stream, and ask the responder to stop sending it.
+
+        If no chunk has been received yet, the responder can't be reached, and will stop when it runs out of
+        credit."""
+        if self.closed:
+            return
+        self._close()
+        self.response = ResponseFailure("cancelled", "The stream was cancelled by the receiver.")
+        if self._last_chunk is not None:
+            await self.link.send(self._last_chunk.reply(StreamCredit(0, cancel=True).to_dict()))
+
+    def _close(self) -> None:
+        self.closed = True
+        self.link._forget_stream(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.cancel()
@@ -0,0 +1,189 @@
+from typing import *
+import asyncio as aio
+import collections
+import itertools
+import logging
+import os
+import urllib.parse
+import websockets
+
+
+log = logging.getLogger(__name__)
+
+transports: List[str] = ["ws", "wss", "ws+unix", "memory"]
+"""The schemes of the URLs a :class:`Server` can be reached at:
+
+- ``ws://host:port/path`` and ``wss://host:port/path``: a websocket over TCP, optionally with TLS;
+- ``ws+unix:///path/to/socket``: a websocket over a Unix domain socket, for processes on the same host;
+- ``memory://name``: an in-memory connection, for a :class:`Server` and :class:`Link` running on the same event loop,
+  such as in tests or in single-process deployments."""
+
+
+def transport_of(url: str) -> str:
+    """Get the transport a URL should be reached with.
+
+    Raises:
+        :exc:`ValueError` if the scheme of the URL isn't supported."""
+    scheme = urllib.parse.urlparse(url).scheme
+    if scheme not in transports:
+        raise ValueError(f"Unsupported Herald transport: {scheme}")
+    return scheme
+
+
+class MemoryWebSocket:
+    """One end of an in-memory connection, behaving like the websocket protocols of :mod:`websockets`.
+
+    Messages are passed as they are, without being copied or framed."""
+
+    def __init__(self, remote_address: Tuple[str, int], *, max_queue: int = 32, loop: aio.AbstractEventLoop):
+        self.remote_address: Tuple[str, int] = remote_address
+        self.max_queue: int = max_queue
+        """The maximum number of messages that can be sent before the other end receives them."""
+        self.peer: Optional["MemoryWebSocket"] = None
+        """The other end of the connection."""
+        self.closed: bool = False
+        self.close_code: Optional[int] = None
+        self.close_reason: str = ""
+        self._messages: Deque[Union[str, bytes]] = collections.deque()
+        self._received: aio.Event = aio.Event(loop=loop)
+        """Set when a message is received or the connection is closed."""
+        self._consumed: aio.Event = aio.Event(loop=loop)
+        """Set when a message is consumed or the connection is closed."""
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self.remote_address[0]}:{self.remote_address[1]}>"
+
+    @classmethod
+    def pair(cls, name: str, number: int, *, loop: aio.AbstractEventLoop) \
+            -> Tuple["MemoryWebSocket", "MemoryWebSocket"]:
+        """Create the two connected ends of a new connection."""
+        client = cls(("memory", 0), loop=loop)
+        server = cls((name, number), loop=loop)
+        client.peer = server
+        server.peer = client
+        return client, server
+
+    def _check_open(self) -> None:
+        if self.closed:
+            if self.close_code in (1000, 1001):
+                raise websockets.ConnectionClosedOK(self.close_code, self.close_reason)
+            raise websockets.ConnectionClosedError(self.close_code, self.close_reason)
+
+    async def send(self, message: Union[str, bytes]) -> None:
+        self._check_open()
+        # Wait for the other end if it is too slow in receiving the messages
+        while len(self.peer._messages) >= self.max_queue:
+            self.peer._consumed.clear()
+            await self.peer._consumed.wait()
+            self._check_open()
+        self.peer._messages.append(message)
+        self.peer._received.set()
+
+    async def recv(self) -> Union[str, bytes]:
+        # The messages sent before the connection was closed can still be received
+        while not self._messages:
+            self._check_open()
+            self._received.clear()
+            await self._received.wait()
+        message = self._messages.popleft()
+        self._consumed.set()
+        return message
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        for end in (self, self.peer):
+            if not end.closed:
+                end.closed = True
+                end.close_code = code
+                end.close_reason = reason
+                end._received.set()
+                end._consumed.set()
+
+    async def __aiter__(self):
+        try:
+            while True:
+                yield await self.recv()
+        except websockets.ConnectionClosedOK:
+            return
+
+
+class MemoryServer:
+    """Accepts the in-memory connections to a name, like :func:`websockets.serve` does for a port."""
+
+    servers: Dict[str, "MemoryServer"] = {}
+    """The servers listening in this process, indexed by name."""
+
+    def __init__(self, handler: Callable[[MemoryWebSocket, str], Awaitable[None]], name: str, *,
+                 loop: aio.AbstractEventLoop):
+        self.handler = handler
+        self.name: str = name
+        self.loop: aio.AbstractEventLoop = loop
+        self._numbers: Iterator[int] = itertools.count(1)
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} memory://{self.name}>"
+
+    def connect(self) -> MemoryWebSocket:
+        """Create a new connection, and handle its server end in a new task."""
+        client, server = MemoryWebSocket.pair(self.name, next(self._numbers), loop=self.loop)
+        self.loop.create_task(self._handle(server))
+        return client
+
+    async def _handle(self, websocket: MemoryWebSocket) -> None:
+        try:
+            await self.handler(websocket, "/")
+        except Exception as e:
+            log.error(f"Error in the handler of {websocket}: {e!r}")
+        finally:
+            await websocket.close()
+
+    def close(self) -> None:
+        """Stop accepting new connections."""
+        if self.servers.get(self.name) is self:
+            del self.servers[self.name]
+
+
+async def serve(handler, url: str, *,
+                loop: aio.AbstractEventLoop,
+                **kwargs) -> Union["websockets.WebSocketServer", MemoryServer]:
+    """Accept the connections to a URL, handling each of them with ``handler``.
+
+    The other keyword arguments are passed to :func:`websockets.serve` or :func:`websockets.unix_serve`.
+
+    Raises:
+        :exc:`OSError` if something else is already listening at the URL."""
+    transport = transport_of(url)
+    parsed = urllib.parse.urlparse(url)
+    if transport == "memory":
+        if parsed.netloc in MemoryServer.servers:
+            raise OSError(f"Something is already listening at {url}")
+        server = MemoryServer.servers[parsed.netloc] = MemoryServer(handler, parsed.netloc, loop=loop)
+        return server
+    elif transport == "ws+unix":
+        # Remove the socket left behind by a previous run
+        if os.path.exists(parsed.path):
+            os.unlink(parsed.path)
+        return await websockets.unix_serve(handler, parsed.path, loop=loop, **kwargs)
+    else:
+        return await websockets.serve(handler, host=parsed.hostname, port=parsed.port, loop=loop, **kwargs)
+
+
+async def connect(url: str, *,
+                  loop: aio.AbstractEventLoop,
+                  **kwargs) -> Union["websockets.WebSocketClientProtocol", MemoryWebSocket]:
+    """Connect to the :class:`Server` at a URL.
+
+    The other keyword arguments are passed to :func:`websockets.connect` or :func:`websockets.unix_connect`.
+
+    Raises:
+        :exc:`ConnectionRefusedError` if nothing is listening at an in-memory URL."""
+    transport = transport_of(url)
+    parsed = urllib.parse.urlparse(url)
+    if transport == "memory":
+        server = MemoryServer.servers.get(parsed.netloc)
+        if server is None:
+            raise ConnectionRefusedError(f"Nothing is listening at {url}")
+        return server.connect()
+    elif transport == "ws+unix":
+        return await websockets.unix_connect(parsed.path, uri="ws://localhost/", loop=loop, **kwargs)
+    else:
+        return await websockets.connect(url, loop=loop, **kwargs)
@@ -1,9 +1,14 @@
 """The subpackage providing all Serf implementations."""
 
 from .serf import Serf
-from .errors import SerfError
+from .errors import SerfError, CommandRejectedError
+from .scheduler import CommandScheduler
+from .supervisor import TaskSupervisor
 
 __all__ = [
     "Serf",
     "SerfError",
+    "CommandRejectedError",
+    "CommandScheduler",
+    "TaskSupervisor",
 ]
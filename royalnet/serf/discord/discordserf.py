@@ -6,7 +6,7 @@ import sys
 from typing import *
 import royalnet.backpack.tables as rbt
 import royalnet.commands as rc
-from royalnet.utils import asyncify, sentry_exc
+from royalnet.utils import sentry_exc
 from royalnet.serf import Serf
 from .escape import escape
 from .voiceplayer import VoicePlayer
@@ -84,11 +84,7 @@ class DiscordSerf(Serf):
 
             async def get_author(data, error_if_none=False):
                 user: "discord.Member" = data.message.author
-                query = data.session.query(self.master_table)
-                for link in self.identity_chain:
-                    query = query.join(link.mapper.class_)
-                query = query.filter(self.identity_column == user.id)
-                result = await asyncify(query.one_or_none)
+                result = await self.find_author(data.session, user.id)
                 if result is None and error_if_none:
                     raise rc.CommandError("You must be registered to use this command.")
                 return result
@@ -104,38 +100,22 @@ class DiscordSerf(Serf):
         # Skip non-text messages
         if not text:
             return
-        # Skip non-command updates
-        if not text.startswith("!"):
-            return
         # Skip bot messages
         author: Union["discord.User"] = message.author
         if author.bot:
             return
-        # Find and clean parameters
-        command_text, *parameters = text.split(" ")
-        # Don't use a case-sensitive command name
-        command_name = command_text.lower()
-        # Find the command
-        try:
-            command = self.commands[command_name]
-        except KeyError:
-            # Skip the message
+        # Find the command and its parameters, skipping non-command messages
+        found = self.find_command(text)
+        if found is None:
             return
+        command, parameters = found
         # Call the command
         log.debug(f"Calling command '{command.name}'")
         with message.channel.typing():
-            # Open an alchemy session, if available
-            if self.alchemy is not None:
-                session = await asyncify(self.alchemy.Session)
-            else:
-                session = None
-            # Prepare data
+            # Prepare data; its alchemy session is opened only if the command uses it
             data = self.Data(interface=command.interface, loop=self.loop, message=message)
             # Call the command
-            await self.call(command, data, parameters)
-            # Close the alchemy session
-            if session is not None:
-                await asyncify(session.close)
+            await self.call(command, data, parameters, user=author.id, chat=message.channel.id)
 
     def client_factory(self) -> Type["discord.Client"]:
         """Create a custom class inheriting from :py:class:`discord.Client`."""
@@ -143,8 +123,7 @@ class DiscordSerf(Serf):
         class DiscordClient(discord.Client):
             async def on_message(cli, message: "discord.Message") -> None:
                 """Handle messages received by passing them to the handle_message method of the bot."""
-                # TODO: keep reference to these tasks somewhere
-                self.loop.create_task(self.handle_message(message))
+                self.tasks.spawn(self.handle_message(message), "handle_message")
 
             async def on_ready(cli) -> None:
                 """Change the bot presence to ``online`` when the bot is ready."""
@@ -1,2 +1,19 @@
 class SerfError(Exception):
     """Base class for all :mod:`royalnet.serf` errors."""
+
+
+class CommandRejectedError(SerfError):
+    """The :class:`CommandScheduler` refused to run a command."""
+
+    def __init__(self, reason: str, message: str, notify: bool = True):
+        super().__init__(message)
+        self.reason: str = reason
+        """Why the command was rejected: ``user``, ``chat`` or ``command`` if a rate limit was exceeded,
+        ``queue_full`` if too many commands were waiting to run, or ``duplicate`` if the same invocation was already
+        running."""
+        self.message: str = message
+        """The message that can be sent to the user."""
+        self.notify: bool = notify
+        """Should the user be told that the command was rejected?
+
+        It is :const:`False` if the user has already been told since the limit was exceeded."""
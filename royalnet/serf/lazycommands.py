@@ -0,0 +1,161 @@
+from typing import *
+import logging
+from royalnet.commands import Command
+
+
+log = logging.getLogger(__name__)
+
+
+class CommandLoader:
+    """Initialize a :class:`Command` the first time it is needed, and remember it."""
+
+    def __init__(self, command_class: Type[Command], init: Callable[[], Optional[Command]]):
+        self.command_class: Type[Command] = command_class
+        """The class of the :class:`Command` that will be initialized."""
+        self._init: Callable[[], Optional[Command]] = init
+        self._command: Optional[Command] = None
+        self._initialized: bool = False
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {self.command_class.__qualname__}" \
+               f"{' (initialized)' if self._initialized else ''}>"
+
+    @property
+    def initialized(self) -> bool:
+        """Has the initialization of the :class:`Command` already been attempted?"""
+        return self._initialized
+
+    @property
+    def command(self) -> Optional[Command]:
+        """The :class:`Command`, or :const:`None` if its initialization failed.
+
+        It is initialized the first time this property is accessed."""
+        if not self._initialized:
+            log.debug(f"Initializing: {self.command_class.__qualname__}")
+            self._command = self._init()
+            self._initialized = True
+        return self._command
+
+
+class LazyCommands(Mapping[str, Command]):
+    """A read-only :class:`dict` connecting each command name to its :class:`Command`, where every :class:`Command` is
+    initialized the first time it is looked up.
+
+    Commands whose initialization failed behave as if they weren't registered.
+    Aliases share the :class:`CommandLoader` of their command, so that it is initialized only once."""
+
+    def __init__(self):
+        self._loaders: Dict[str, CommandLoader] = {}
+        self._prefixes: Optional[Dict[str, CommandLoader]] = None
+        """The table connecting every unambiguous prefix of the command names to its :class:`CommandLoader`, or
+        :const:`None` if it has to be built again."""
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {len(self)} commands, {self.initialized} initialized>"
+
+    def __getitem__(self, name: str) -> Command:
+        command = self._loaders[name].command
+        if command is None:
+            raise KeyError(name)
+        return command
+
+    def __contains__(self, name: object) -> bool:
+        # Don't initialize the command just to check if it exists
+        return name in self._loaders
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loaders)
+
+    def __len__(self) -> int:
+        return len(self._loaders)
+
+    @property
+    def initialized(self) -> int:
+        """The number of commands that have already been initialized."""
+        return len({id(loader) for loader in self._loaders.values() if loader.initialized})
+
+    def loader(self, name: str) -> CommandLoader:
+        """Get the :class:`CommandLoader` registered with a name.
+
+        Raises:
+            :exc:`KeyError` if no command has that name."""
+        return self._loaders[name]
+
+    def register(self, name: str, loader: CommandLoader) -> None:
+        """Register a :class:`CommandLoader` with a name, replacing the one that was there before."""
+        self._loaders[name] = loader
+        self._prefixes = None
+
+    def unregister(self, name: str) -> None:
+        """Remove the :class:`CommandLoader` registered with a name.
+
+        Raises:
+            :exc:`KeyError` if no command has that name."""
+        del self._loaders[name]
+        self._prefixes = None
+
+    def _build_prefixes(self, start: int) -> Dict[str, CommandLoader]:
+        candidates: Dict[str, Set[CommandLoader]] = {}
+        for name, loader in self._loaders.items():
+            for end in range(start + 1, len(name)):
+                candidates.setdefault(name[:end], set()).add(loader)
+        # Aliases of the same command share the loader, so a prefix of both of them isn't ambiguous
+        return {prefix: loaders.pop() for prefix, loaders in candidates.items() if len(loaders) == 1}
+
+    def _find_loader(self, name: str, prefix_matching: bool, start: int) -> Optional[CommandLoader]:
+        loader = self._loaders.get(name)
+        if loader is None and prefix_matching:
+            if self._prefixes is None:
+                self._prefixes = self._build_prefixes(start)
+            loader = self._prefixes.get(name)
+        return loader
+
+    def resolve(self, name: str, prefix_matching: bool = False, start: int = 1) -> Optional[Command]:
+        """Find the :class:`Command` with a name or an alias.
+
+        Parameters:
+            name: The name to look for, including the interface prefix.
+            prefix_matching: If no command has exactly that name, look for the only command whose name or aliases
+                             start with it.
+            start: The length of the interface prefix; at least a character after it is required to match a prefix.
+
+        Returns:
+            The :class:`Command`, or :const:`None` if no command matches or it failed to initialize."""
+        loader = self._find_loader(name, prefix_matching, start)
+        if loader is None:
+            return None
+        return loader.command
+
+    def parse(self,
+              text: str,
+              prefix: str,
+              suffix: Optional[str] = None,
+              prefix_matching: bool = False) -> Optional[Tuple[Command, List[str]]]:
+        """Find the :class:`Command` called by a chat message, and its parameters.
+
+        Messages that don't start with the ``prefix`` are rejected without looking at the rest of the text, and the
+        parameters are split only if a command is found.
+
+        Parameters:
+            text: The text of the message, such as ``"/command@bot first second"``.
+            prefix: The prefix of the commands on the interface, such as ``"/"``.
+            suffix: A string to remove from the end of the command name, such as ``"@bot"``.
+            prefix_matching: Allow calling commands with an unambiguous prefix of their name; see :meth:`.resolve`.
+
+        Returns:
+            A :class:`tuple` containing the :class:`Command` and the :class:`list` of parameters, or :const:`None` if
+            the message doesn't call any command."""
+        if not text.startswith(prefix):
+            return None
+        end = text.find(" ")
+        # Command names aren't case-sensitive
+        name = (text if end == -1 else text[:end]).lower()
+        if suffix is not None and name.endswith(suffix):
+            name = name[:-len(suffix)]
+        loader = self._find_loader(name, prefix_matching, len(prefix))
+        if loader is None:
+            return None
+        command = loader.command
+        if command is None:
+            return None
+        return command, [] if end == -1 else text[end + 1:].split(" ")
@@ -78,11 +78,7 @@ class MatrixSerf(Serf):
 
             async def get_author(data, error_if_none=False):
                 user: str = data.event.sender
-                query = data.session.query(self.master_table)
-                for link in self.identity_chain:
-                    query = query.join(link.mapper.class_)
-                query = query.filter(self.identity_column == user)
-                result = await ru.asyncify(query.one_or_none)
+                result = await self.find_author(data.session, user)
                 if result is None and error_if_none:
                     raise rc.CommandError("You must be registered to use this command.")
                 return result
@@ -97,33 +93,17 @@ class MatrixSerf(Serf):
             return
         # Find the text in the event
         text = event.body
-        # Skip non-command events
-        if not text.startswith("!"):
-            return
-        # Find and clean parameters
-        command_text, *parameters = text.split(" ")
-        # Don't use a case-sensitive command name
-        command_name = command_text.lower()
-        # Find the command
-        try:
-            command = self.commands[command_name]
-        except KeyError:
-            # Skip the message
+        # Find the command and its parameters, skipping non-command events
+        found = self.find_command(text)
+        if found is None:
             return
+        command, parameters = found
         # Send typing
         await self.client.room_typing(room_id=room.room_id, typing_state=True)
-        # Open an alchemy session, if available
-        if self.alchemy is not None:
-            session = await ru.asyncify(self.alchemy.Session)
-        else:
-            session = None
-        # Prepare data
+        # Prepare data; its alchemy session is opened only if the command uses it
         data = self.Data(interface=command.interface, loop=self.loop, room=room, event=event)
         # Call the command
-        await self.call(command, data, parameters)
-        # Close the alchemy session
-        if session is not None:
-            await ru.asyncify(session.close)
+        await self.call(command, data, parameters, user=event.sender, chat=room.room_id)
 
     async def run(self):
         self.client = nio.AsyncClient(self.homeserver, self.matrix_id)
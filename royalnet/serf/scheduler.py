@@ -0,0 +1,220 @@
+from typing import *
+import asyncio as aio
+import collections
+import contextlib
+import logging
+import time
+import royalnet.utils as ru
+from .errors import CommandRejectedError
+
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """A rate limit that allows ``burst`` calls at once, and then ``rate`` calls every second."""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = burst
+        """The number of calls that can be made right now; it may be fractional."""
+        self.updated: float = now
+        self.warned: bool = False
+        """Has the user been told that this limit was exceeded, since the last time a call was allowed?"""
+
+    def refill(self, now: float) -> None:
+        """Add the tokens earned since the last refill."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class SchedulerMetrics:
+    """Counters about the commands that went through a :class:`CommandScheduler`."""
+
+    def __init__(self):
+        self.calls: int = 0
+        self.started: int = 0
+        self.rejected: Counter[str] = collections.Counter()
+        """The number of rejected commands, indexed by the reason they were rejected for."""
+        self.queued: int = 0
+        """The number of commands that had to wait for a free slot before running."""
+        self.queue_wait_sum: float = 0.0
+        """The sum of the seconds the queued commands waited for."""
+        self.queue_wait_max: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "started": self.started,
+            "rejected": dict(self.rejected),
+            "queued": self.queued,
+            "queue_wait_mean": self.queue_wait_sum / self.queued if self.queued else None,
+            "queue_wait_max": self.queue_wait_max,
+        }
+
+
+class CommandScheduler:
+    """Decide if and when the commands called by the users of a :class:`Serf` can run.
+
+    A command is rejected if:
+
+    - the same user already has an identical invocation running or waiting, and ``drop_duplicates`` is enabled;
+    - the token bucket of its user, its chat or its command is empty;
+    - ``max_concurrent`` commands are running and ``max_queued`` are already waiting to run.
+
+    Otherwise, it runs as soon as fewer than ``max_concurrent`` commands are running.
+
+    Every limit is disabled by default, so that commands run as soon as they are called unless the limits are
+    configured: a ``rate`` of :const:`None` or ``0`` disables the corresponding token buckets, a ``max_concurrent`` of
+    :const:`None` lets any number of commands run at the same time, and a ``max_queued`` of :const:`None` lets any
+    number of them wait."""
+
+    rejection_messages: Dict[str, str] = {
+        "user": "You're sending commands too quickly, please wait a few seconds.",
+        "chat": "Too many commands are being sent in this chat, please wait a few seconds.",
+        "command": "This command is being used too often right now, please try again in a few seconds.",
+        "queue_full": "Royalnet is too busy right now, please try again later.",
+        "duplicate": "This command is already running.",
+    }
+    """The messages of the :exc:`CommandRejectedError` raised for each reason."""
+
+    def __init__(self, *,
+                 user_rate: Optional[float] = None,
+                 user_burst: int = 5,
+                 chat_rate: Optional[float] = None,
+                 chat_burst: int = 20,
+                 command_rate: Optional[float] = None,
+                 command_burst: int = 50,
+                 max_concurrent: Optional[int] = None,
+                 max_queued: Optional[int] = None,
+                 drop_duplicates: bool = False,
+                 max_buckets: int = 10000,
+                 loop: aio.AbstractEventLoop = None):
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        if loop is None:
+            self.loop = aio.get_event_loop()
+        else:
+            self.loop = loop
+        self.limits: Dict[str, Tuple[Optional[float], int]] = {
+            "user": (user_rate, user_burst),
+            "chat": (chat_rate, chat_burst),
+            "command": (command_rate, command_burst),
+        }
+        """The rate and the burst of the token buckets of each kind."""
+        self._buckets: Dict[str, ru.LRUCache] = {
+            # A bucket that wasn't used for burst / rate seconds is full, so it can be forgotten
+            kind: ru.LRUCache(max_buckets, burst / rate) for kind, (rate, burst) in self.limits.items()
+            if rate is not None and rate > 0
+        }
+        self.max_concurrent: Optional[int] = max_concurrent
+        """The maximum number of commands that can run at the same time, or :const:`None` if there is no limit."""
+        self.max_queued: Optional[int] = max_queued
+        """The maximum number of commands that can wait for a free slot, or :const:`None` if there is no limit; more
+        are rejected."""
+        self.drop_duplicates: bool = drop_duplicates
+        """Reject a command if the same user called it with the same parameters in the same chat, and it hasn't
+        finished yet."""
+        self._semaphore: Optional[aio.Semaphore] = \
+            aio.Semaphore(max_concurrent, loop=self.loop) if max_concurrent is not None else None
+        self._in_flight: Set[Hashable] = set()
+        self.running: int = 0
+        """The number of commands currently running."""
+        self.waiting: int = 0
+        """The number of commands currently waiting for a free slot."""
+        self.metrics: SchedulerMetrics = SchedulerMetrics()
+
+    @classmethod
+    def from_config(cls, limits_cfg: Dict[str, Any], loop: aio.AbstractEventLoop = None) -> "CommandScheduler":
+        """Create a :class:`CommandScheduler` from the ``Limits`` table of the config of a :class:`Serf`; missing
+        values use the defaults."""
+        return cls(**limits_cfg, loop=loop)
+
+    def __repr__(self):
+        max_concurrent = "unlimited" if self.max_concurrent is None else self.max_concurrent
+        max_queued = "unlimited" if self.max_queued is None else self.max_queued
+        return f"<{self.__class__.__qualname__} {self.running}/{max_concurrent} running, " \
+               f"{self.waiting}/{max_queued} waiting>"
+
+    def _reject(self, reason: str, notify: bool = True) -> CommandRejectedError:
+        self.metrics.rejected[reason] += 1
+        log.debug(f"Rejected command: {reason}")
+        return CommandRejectedError(reason, self.rejection_messages[reason], notify=notify)
+
+    def _take_tokens(self, keys: Dict[str, Hashable]) -> None:
+        """Take a token from the bucket of every passed key, only if all of them have one.
+
+        Raises:
+            :exc:`CommandRejectedError` if one of the buckets is empty."""
+        now = time.monotonic()
+        buckets = []
+        for kind, key in keys.items():
+            cache = self._buckets.get(kind)
+            if cache is None or key is None:
+                continue
+            bucket: Optional[TokenBucket] = cache.get(key)
+            if bucket is None:
+                bucket = TokenBucket(*self.limits[kind], now)
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                notify = not bucket.warned
+                bucket.warned = True
+                cache.put(key, bucket)
+                raise self._reject(kind, notify=notify)
+            buckets.append((cache, key, bucket))
+        for cache, key, bucket in buckets:
+            bucket.tokens -= 1
+            bucket.warned = False
+            cache.put(key, bucket)
+
+    @contextlib.asynccontextmanager
+    async def slot(self,
+                   command_name: str,
+                   parameters: Sequence[str] = (),
+                   user: Optional[Hashable] = None,
+                   chat: Optional[Hashable] = None) -> AsyncIterator[None]:
+        """Wait until a command can run, and hold its slot for the duration of an ``async with`` block.
+
+        Parameters:
+            command_name: The name of the command, used for its token bucket and to find duplicate invocations.
+            parameters: The parameters of the command, used to find duplicate invocations.
+            user: An identifier of the user calling the command, or :const:`None` if it isn't known.
+            chat: An identifier of the chat the command was called in, or :const:`None` if it isn't known.
+
+        Raises:
+            :exc:`CommandRejectedError` if the command can't run."""
+        self.metrics.calls += 1
+        invocation = (user, chat, command_name, tuple(parameters))
+        if self.drop_duplicates and invocation in self._in_flight:
+            raise self._reject("duplicate", notify=False)
+        # Check the queue first, so that a command rejected because it can't wait doesn't use up the rate limits
+        busy = self._semaphore is not None and self._semaphore.locked()
+        if busy and self.max_queued is not None and self.waiting >= self.max_queued:
+            raise self._reject("queue_full")
+        self._take_tokens({"user": user, "chat": chat, "command": command_name})
+        self._in_flight.add(invocation)
+        try:
+            if busy:
+                start = self.loop.time()
+                self.waiting += 1
+                try:
+                    await self._semaphore.acquire()
+                finally:
+                    self.waiting -= 1
+                wait = self.loop.time() - start
+                self.metrics.queued += 1
+                self.metrics.queue_wait_sum += wait
+                self.metrics.queue_wait_max = max(self.metrics.queue_wait_max, wait)
+            elif self._semaphore is not None:
+                await self._semaphore.acquire()
+            self.metrics.started += 1
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+                if self._semaphore is not None:
+                    self._semaphore.release()
+        finally:
+            self._in_flight.discard(invocation)
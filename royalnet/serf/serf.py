@@ -1,16 +1,22 @@
 import logging
-import importlib
+import functools
+import signal
+import inspect
 import asyncio as aio
-import sys
 from typing import *
+from sqlalchemy import bindparam
+from sqlalchemy.ext import baked
 from sqlalchemy.schema import Table
 from royalnet.commands import *
 import royalnet.utils as ru
 import royalnet.alchemy as ra
 import royalnet.backpack.tables as rbt
 import royalnet.herald as rh
-import traceback
 import abc
+from .lazycommands import LazyCommands, CommandLoader
+from .scheduler import CommandScheduler
+from .supervisor import TaskSupervisor
+from .errors import CommandRejectedError
 
 
 log = logging.getLogger(__name__)
@@ -30,26 +36,25 @@ class Serf(abc.ABC):
                  alchemy_cfg: Dict[str, Any],
                  herald_cfg: Dict[str, Any],
                  packs_cfg: Dict[str, Any],
+                 serf_cfg: Optional[Dict[str, Any]] = None,
                  **_):
         self.loop: Optional[aio.AbstractEventLoop] = loop
         """The event loop this Serf is running on."""
 
-        # Import packs
-        pack_names = packs_cfg["active"]
-        packs = {}
-        for pack_name in pack_names:
-            log.debug(f"Importing pack: {pack_name}")
-            try:
-                packs[pack_name] = {
-                    "commands": importlib.import_module(f"{pack_name}.commands"),
-                    "events": importlib.import_module(f"{pack_name}.events"),
-                    "stars": importlib.import_module(f"{pack_name}.stars"),
-                    "tables": importlib.import_module(f"{pack_name}.tables"),
-                }
-            except ImportError as e:
-                log.error(f"{e.__class__.__name__} during the import of {pack_name}:\n"
-                          f"{''.join(traceback.format_exception(*sys.exc_info()))}")
-        log.info(f"Packs: {len(packs)} imported")
+        self.scheduler: CommandScheduler = CommandScheduler.from_config((serf_cfg or {}).get("Limits", {}), loop=loop)
+        """The :class:`CommandScheduler` deciding if and when the called commands can run."""
+
+        self.tasks: TaskSupervisor = TaskSupervisor(loop=loop)
+        """The :class:`TaskSupervisor` owning the tasks started to handle the received updates."""
+
+        self.drain_timeout: float = (serf_cfg or {}).get("drain_timeout", 30.0)
+        """The maximum number of seconds to wait for the running tasks to finish when the Serf is stopped."""
+
+        # Import only the parts of the packs that a Serf uses
+        submodules = ["commands", "events"]
+        if ra.Alchemy is not None and alchemy_cfg["enabled"]:
+            submodules.append("tables")
+        packs = ru.import_packs(packs_cfg["active"], submodules, packs_cfg.get("import_time_warning"))
 
         self.alchemy: Optional[ra.Alchemy] = None
         """The :class:`Alchemy` object connecting this :class:`Serf` to a database."""
@@ -64,6 +69,17 @@ class Serf(abc.ABC):
         # TODO: I'm not sure what this is either
         self.identity_column: Optional[str] = None
 
+        self.identity_chain: Optional[tuple] = None
+        """The relationship path starting from the master table and ending at the identity table."""
+
+        self.author_query: Optional[baked.BakedQuery] = None
+        """The precompiled query finding the master table row linked to the identity with the ``identity_id``
+        bound parameter."""
+
+        self.identity_cache: Optional[ru.LRUCache] = None
+        """The cache connecting each identity id to the primary key of its master table row, or :const:`None` if
+        it is disabled."""
+
         # Alchemy
         if ra.Alchemy is None:
             log.info("Alchemy: not installed")
@@ -94,8 +110,17 @@ class Serf(abc.ABC):
         self.Interface: Type[CommandInterface] = self.interface_factory()
         """The :class:`CommandInterface` class of this Serf."""
 
-        self.commands: Dict[str, Command] = {}
-        """The :class:`dict` connecting each command name to its :class:`Command` object."""
+        self.lazy_commands: bool = packs_cfg.get("lazy_commands", True)
+        """Should the :class:`Command` objects be initialized only when they are called for the first time?"""
+
+        self.commands: LazyCommands = LazyCommands()
+        """The :class:`dict`-like object connecting each command name to its :class:`Command` object."""
+
+        self.prefix_matching: bool = packs_cfg.get("prefix_matching", False)
+        """Can the commands be called with an unambiguous prefix of their name or of one of their aliases?
+
+        It is disabled by default, as it lets typos and the commands of other bots in the same chat run one of the
+        commands."""
 
         for pack_name in packs:
             pack = packs[pack_name]
@@ -113,7 +138,7 @@ class Serf(abc.ABC):
             else:
                 self.register_commands(commands, pack_cfg)
         log.info(f"Events: {len(self.events)} events")
-        log.info(f"Commands: {len(self.commands)} commands")
+        log.info(f"Commands: {len(self.commands)} commands{' (lazy)' if self.lazy_commands else ''}")
 
         if rh.Link is None:
             log.info("Herald: not installed")
@@ -124,19 +149,52 @@ class Serf(abc.ABC):
             log.info(f"Herald: enabled")
 
     def init_alchemy(self, alchemy_cfg: Dict[str, Any], tables: Set[type]) -> None:
-        """Create and initialize the :class:`Alchemy` with the required tables, and find the link between the master
-        table and the identity table."""
+        """Create and initialize the :class:`Alchemy` with the required tables, find the link between the master
+        table and the identity table, and prepare the query to find the master table row of an identity."""
         self.alchemy = ra.Alchemy(alchemy_cfg["database_url"], tables)
         self.master_table = self.alchemy.get(self._master_table)
         self.identity_table = self.alchemy.get(self._identity_table)
         # This is fine, as Pycharm doesn't know that identity_table is a class and not an object
         # noinspection PyArgumentList
         self.identity_column = self.identity_table.__getattribute__(self.identity_table, self._identity_column)
-
-    @property
-    def identity_chain(self) -> tuple:
-        """Find a relationship path starting from the master table and ending at the identity table, and return it."""
-        return ra.table_dfs(self.master_table, self.identity_table)
+        self.identity_chain = ra.table_dfs(self.master_table, self.identity_table)
+        # The SQL of the query is generated only the first time it is run
+        self.author_query = baked.bakery()(lambda session: session.query(self.master_table))
+        for link in self.identity_chain:
+            self.author_query.add_criteria(lambda query, table=link.mapper.class_: query.join(table),
+                                           link.mapper.class_)
+        self.author_query.add_criteria(lambda query: query.filter(self.identity_column == bindparam("identity_id")))
+        cache_size = alchemy_cfg.get("identity_cache_size", 1024)
+        if cache_size:
+            self.identity_cache = ru.LRUCache(cache_size, alchemy_cfg.get("identity_cache_ttl", 300.0))
+
+    async def find_author(self, session, identity_id: Any) -> Optional[Any]:
+        """Find the master table row linked to an identity, using the :attr:`.identity_cache` if possible.
+
+        Parameters:
+            session: The :class:`Session` that should be used for the query.
+            identity_id: The value of the identity column, such as the Telegram user id.
+
+        Returns:
+            The master table row, or :const:`None` if the identity isn't linked to any."""
+        if self.identity_cache is not None:
+            primary_key = self.identity_cache.get(identity_id)
+            if primary_key is not None:
+                result = await ru.asyncify(session.query(self.master_table).get, primary_key)
+                if result is not None:
+                    return result
+                self.identity_cache.invalidate(identity_id)
+        result = await ru.asyncify(self.author_query(session).params(identity_id=identity_id).one_or_none)
+        # Unregistered identities aren't cached, so that they can be used as soon as they are synced
+        if result is not None and self.identity_cache is not None:
+            primary_key = tuple(self.master_table.__mapper__.primary_key_from_instance(result))
+            self.identity_cache.put(identity_id, primary_key)
+        return result
+
+    def invalidate_identity(self, identity_id: Any) -> None:
+        """Forget the cached master table row of an identity; call this after changing the identity link."""
+        if self.identity_cache is not None:
+            self.identity_cache.invalidate(identity_id)
 
     def interface_factory(self) -> Type[CommandInterface]:
         """Create the :class:`CommandInterface` class for the Serf."""
@@ -154,75 +212,83 @@ class Serf(abc.ABC):
                 request: rh.Request = rh.Request(handler=event_name, data=kwargs)
                 response: rh.Response = await self.herald.request(destination=destination, request=request)
                 if isinstance(response, rh.ResponseFailure):
-                    if response.name == "no_event":
-                        raise ProgramError(f"There is no event named {event_name} in {destination}.")
-                    elif response.name == "error_in_event":
-                        if response.extra_info["type"] == "CommandError":
-                            raise CommandError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "UserError":
-                            raise UserError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "InvalidInputError":
-                            raise InvalidInputError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "UnsupportedError":
-                            raise UnsupportedError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "ConfigurationError":
-                            raise ConfigurationError(response.extra_info["message"])
-                        elif response.extra_info["type"] == "ExternalError":
-                            raise ExternalError(response.extra_info["message"])
-                        else:
-                            raise ProgramError(f"Invalid error in Herald event '{event_name}':\n"
-                                               f"[b]{response.extra_info['type']}[/b]\n"
-                                               f"{response.extra_info['message']}")
-                    elif response.name == "unhandled_exception_in_event":
-                        raise ProgramError(f"Unhandled exception in Herald event '{event_name}':\n"
-                                           f"[b]{response.extra_info['type']}[/b]\n"
-                                           f"{response.extra_info['message']}")
-                    else:
-                        raise ProgramError(f"Unknown response in Herald event '{event_name}':\n"
-                                           f"[b]{response.name}[/b]"
-                                           f"[p]{response}[/p]")
+                    raise herald_failure_error(destination, event_name, response)
                 elif isinstance(response, rh.ResponseSuccess):
                     return response.data
                 else:
                     raise ProgramError(f"Other Herald Link returned unknown response:\n"
                                        f"[p]{response}[/p]")
 
+            async def call_herald_event_stream(ci, destination: str, event_name: str, **kwargs) -> AsyncIterator[Dict]:
+                """Send a :class:`royalherald.Request` to a specific destination, and iterate on the chunks of its
+                streamed :class:`royalherald.Response`."""
+                if self.herald is None:
+                    raise UnsupportedError("`royalherald` is not enabled on this serf.")
+                request: rh.Request = rh.Request(handler=event_name, data=kwargs)
+                async with await self.herald.request_stream(destination=destination, request=request) as stream:
+                    async for chunk in stream:
+                        yield chunk
+                if isinstance(stream.response, rh.ResponseFailure):
+                    raise herald_failure_error(destination, event_name, stream.response)
+
         return GenericInterface
 
+    def init_command(self, SelectedCommand: Type[Command], pack_cfg: Dict[str, Any]) -> Optional[Command]:
+        """Initialize a command, returning :const:`None` if it raised an exception."""
+        # Create a new interface
+        interface = self.Interface(config=pack_cfg)
+        # Try to instantiate the command
+        try:
+            command = SelectedCommand(interface)
+        except Exception as e:
+            log.error(f"Skipping: "
+                      f"{SelectedCommand.__qualname__} - {e.__class__.__qualname__} in the initialization.")
+            ru.sentry_exc(e)
+            return None
+        # Link the interface to the command
+        interface.command = command
+        return command
+
     def register_commands(self, commands: List[Type[Command]], pack_cfg: Dict[str, Any]) -> None:
-        """Initialize and register all commands passed as argument."""
-        # Instantiate the Commands
+        """Register all commands passed as argument, initializing them now or, if :attr:`.lazy_commands` is
+        :const:`True`, the first time they are called."""
+        prefix = self.Interface.prefix
         for SelectedCommand in commands:
-            # Create a new interface
-            interface = self.Interface(config=pack_cfg)
-            # Try to instantiate the command
-            try:
-                command = SelectedCommand(interface)
-            except Exception as e:
-                log.error(f"Skipping: "
-                          f"{SelectedCommand.__qualname__} - {e.__class__.__qualname__} in the initialization.")
-                ru.sentry_exc(e)
+            loader = CommandLoader(SelectedCommand, functools.partial(self.init_command, SelectedCommand, pack_cfg))
+            if not self.lazy_commands and loader.command is None:
                 continue
-            # Link the interface to the command
-            interface.command = command
             # Warn if the command would be overriding something
-            if f"{self.Interface.prefix}{SelectedCommand.name}" in self.commands:
+            if f"{prefix}{SelectedCommand.name}" in self.commands:
                 log.info(f"Overriding (already defined): "
-                         f"{SelectedCommand.__qualname__} -> {self.Interface.prefix}{SelectedCommand.name}")
+                         f"{SelectedCommand.__qualname__} -> {prefix}{SelectedCommand.name}")
             else:
                 log.debug(f"Registering: "
-                          f"{SelectedCommand.__qualname__} -> {self.Interface.prefix}{SelectedCommand.name}")
+                          f"{SelectedCommand.__qualname__} -> {prefix}{SelectedCommand.name}")
             # Register the command in the commands dict
-            self.commands[f"{interface.prefix}{SelectedCommand.name}"] = command
+            self.commands.register(f"{prefix}{SelectedCommand.name}", loader)
             # Register aliases, but don't override anything
             for alias in SelectedCommand.aliases:
-                if f"{interface.prefix}{alias}" not in self.commands:
-                    log.debug(f"Aliasing: {SelectedCommand.__qualname__} -> {interface.prefix}{alias}")
-                    self.commands[f"{interface.prefix}{alias}"] = \
-                        self.commands[f"{interface.prefix}{SelectedCommand.name}"]
+                if f"{prefix}{alias}" not in self.commands:
+                    log.debug(f"Aliasing: {SelectedCommand.__qualname__} -> {prefix}{alias}")
+                    self.commands.register(f"{prefix}{alias}", loader)
                 else:
                     log.warning(
-                        f"Ignoring (already defined): {SelectedCommand.__qualname__} -> {interface.prefix}{alias}")
+                        f"Ignoring (already defined): {SelectedCommand.__qualname__} -> {prefix}{alias}")
+
+    def find_command(self, text: str, suffix: Optional[str] = None) -> Optional[Tuple[Command, List[str]]]:
+        """Find the :class:`Command` called by the text of a message, and its parameters.
+
+        Parameters:
+            text: The text of the message.
+            suffix: A string that can be appended to the command name, such as the ``@username`` of a Telegram bot.
+
+        Returns:
+            A :class:`tuple` containing the :class:`Command` and the :class:`list` of parameters, or :const:`None` if
+            the message doesn't call any command."""
+        return self.commands.parse(text,
+                                   self.Interface.prefix,
+                                   suffix=suffix.lower() if suffix is not None else None,
+                                   prefix_matching=self.prefix_matching)
 
     def init_herald(self, herald_cfg: Dict[str, Any]):
         """Create a :class:`Link` and bind :class:`Event`."""
@@ -248,7 +314,8 @@ class Serf(abc.ABC):
                 log.debug(f"Registering: {SelectedEvent.__qualname__} -> {SelectedEvent.name}")
             self.events[SelectedEvent.name] = event
 
-    async def network_handler(self, message: Union[rh.Request, rh.Broadcast]) -> rh.Response:
+    async def network_handler(self, message: Union[rh.Request, rh.Broadcast]) \
+            -> Union[rh.Response, AsyncIterator[rh.Response]]:
         try:
             event: Event = self.events[message.handler]
         except KeyError:
@@ -257,28 +324,66 @@ class Serf(abc.ABC):
         log.debug(f"Event called: {event.name}")
         if isinstance(message, rh.Request):
             try:
-                response_data = await event.run(**message.data)
+                result = event.run(**message.data)
+                # Events that are asynchronous generators stream their response
+                if inspect.isasyncgen(result):
+                    return rh.stream_chunks(result, lambda e: self.event_failure(message, e))
+                response_data = await result
                 return rh.ResponseSuccess(data=response_data)
-            except CommandError as e:
-                return rh.ResponseFailure("error_in_event",
-                                          f"The event '{message.handler}' raised a {e.__class__.__qualname__}.",
-                                          extra_info={
-                                              "type": e.__class__.__qualname__,
-                                              "message": str(e)
-                                          })
             except Exception as e:
-                ru.sentry_exc(e)
-                return rh.ResponseFailure("unhandled_exception_in_event",
-                                          f"The event '{message.handler}' raised an unhandled"
-                                          f" {e.__class__.__qualname__}.",
-                                          extra_info={
-                                              "type": e.__class__.__qualname__,
-                                              "message": str(e)
-                                          })
+                return self.event_failure(message, e)
         elif isinstance(message, rh.Broadcast):
-            await event.run(**message.data)
+            result = event.run(**message.data)
+            if inspect.isasyncgen(result):
+                async for _ in result:
+                    pass
+            else:
+                await result
+
+    @staticmethod
+    def event_failure(message: rh.Request, e: Exception) -> rh.ResponseFailure:
+        """Create the :class:`royalherald.ResponseFailure` to send when an :class:`Event` raises an exception."""
+        if isinstance(e, CommandError):
+            return rh.ResponseFailure("error_in_event",
+                                      f"The event '{message.handler}' raised a {e.__class__.__qualname__}.",
+                                      extra_info={
+                                          "type": e.__class__.__qualname__,
+                                          "message": str(e)
+                                      })
+        ru.sentry_exc(e)
+        return rh.ResponseFailure("unhandled_exception_in_event",
+                                  f"The event '{message.handler}' raised an unhandled"
+                                  f" {e.__class__.__qualname__}.",
+                                  extra_info={
+                                      "type": e.__class__.__qualname__,
+                                      "message": str(e)
+                                  })
+
+    async def call(self,
+                   command: Command,
+                   data: CommandData,
+                   parameters: List[str],
+                   user: Optional[Hashable] = None,
+                   chat: Optional[Hashable] = None):
+        """Run a command, if the :attr:`.scheduler` allows it, and reply with the errors it raises.
+
+        Parameters:
+            command: The :class:`Command` to run.
+            data: The :class:`CommandData` of the call.
+            parameters: The parameters the command was called with.
+            user: An identifier of the user calling the command, used for rate limiting.
+            chat: An identifier of the chat the command was called in, used for rate limiting."""
+        try:
+            async with self.scheduler.slot(command.name, parameters, user=user, chat=chat):
+                await self.run_command(command, data, parameters)
+        except CommandRejectedError as e:
+            log.info(f"Rejected command: {command.name} ({e.reason})")
+            if e.notify:
+                await data.reply(f"⚠️ {e.message}")
+        finally:
+            await data.session_close()
 
-    async def call(self, command: Command, data: CommandData, parameters: List[str]):
+    async def run_command(self, command: Command, data: CommandData, parameters: List[str]):
         log.info(f"Calling command: {command.name}")
         try:
             # Run the command
@@ -301,8 +406,6 @@ class Serf(abc.ABC):
         except Exception as e:
             ru.sentry_exc(e)
             await data.reply(f"⛔️ [b]{e.__class__.__name__}[/b]\n" + '\n'.join(e.args))
-        finally:
-            await data.session_close()
 
     async def press(self, key: KeyboardKey, data: CommandData):
         log.info(f"Calling key_callback: {repr(key)}")
@@ -333,6 +436,19 @@ class Serf(abc.ABC):
         self.herald_task = self.loop.create_task(self.herald.run())
         # OVERRIDE THIS METHOD!
 
+    async def shutdown(self) -> None:
+        """Stop the Serf gracefully, waiting at most :attr:`.drain_timeout` seconds for the running tasks and the
+        requests received from the Herald to finish."""
+        log.info(f"Stopping: draining {len(self.tasks)} tasks")
+        drains = [self.tasks.drain(self.drain_timeout)]
+        if self.herald is not None:
+            # Cancelling the herald_task would cancel the handlers of the requests that are still running
+            drains.append(self.herald.drain(self.drain_timeout))
+        await aio.gather(*drains, loop=self.loop)
+        if self.herald_task is not None:
+            self.herald_task.cancel()
+        log.info("Stopped")
+
     @classmethod
     def run_process(cls, **kwargs):
         """Blockingly create and run the Serf.
@@ -352,7 +468,18 @@ class Serf(abc.ABC):
 
         serf = cls(loop=loop, **kwargs)
 
+        run_task = serf.loop.create_task(serf.run())
+        try:
+            # Stop receiving updates on SIGTERM, but finish handling the ones that were already received
+            serf.loop.add_signal_handler(signal.SIGTERM, run_task.cancel)
+        except NotImplementedError:
+            log.debug("Signal handlers aren't supported by this event loop")
+
         try:
-            serf.loop.run_until_complete(serf.run())
+            serf.loop.run_until_complete(run_task)
+        except aio.CancelledError:
+            log.info("Received SIGTERM")
         except Exception as e:
             ru.sentry_exc(e, level="fatal")
+        finally:
+            serf.loop.run_until_complete(serf.shutdown())
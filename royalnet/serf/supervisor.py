@@ -0,0 +1,132 @@
+from typing import *
+import asyncio as aio
+import collections
+import logging
+import royalnet.utils as ru
+
+
+log = logging.getLogger(__name__)
+
+
+class TaskMetrics:
+    """Counters about the tasks with the same name started by a :class:`TaskSupervisor`."""
+
+    def __init__(self):
+        self.started: int = 0
+        self.finished: int = 0
+        self.failed: int = 0
+        """The number of tasks that raised an exception."""
+        self.cancelled: int = 0
+        self.duration_sum: float = 0.0
+        """The sum of the seconds the ended tasks ran for."""
+        self.duration_max: float = 0.0
+
+    def observe(self, duration: float) -> None:
+        self.duration_sum += duration
+        self.duration_max = max(self.duration_max, duration)
+
+    def to_dict(self) -> Dict[str, Any]:
+        ended = self.finished + self.failed + self.cancelled
+        return {
+            "started": self.started,
+            "finished": self.finished,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "duration_mean": self.duration_sum / ended if ended else None,
+            "duration_max": self.duration_max,
+        }
+
+
+class TaskSupervisor:
+    """Own the tasks started to handle the updates received by a :class:`Serf`.
+
+    It keeps a reference to every running task, so that they can't be garbage-collected, reports the exceptions
+    they raise to Sentry, and allows waiting for them to finish before stopping."""
+
+    def __init__(self, loop: aio.AbstractEventLoop = None):
+        if loop is None:
+            self.loop = aio.get_event_loop()
+        else:
+            self.loop = loop
+        self._tasks: Dict[aio.Task, Tuple[str, float]] = {}
+        """The running tasks, with their name and the time they were started at."""
+        self.closing: bool = False
+        """Is the supervisor draining its tasks? If it is, no more tasks can be started."""
+        self.metrics: DefaultDict[str, TaskMetrics] = collections.defaultdict(TaskMetrics)
+        """The :class:`TaskMetrics` of the tasks, indexed by their name."""
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {len(self)} running{', closing' if self.closing else ''}>"
+
+    def live(self, name: Optional[str] = None) -> int:
+        """The number of running tasks, or of the running tasks with a name."""
+        if name is None:
+            return len(self._tasks)
+        return sum(1 for task_name, _ in self._tasks.values() if task_name == name)
+
+    def oldest(self) -> Optional[float]:
+        """The number of seconds the oldest running task has been running for, or :const:`None` if there are none."""
+        if not self._tasks:
+            return None
+        return self.loop.time() - min(start for _, start in self._tasks.values())
+
+    def spawn(self, coroutine: Coroutine, name: str) -> Optional[aio.Task]:
+        """Run a coroutine in a new task owned by the supervisor.
+
+        Parameters:
+            coroutine: The coroutine to run.
+            name: The name of the kind of task, used in the metrics and in the logs, such as ``"handle_update"``.
+
+        Returns:
+            The started :class:`asyncio.Task`, or :const:`None` if the supervisor is closing and the coroutine was
+            discarded."""
+        if self.closing:
+            log.warning(f"Discarding {name}: the supervisor is closing")
+            coroutine.close()
+            return None
+        task = self.loop.create_task(coroutine)
+        self._tasks[task] = (name, self.loop.time())
+        self.metrics[name].started += 1
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: aio.Task) -> None:
+        name, start = self._tasks.pop(task)
+        metrics = self.metrics[name]
+        metrics.observe(self.loop.time() - start)
+        if task.cancelled():
+            metrics.cancelled += 1
+            return
+        exc = task.exception()
+        if exc is None:
+            metrics.finished += 1
+            return
+        metrics.failed += 1
+        log.error(f"Unhandled {exc.__class__.__qualname__} in {name}", exc_info=exc)
+        ru.sentry_exc(exc)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "live": self.live(),
+            "oldest": self.oldest(),
+            "tasks": {name: {"live": self.live(name), **metrics.to_dict()} for name, metrics in self.metrics.items()},
+        }
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting new tasks and wait for the running ones to finish, cancelling those that are still running
+        after ``timeout`` seconds."""
+        self.closing = True
+        if not self._tasks:
+            return
+        log.info(f"Waiting for {len(self._tasks)} tasks to finish...")
+        done, pending = await aio.wait(list(self._tasks), timeout=timeout)
+        if not pending:
+            return
+        log.warning(f"Cancelling {len(pending)} tasks still running after {timeout:g} s")
+        for task in pending:
+            task.cancel()
+        # Give the cancelled tasks a chance to clean up, but don't wait forever for those ignoring the cancellation
+        await aio.wait(pending, timeout=5.0)
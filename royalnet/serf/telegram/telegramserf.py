@@ -130,11 +130,7 @@ class TelegramSerf(Serf):
                     if error_if_none:
                         raise rc.CommandError("No command caller for this message")
                     return None
-                query = data.session.query(self.master_table)
-                for link in self.identity_chain:
-                    query = query.join(link.mapper.class_)
-                query = query.filter(self.identity_column == user.id)
-                result = await ru.asyncify(query.one_or_none)
+                result = await self.find_author(data.session, user.id)
                 if result is None and error_if_none:
                     raise rc.CommandError("Command caller is not registered")
                 return result
@@ -187,11 +183,7 @@ class TelegramSerf(Serf):
                     if error_if_none:
                         raise rc.CommandError("No command caller for this message")
                     return None
-                query = data.session.query(self.master_table)
-                for link in self.identity_chain:
-                    query = query.join(link.mapper.class_)
-                query = query.filter(self.identity_column == user.id)
-                result = await ru.asyncify(query.one_or_none)
+                result = await self.find_author(data.session, user.id)
                 if result is None and error_if_none:
                     raise rc.CommandError("Command caller is not registered")
                 return result
@@ -235,24 +227,19 @@ class TelegramSerf(Serf):
         # No text or caption, ignore the message
         if text is None:
             return
-        # Skip non-command updates
-        if not text.startswith("/"):
-            return
-        # Find and clean parameters
-        command_text, *parameters = text.split(" ")
-        command_name = command_text.replace(f"@{self.client.username}", "").lower()
-        # Find the command
-        try:
-            command = self.commands[command_name]
-        except KeyError:
-            # Skip the message
+        # Find the command and its parameters, skipping non-command updates
+        found = self.find_command(text, suffix=f"@{self.client.username}")
+        if found is None:
             return
+        command, parameters = found
         # Send a typing notification
         await self.api_call(message.chat.send_action, telegram.ChatAction.TYPING)
         # Prepare data
         data = self.MessageData(interface=command.interface, loop=self.loop, message=message)
         # Call the command
-        await self.call(command, data, parameters)
+        await self.call(command, data, parameters,
+                        user=message.from_user.id if message.from_user is not None else None,
+                        chat=message.chat.id)
 
     async def handle_callback_query(self, cbq: telegram.CallbackQuery):
         uid = cbq.data
@@ -278,9 +265,7 @@ class TelegramSerf(Serf):
                                                                       read_latency=5.0)
             # Handle updates
             for update in last_updates:
-                # TODO: don't lose the reference to the task
-                # noinspection PyAsyncCall
-                self.loop.create_task(self.handle_update(update))
+                self.tasks.spawn(self.handle_update(update), "handle_update")
             # Recalculate offset
             try:
                 self.update_offset = last_updates[-1].update_id + 1
@@ -7,6 +7,8 @@ from .sentry import init_sentry, sentry_exc, sentry_wrap, sentry_async_wrap
 from .log import init_logging
 from .royaltyping import JSON
 from .strip_tabs import strip_tabs
+from .import_packs import import_packs
+from .lrucache import LRUCache
 
 __all__ = [
     "asyncify",
@@ -26,4 +28,6 @@ __all__ = [
     "init_logging",
     "JSON",
     "strip_tabs",
+    "import_packs",
+    "LRUCache",
 ]
@@ -0,0 +1,53 @@
+from typing import *
+import importlib
+import logging
+import sys
+import time
+import traceback
+import types
+
+
+log = logging.getLogger(__name__)
+
+
+def import_packs(pack_names: List[str],
+                 submodules: Iterable[str],
+                 warning_time: Optional[float] = None) -> Dict[str, Dict[str, types.ModuleType]]:
+    """Import only the passed submodules of every pack, and log how long each of them took to import.
+
+    A pack is skipped if any of its submodules can't be imported.
+
+    Parameters:
+        pack_names: The Python package names of the packs to import.
+        submodules: The names of the submodules to import from every pack, such as ``"commands"`` or ``"tables"``.
+        warning_time: If a pack takes more seconds than this to import, log a warning instead of the usual report.
+
+    Returns:
+        A :class:`dict` connecting each successfully imported pack name to a :class:`dict` of its submodules."""
+    submodules = list(submodules)
+    packs = {}
+    total = 0.0
+    for pack_name in pack_names:
+        log.debug(f"Importing pack: {pack_name}")
+        modules = {}
+        times = {}
+        try:
+            for submodule in submodules:
+                start = time.perf_counter()
+                modules[submodule] = importlib.import_module(f"{pack_name}.{submodule}")
+                times[submodule] = time.perf_counter() - start
+        except ImportError as e:
+            log.error(f"{e.__class__.__name__} during the import of {pack_name}:\n"
+                      f"{''.join(traceback.format_exception(*sys.exc_info()))}")
+            continue
+        packs[pack_name] = modules
+        # The first submodule also includes the time spent importing the pack itself
+        pack_time = sum(times.values())
+        total += pack_time
+        report = ", ".join(f"{submodule} {seconds * 1000:.1f} ms" for submodule, seconds in times.items())
+        if warning_time is not None and pack_time > warning_time:
+            log.warning(f"Pack {pack_name} took {pack_time:.3f} s to import, more than {warning_time:g} s: {report}")
+        else:
+            log.info(f"Pack {pack_name} imported in {pack_time * 1000:.1f} ms: {report}")
+    log.info(f"Packs: {len(packs)} imported in {total * 1000:.1f} ms")
+    return packs
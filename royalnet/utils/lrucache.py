@@ -0,0 +1,61 @@
+from typing import *
+import collections
+import time
+
+
+class LRUCache:
+    """A cache that keeps only the most recently used items, and forgets every item some time after it was added.
+
+    It isn't thread-safe: use it only from the thread running the event loop."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize: int = maxsize
+        """The maximum number of items in the cache; the least recently used one is discarded to add more."""
+        self.ttl: Optional[float] = ttl
+        """The number of seconds after which an item is forgotten, or :const:`None` to keep the items forever."""
+        self._items: "collections.OrderedDict[Hashable, Tuple[float, Any]]" = collections.OrderedDict()
+        self.hits: int = 0
+        """The number of :meth:`.get` calls that found the item in the cache."""
+        self.misses: int = 0
+        """The number of :meth:`.get` calls that didn't find the item in the cache."""
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__} {len(self)}/{self.maxsize}, {self.hits} hits, {self.misses} misses>"
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an item from the cache, marking it as the most recently used.
+
+        Returns:
+            The item, or the ``default`` if it isn't in the cache or it has expired."""
+        try:
+            added, value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if self.ttl is not None and time.monotonic() - added > self.ttl:
+            del self._items[key]
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Add an item to the cache, replacing the previous one with the same key."""
+        self._items[key] = (time.monotonic(), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove an item from the cache, if it is there."""
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all the items from the cache."""
+        self._items.clear()